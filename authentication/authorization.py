@@ -0,0 +1,71 @@
+import functools
+
+from rest_framework import status
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.response import Response
+
+from . import jsonwebtokens
+
+
+class TokenUser:
+    """
+    Stand-in for `request.user`, holds the verified claims of the JWT
+    """
+
+    is_authenticated = True
+
+    def __init__(self, claims):
+        self.claims = claims
+
+
+class JWTAuthentication(BaseAuthentication):
+    """
+    Decodes "Authorization: Bearer <JWT>" once per request
+    - request.auth: claims of the token (None without a valid token)
+    - never rejects on its own, views decide through `authorize`/`role_required`
+    """
+
+    def authenticate(self, request):
+        token = request.headers.get("Authorization", "").partition(" ")[2]
+        if not token:
+            return None
+        claims, error = jsonwebtokens.decode(token)
+        if error:
+            request.jwt_error = error
+            return None
+        return TokenUser(claims), claims
+
+    def authenticate_header(self, request):
+        return "Bearer"
+
+
+def authorize(request, permitted_roles=None):
+    """
+    Claims of the request's JWT if its role is permitted
+    - returns claims and error like `jsonwebtokens.is_authorized`
+    """
+    claims = request.auth
+    if claims is None:
+        return None, getattr(request, "jwt_error", "Authorization token missing")
+    if permitted_roles and claims.get("role") not in permitted_roles:
+        return None, "You are unauthorized"
+    return claims, None
+
+
+def role_required(*permitted_roles):
+    """
+    Rejects the request with 401 UNAUTHORIZED unless the JWT has one of the
+    roles, use below `@api_view`/`@permission_classes`
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            claims, error = authorize(request, set(permitted_roles))
+            if error:
+                return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
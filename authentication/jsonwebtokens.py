@@ -1,27 +1,43 @@
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
+import hashlib
 import os
+import threading
+import time
 
 key = os.getenv("JWT_KEY")
 
+# Claims of verified tokens keyed by the token's sha256, so that a token is
+# only verified once per process until it expires
+VERIFIED_TOKENS_SIZE = 4096
+verified_tokens = OrderedDict()
+verified_tokens_lock = threading.Lock()
 
-def create_jwt(role, phonenumber, name):
+
+def create_jwt(role, phonenumber, name, user_id=None):
+    """
+    "sub" holds the user's id so that views can fetch the user by primary key
+    - tokens issued before "sub" existed are still accepted
+    """
     ist_tz = timezone(timedelta(hours=5, minutes=30))
-    encoded = jwt.encode(
-        {
-            "role": role,
-            "phonenumber": phonenumber,
-            "name": name,
-            "iat": datetime.now(tz=ist_tz),
-            "exp": datetime.now(tz=ist_tz) + timedelta(days=7),
-        },
-        key,
-        algorithm="HS256",
-    )
+    claims = {
+        "role": role,
+        "phonenumber": phonenumber,
+        "name": name,
+        "iat": datetime.now(tz=ist_tz),
+        "exp": datetime.now(tz=ist_tz) + timedelta(days=7),
+    }
+    if user_id:
+        claims["sub"] = str(user_id)
+    encoded = jwt.encode(claims, key, algorithm="HS256")
     return encoded
 
 
-def is_authorized(token, permitted_roles=None):
+def verify(token):
+    """
+    Decode and verify the token's signature and claims, no caching
+    """
     try:
         payload = jwt.decode(
             token,
@@ -35,8 +51,36 @@ def is_authorized(token, permitted_roles=None):
         return None, "JWT is missing required claims"
     except jwt.DecodeError:
         return None, "Invalid JWT"
+    return payload, None
+
+
+def decode(token):
+    """
+    Same as `verify` but remembers verified tokens until their "exp"
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    with verified_tokens_lock:
+        payload = verified_tokens.get(digest)
+        if payload and payload["exp"] > time.time():
+            verified_tokens.move_to_end(digest)
+            return payload, None
+
+    payload, error = verify(token)
+    if error:
+        return None, error
+    with verified_tokens_lock:
+        verified_tokens[digest] = payload
+        if len(verified_tokens) > VERIFIED_TOKENS_SIZE:
+            verified_tokens.popitem(last=False)
+    return payload, None
+
+
+def is_authorized(token, permitted_roles=None):
+    payload, error = decode(token)
+    if error:
+        return None, error
+
     if permitted_roles:
         if payload.get("role") not in permitted_roles:
             return None, "You are unauthorized"
-
     return payload, None
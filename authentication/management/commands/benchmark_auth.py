@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from authentication import jsonwebtokens
+from authentication.authorization import JWTAuthentication, authorize
+
+
+class Command(BaseCommand):
+    help = "Per-request cost of JWT authentication, before and after memoization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20_000)
+
+    def handle(self, *args, **kwargs):
+        count = kwargs["requests"]
+        token = jsonwebtokens.create_jwt(
+            role="dentist", phonenumber=9999999999, name="Benchmark"
+        )
+        django_request = RequestFactory().get(
+            "/p/", headers={"Authorization": f"Bearer {token}"}
+        )
+
+        def per_view_decoding():
+            # What every view did: split the header and verify the JWT, twice
+            # in some views (eg: patients())
+            for _ in range(2):
+                token = django_request.headers["Authorization"].split(" ")[1]
+                jsonwebtokens.verify(token)
+
+        def authentication_class():
+            request = Request(django_request, authenticators=[JWTAuthentication()])
+            authorize(request, {"dentist", "admin"})
+
+        for label, run in (
+            ("decode in every view (x2)", per_view_decoding),
+            ("JWTAuthentication + cache", authentication_class),
+        ):
+            start = time.perf_counter()
+            for _ in range(count):
+                run()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:>26}: {elapsed / count * 1_000_000:.1f} µs per request"
+            )
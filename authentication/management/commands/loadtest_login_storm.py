@@ -0,0 +1,105 @@
+import collections
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+
+from authentication import jsonwebtokens, models, passwords
+
+STORM_PHONE_START = 6099999000
+STORM_PASSWORD = "Storm1password"
+
+
+def p95(samples):
+    return statistics.quantiles(samples, n=20)[-1] * 1000
+
+
+class Command(BaseCommand):
+    help = "Dashboard latency before and during a storm of logins"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--login-threads", type=int, default=16)
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--duration", type=float, default=10, help="seconds")
+
+    def handle(self, *args, **kwargs):
+        stored_password = passwords.hash_password(STORM_PASSWORD)
+        models.User.objects.bulk_create(
+            [
+                models.User(
+                    name=f"Storm User {index}",
+                    search_name=f"storm user {index}",
+                    phonenumber=STORM_PHONE_START + index,
+                    password=stored_password,
+                )
+                for index in range(kwargs["users"])
+            ],
+            ignore_conflicts=True,
+        )
+        dashboard_headers = {
+            "Authorization": "Bearer "
+            + jsonwebtokens.create_jwt(
+                role="admin", phonenumber=STORM_PHONE_START, name="Storm Admin"
+            ),
+            "Accept": "application/json",
+        }
+
+        def dashboard(samples, stop):
+            client = Client(SERVER_NAME="localhost")
+            while not stop.is_set():
+                start = time.perf_counter()
+                client.get("/p/complaints/", headers=dashboard_headers)
+                samples.append(time.perf_counter() - start)
+                time.sleep(0.02)
+            connections.close_all()
+
+        def storm(statuses, stop):
+            client = Client(SERVER_NAME="localhost")
+            rng = random.Random()
+            while not stop.is_set():
+                index = rng.randrange(kwargs["users"])
+                response = client.post(
+                    "/auth/login/",
+                    {
+                        "phonenumber": STORM_PHONE_START + index,
+                        "name": f"Storm User {index}",
+                        "password": STORM_PASSWORD,
+                    },
+                    content_type="application/json",
+                    headers={"Accept": "application/json"},
+                )
+                statuses[response.status_code] += 1
+            connections.close_all()
+
+        def run(with_storm):
+            samples, statuses, stop = [], collections.Counter(), threading.Event()
+            threads = [threading.Thread(target=dashboard, args=(samples, stop))]
+            if with_storm:
+                threads += [
+                    threading.Thread(target=storm, args=(statuses, stop))
+                    for _ in range(kwargs["login_threads"])
+                ]
+            for thread in threads:
+                thread.start()
+            time.sleep(kwargs["duration"])
+            stop.set()
+            for thread in threads:
+                thread.join()
+            return samples, statuses
+
+        try:
+            quiet, _ = run(with_storm=False)
+            stormy, statuses = run(with_storm=True)
+        finally:
+            models.User.objects.filter(
+                phonenumber__gte=STORM_PHONE_START,
+                phonenumber__lt=STORM_PHONE_START + kwargs["users"],
+            ).delete()
+
+        self.stdout.write(f"dashboard p95 without logins: {p95(quiet):.1f} ms")
+        self.stdout.write(f"dashboard p95 during storm:   {p95(stormy):.1f} ms")
+        self.stdout.write(f"login responses: {dict(statuses)}")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from authentication import models
+
+
+class Command(BaseCommand):
+    help = "Fill credentials.search_name for users saved before it existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs["batch_size"]
+        users = models.User.objects.filter(search_name="").only("id", "name")
+        batch, updated = [], 0
+        for user in users.iterator(chunk_size=batch_size):
+            user.search_name = models.normalize_name(user.name)
+            batch.append(user)
+            if len(batch) == batch_size:
+                updated += models.User.objects.bulk_update(batch, ["search_name"])
+                batch = []
+        if batch:
+            updated += models.User.objects.bulk_update(batch, ["search_name"])
+        self.stdout.write(self.style.SUCCESS(f"Normalized {updated} names"))
@@ -0,0 +1,48 @@
+import statistics
+import time
+
+import bcrypt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Time bcrypt costs on this machine and recommend one for a login budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-ms", type=float, default=250, help="time budget for a hash"
+        )
+        parser.add_argument("--min-rounds", type=int, default=10)
+        parser.add_argument("--max-rounds", type=int, default=15)
+        parser.add_argument("--samples", type=int, default=5)
+
+    def handle(self, *args, **kwargs):
+        password = b"A1plain_text_password"
+        recommended = None
+        for rounds in range(kwargs["min_rounds"], kwargs["max_rounds"] + 1):
+            stored_password = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+            durations = []
+            for _ in range(kwargs["samples"]):
+                start = time.perf_counter()
+                bcrypt.checkpw(password, stored_password)
+                durations.append((time.perf_counter() - start) * 1000)
+            median = statistics.median(durations)
+            self.stdout.write(f"cost {rounds:>2}: {median:>8.1f} ms")
+            if median > kwargs["target_ms"]:
+                break
+            recommended = rounds
+
+        if recommended is None:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Even cost {kwargs['min_rounds']} is over {kwargs['target_ms']} ms"
+                )
+            )
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Set PASSWORD_HASHING_ROUNDS={recommended} "
+                f"(currently {settings.PASSWORD_HASHING_ROUNDS})"
+            )
+        )
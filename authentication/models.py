@@ -1,13 +1,22 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 # Create your models here.
-import uuid
+from dentistAPI.ids import uuid7
 
 
 # ==============================NOTE====================================
 # Foreign key names are getting an added "_id" at the end of their names
 
 
+def normalize_name(name):
+    """
+    Casefold and collapse whitespace so that "  john   DOE" == "john doe"
+    - this is what `User.search_name` stores and what searches compare against
+    """
+    return " ".join(name.split()).casefold()
+
+
 class User(models.Model):
     """
     id: <UUID> user id
@@ -16,6 +25,7 @@ class User(models.Model):
     phonenumber: <BigInt>
     password: <String>
     active: <Bool>
+    search_name: <String> normalized name, kept in sync on save (for search)
     """
 
     class RoleChoices(models.TextChoices):
@@ -23,7 +33,7 @@ class User(models.Model):
         DOC = "dentist"
         PATIENT = "patient"
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     role = models.CharField(
         max_length=10, choices=RoleChoices.choices, default=RoleChoices.PATIENT
     )
@@ -31,6 +41,8 @@ class User(models.Model):
     phonenumber = models.BigIntegerField()
     password = models.TextField(blank=True)
     active = models.BooleanField(default=True)
+    # Unbounded, casefolding can make it longer than the name ("ß" -> "ss")
+    search_name = models.TextField(default="", editable=False)
 
     class Meta:
         db_table = "credentials"
@@ -39,3 +51,24 @@ class User(models.Model):
                 fields=["name", "phonenumber"], name="unique_phone+name"
             )
         ]
+        indexes = [
+            # The unique constraint leads with name, so lookups and range scans
+            # by phonenumber alone need their own index
+            models.Index(fields=["phonenumber", "id"], name="credentials_phone_idx"),
+            # Stable (name, id) order for keyset pagination of patient listings
+            models.Index(fields=["name", "id"], name="credentials_name_idx"),
+            # Trigram index so substring/similarity search on names doesn't
+            # scan the whole table (needs the pg_trgm extension)
+            GinIndex(
+                fields=["search_name"],
+                name="credentials_search_name_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_name(self.name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "name" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "search_name"}
+        super().save(*args, **kwargs)
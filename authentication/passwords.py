@@ -0,0 +1,73 @@
+"""
+bcrypt runs on a small pool of its own (it releases the GIL while hashing)
+so a burst of logins can't pin every request thread on CPU. When the pool
+and its queue are full callers get `HasherBusy` right away instead of
+waiting in line.
+
+Every hash gets its own salt, bcrypt stores it along with the cost in the
+hash itself ("$2b$<cost>$<salt><hash>"), so changing PASSWORD_HASHING_ROUNDS
+only affects new hashes and old ones are upgraded on login.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+import bcrypt
+import threading
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix="bcrypt"
+)
+# Hashes running + waiting, anything beyond is turned away
+slots = threading.BoundedSemaphore(
+    settings.PASSWORD_HASHING_WORKERS + settings.PASSWORD_HASHING_QUEUE
+)
+
+
+class HasherBusy(Exception):
+    """
+    Too many passwords are already being hashed, try again shortly
+    """
+
+
+def run(function, *args):
+    if not slots.acquire(blocking=False):
+        raise HasherBusy()
+    try:
+        future = executor.submit(function, *args)
+    except RuntimeError:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=settings.PASSWORD_HASHING_TIMEOUT)
+    except TimeoutError:
+        raise HasherBusy()
+
+
+def hash_password(password, rounds=None):
+    """
+    Hash to store for a plain text password, with a fresh salt
+    """
+    salt = bcrypt.gensalt(rounds or settings.PASSWORD_HASHING_ROUNDS)
+    hashed_password: bytes = run(bcrypt.hashpw, bytes(password, "utf-8"), salt)
+    return hashed_password.decode("utf-8")
+
+
+def hash_rounds(stored_password):
+    """
+    Cost the stored hash was made with
+    """
+    return int(stored_password.split("$")[2])
+
+
+def needs_rehash(stored_password):
+    return hash_rounds(stored_password) != settings.PASSWORD_HASHING_ROUNDS
+
+
+def check_password(password, stored_password):
+    """
+    Whether the plain text password matches the stored hash
+    """
+    return run(
+        bcrypt.checkpw, bytes(password, "utf-8"), bytes(stored_password, "utf-8")
+    )
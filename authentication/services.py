@@ -1,6 +1,89 @@
 from . import models
 from . import validation
+from collections import OrderedDict
+from django.db import IntegrityError
+from django.db.models import Case, Value, When
 from rest_framework import status
+import threading
+import time
+
+# Users (with details) resolved from tokens, kept per process for a short
+# while and dropped as soon as the user or their details are saved
+TOKEN_USERS_TTL = 30
+TOKEN_USERS_SIZE = 1024
+token_users = OrderedDict()
+token_users_lock = threading.Lock()
+
+
+def users_by_phone_and_name(phonenumber, name):
+    """
+    The user on `phonenumber` called `name` (on unique_phone+name or
+    credentials_name_idx, both lead with name), with details
+    """
+    return models.User.objects.select_related("details").filter(
+        phonenumber=phonenumber, name=name
+    )
+
+
+def fetch_token_user(claims):
+    """
+    The `User` a token was issued to, with `details` already joined in
+    1. Token has "sub": primary key lookup, cached for TOKEN_USERS_TTL
+    2. Older token without "sub": lookup by phonenumber + name
+    - returns user and error
+    """
+    user_id = claims.get("sub")
+    if not user_id:
+        try:
+            user = users_by_phone_and_name(
+                claims.get("phonenumber"), claims.get("name")
+            ).get()
+        except models.User.DoesNotExist:
+            return None, "User not found"
+        return user, None
+
+    with token_users_lock:
+        cached = token_users.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            token_users.move_to_end(user_id)
+            return cached[1], None
+    try:
+        user = models.User.objects.select_related("details").get(id=user_id)
+    except models.User.DoesNotExist:
+        return None, "User not found"
+    with token_users_lock:
+        token_users[user_id] = (time.monotonic() + TOKEN_USERS_TTL, user)
+        if len(token_users) > TOKEN_USERS_SIZE:
+            token_users.popitem(last=False)
+    return user, None
+
+
+def forget_token_user(user_id):
+    with token_users_lock:
+        token_users.pop(str(user_id), None)
+
+
+def fetch_credentials(phonenumber, name):
+    """
+    The user registered on `phonenumber`, preferring the one called `name`,
+    in a single query over the phonenumber index\n
+    1. Phonenumber not registered: returns None
+    2. Registered under another name: returns a user whose `name` differs
+    3. Otherwise returns the user (check `password` for a pending signup)
+    """
+    return credentials_query(phonenumber, name).first()
+
+
+def credentials_query(phonenumber, name):
+    """
+    Users on `phonenumber` (on credentials_phone_idx), the one called `name`
+    first
+    """
+    return (
+        models.User.objects.filter(phonenumber=phonenumber)
+        .annotate(name_matches=Case(When(name=name, then=Value(1)), default=Value(0)))
+        .order_by("-name_matches")
+    )
 
 
 def set_empty_password(userData, role):
@@ -10,11 +93,8 @@ def set_empty_password(userData, role):
     3. doctor can reset patient, admin and doctor's password
     - returns error and status
     """
-    try:
-        user = models.User.objects.get(
-            name=userData.get("name"), phonenumber=userData.get("phonenumber")
-        )
-    except models.User.DoesNotExist:
+    user = fetch_credentials(userData.get("phonenumber"), userData.get("name"))
+    if user is None or user.name != userData.get("name"):
         return "User does not exist", status.HTTP_404_NOT_FOUND
 
     if role == "admin" and (user.role in ["admin", "dentist"]):
@@ -23,7 +103,7 @@ def set_empty_password(userData, role):
             status.HTTP_401_UNAUTHORIZED,
         )
     user.password = ""
-    user.save()
+    user.save(update_fields=["password"])
     return None, None
 
 
@@ -32,6 +112,7 @@ def set_new_phonenumber(userData, role):
     1. Check if user is valid
     2. Admin only reset patient's number
     3. Validate new phonenumber
+    4. Same name already registered on the new phonenumber
     - returns error and status
     """
     new_phone_validate = validation.validate_phonenumber(userData["new_phonenumber"])
@@ -41,11 +122,8 @@ def set_new_phonenumber(userData, role):
             status.HTTP_400_BAD_REQUEST,
         )
 
-    try:
-        user = models.User.objects.get(
-            name=userData.get("name"), phonenumber=userData.get("old_phonenumber")
-        )
-    except models.User.DoesNotExist:
+    user = fetch_credentials(userData.get("old_phonenumber"), userData.get("name"))
+    if user is None or user.name != userData.get("name"):
         return "User does not exist", status.HTTP_404_NOT_FOUND
 
     if role == "admin" and (user.role in ["admin", "dentist"]):
@@ -54,5 +132,11 @@ def set_new_phonenumber(userData, role):
             status.HTTP_401_UNAUTHORIZED,
         )
     user.phonenumber = userData.get("new_phonenumber")
-    user.save()
+    try:
+        user.save(update_fields=["phonenumber"])
+    except IntegrityError:
+        return (
+            "Another user with this name already has the new phonenumber",
+            status.HTTP_409_CONFLICT,
+        )
     return None, None
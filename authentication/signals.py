@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import models, services
+
+
+@receiver(post_save, sender=models.User)
+@receiver(post_delete, sender=models.User)
+def forget_saved_user(sender, instance, **kwargs):
+    services.forget_token_user(instance.id)
+
+
+@receiver(post_save, sender="patient.Details")
+@receiver(post_delete, sender="patient.Details")
+def forget_saved_details(sender, instance, **kwargs):
+    # Details' primary key is the user's id
+    services.forget_token_user(instance.pk)
@@ -1,7 +1,15 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
+from unittest import mock
 from . import models
+from . import passwords
+from . import services
+from .throttling import PhonenumberRateThrottle
+import bcrypt
 import uuid
 
 
@@ -33,3 +41,168 @@ class AuthenticationTests(APITestCase):
         data = {"phonenumber": 89898, "password": "hello", "role": uuid.uuid4()}
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CredentialLookupTests(TestCase):
+    def setUp(self):
+        models.User.objects.create(name="John Doe", phonenumber=7880589921)
+        models.User.objects.create(
+            name="Jane Doe", phonenumber=7880589921, password="hashed"
+        )
+
+    def plan(self, queryset):
+        if connection.vendor == "postgresql":
+            # The table is tiny, make the planner show which index it would use
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def test_lookup_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(services.fetch_credentials(7000000000, "John Doe"))
+        with self.assertNumQueries(1):
+            user = services.fetch_credentials(7880589921, "Jane Doe")
+        self.assertEqual((user.name, user.password), ("Jane Doe", "hashed"))
+        with self.assertNumQueries(1):
+            user = services.fetch_credentials(7880589921, "John Doe")
+        self.assertEqual((user.name, user.password), ("John Doe", ""))
+        with self.assertNumQueries(1):
+            user = services.fetch_credentials(7880589921, "Jim Doe")
+        self.assertNotEqual(user.name, "Jim Doe")
+
+    def test_search_name_of_the_longest_name(self):
+        # Casefolded it is twice as long as the name column allows
+        user = models.User.objects.create(name="ß" * 50, phonenumber=7880589922)
+        user.refresh_from_db()
+        self.assertEqual(user.search_name, "ss" * 50)
+
+    def test_lookups_use_indexes(self):
+        # The queries fetch_credentials and fetch_token_user run
+        plan = self.plan(services.credentials_query(7880589921, "John Doe")[:1])
+        self.assertIn("credentials_phone_idx", plan)
+        plan = self.plan(services.users_by_phone_and_name(7880589921, "John Doe"))
+        # Both indexes lead with name, Postgres picks either on a table this
+        # small. sqlite names the index backing a table constraint itself.
+        self.assertRegex(
+            plan,
+            r"unique_phone\+name|credentials_name_idx|sqlite_autoindex_credentials",
+        )
+
+
+@mock.patch.object(PhonenumberRateThrottle, "THROTTLE_RATES", {"login": "3/min"})
+class LoginThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        models.User.objects.create(
+            name="John Doe",
+            phonenumber=7880589921,
+            password=passwords.hash_password("A1secret", rounds=4),
+        )
+        self.url = reverse("login")
+
+    def login(self, phonenumber, password="wrong"):
+        return self.client.post(
+            self.url,
+            {"phonenumber": phonenumber, "name": "John Doe", "password": password},
+            format="json",
+        )
+
+    def test_attempts_are_limited_per_phonenumber(self):
+        """
+        1. Attempts count against the number whichever way it is spelt
+        2. Once over the rate: 429 with Retry-After, even with the right password
+        3. Other numbers aren't affected
+        4. Bodies that aren't an object are a 400, not counted
+        """
+        # 1. spellings
+        for phonenumber in ("7880589921", 7880589921, " 7880589921"):
+            self.assertEqual(
+                self.login(phonenumber).status_code, status.HTTP_409_CONFLICT
+            )
+
+        # 2. over the rate
+        response = self.login(7880589921, "A1secret")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response.headers)
+
+        # 3. other numbers
+        self.assertEqual(self.login(7880589922).status_code, status.HTTP_404_NOT_FOUND)
+
+        # 4. not an object
+        for body in ([1], "7880589921"):
+            response = self.client.post(self.url, body, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_busy_hasher(self):
+        with mock.patch.object(
+            passwords, "check_password", side_effect=passwords.HasherBusy
+        ):
+            response = self.login(7880589921, "A1secret")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+
+@override_settings(PASSWORD_HASHING_ROUNDS=5)
+class PasswordRehashTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def login(self, password="A1secret"):
+        return self.client.post(
+            reverse("login"),
+            {"phonenumber": 7880589921, "name": "John Doe", "password": password},
+            format="json",
+        )
+
+    def test_login_upgrades_the_cost(self):
+        """
+        1. A wrong password leaves the stored hash alone
+        2. Logging in replaces a hash made with another cost, same password
+        3. One made with the current cost is kept
+        4. Every hash gets a salt of its own
+        """
+        user = models.User.objects.create(
+            name="John Doe",
+            phonenumber=7880589921,
+            password=passwords.hash_password("A1secret", rounds=4),
+        )
+        old_hash = user.password
+
+        # 1. wrong password
+        self.assertEqual(self.login("wrong").status_code, status.HTTP_409_CONFLICT)
+        user.refresh_from_db()
+        self.assertEqual(user.password, old_hash)
+
+        # 2. rehashed
+        self.assertEqual(self.login().status_code, status.HTTP_201_CREATED)
+        user.refresh_from_db()
+        self.assertEqual(passwords.hash_rounds(user.password), 5)
+        self.assertTrue(passwords.check_password("A1secret", user.password))
+
+        # 3. kept
+        new_hash = user.password
+        self.assertEqual(self.login().status_code, status.HTTP_201_CREATED)
+        user.refresh_from_db()
+        self.assertEqual(user.password, new_hash)
+
+        # 4. salts ("$2b$<cost>$" then 22 characters of salt)
+        salts = {passwords.hash_password("A1secret", rounds=4)[:29] for _ in range(3)}
+        self.assertEqual(len(salts), 3)
+
+    def test_hashes_made_with_the_global_salt(self):
+        """
+        Hashes from before per-user salts, all made with the one SALT setting,
+        still check and get a salt of their own on login
+        """
+        salt = bcrypt.gensalt(4)
+        old_hash = bcrypt.hashpw(b"A1secret", salt).decode("utf-8")
+        self.assertTrue(passwords.check_password("A1secret", old_hash))
+        self.assertFalse(passwords.check_password("B2secret", old_hash))
+
+        user = models.User.objects.create(
+            name="John Doe", phonenumber=7880589921, password=old_hash
+        )
+        self.assertEqual(self.login().status_code, status.HTTP_201_CREATED)
+        user.refresh_from_db()
+        self.assertFalse(user.password.startswith(salt.decode("utf-8")))
+        self.assertTrue(passwords.check_password("A1secret", user.password))
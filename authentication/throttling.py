@@ -0,0 +1,27 @@
+from collections.abc import Mapping
+from rest_framework import serializers
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class PhonenumberRateThrottle(SimpleRateThrottle):
+    """
+    Limits password attempts per phonenumber (rate under "login" in
+    DEFAULT_THROTTLE_RATES), answers 429 TOO MANY REQUESTS with Retry-After
+
+    Keyed on the phonenumber as the serializer reads it, so "7880589921",
+    " 7880589921" and 7880589921 share one bucket. Bodies without a usable
+    phonenumber aren't throttled here, the view answers them 400.
+    """
+
+    scope = "login"
+
+    def get_cache_key(self, request, view):
+        if not isinstance(request.data, Mapping):
+            return None
+        try:
+            phonenumber = serializers.IntegerField().to_internal_value(
+                request.data.get("phonenumber")
+            )
+        except serializers.ValidationError:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": phonenumber}
@@ -1,23 +1,29 @@
 from authentication.serializers import CredentialSerializer
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework import permissions
 from rest_framework import status
-from . import models
 from . import validation
 from . import services
 from . import serializers
 from . import jsonwebtokens
+from . import passwords
+from .authorization import role_required
+from .throttling import PhonenumberRateThrottle
 from patient import services as patient_services
-import bcrypt
-import os
 
-SALT = os.getenv("SALT")
-SALT_BYTES = bytes(SALT, "utf-8")
+
+def hasher_busy_response():
+    return Response(
+        {"error": "Too many logins right now, try again in a moment"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
 
 
 @api_view(["POST"])
 @permission_classes((permissions.AllowAny,))
+@throttle_classes((PhonenumberRateThrottle,))
 def signup(request):
     # TODO: Add password validation here aklfja;fajfklj
     """
@@ -28,6 +34,8 @@ def signup(request):
     4. Already registered: 409 CONFLICT
     5. Password validation fail: 400 BAD REQUEST
     6. Successful registration: 201 CREATED
+    7. Too many attempts for this phonenumber: 429 TOO MANY REQUESTS
+    8. Too many passwords being hashed right now: 503 SERVICE UNAVAILABLE
 
     Flow:\n
     - Admin first creates a `User` object in database and keeps password field empty
@@ -62,12 +70,11 @@ def signup(request):
             )
 
         # Case 3
-        try:
-            user_object = models.User.objects.get(
-                phonenumber=serializer.data["phonenumber"],
-                name=patient_services.capitalize_name(serializer.data["name"]),
-            )
-        except models.User.DoesNotExist:
+        name = patient_services.capitalize_name(serializer.data["name"])
+        user_object = services.fetch_credentials(
+            serializer.data["phonenumber"], name
+        )
+        if user_object is None or user_object.name != name:
             return Response(
                 {"error": "User is not registered by admin"},
                 status=status.HTTP_404_NOT_FOUND,
@@ -91,11 +98,14 @@ def signup(request):
             )
 
         # Case 6
-        bytes_password: bytes = bytes(serializer.data["password"], "utf-8")
-        hashed_password: bytes = bcrypt.hashpw(bytes_password, SALT_BYTES)
-        password_to_store: str = hashed_password.decode("utf-8")
+        try:
+            password_to_store: str = passwords.hash_password(
+                serializer.data["password"]
+            )
+        except passwords.HasherBusy:
+            return hasher_busy_response()
         user_object.password = password_to_store
-        user_object.save()
+        user_object.save(update_fields=["password"])
         return Response(
             {"message": "Signup successful!"},
             status=status.HTTP_201_CREATED,
@@ -104,6 +114,7 @@ def signup(request):
 
 @api_view(["POST"])
 @permission_classes((permissions.AllowAny,))
+@throttle_classes((PhonenumberRateThrottle,))
 def login(request):
     """
     Allows the user to login to their account\n
@@ -113,6 +124,8 @@ def login(request):
     4. Registered but first signup pending: returns 409 CONFLICT
     5. Incorrect credentials: returns 409 CONFLICT
     6. Correct credentials: returns 200 OK
+    7. Too many attempts for this phonenumber: 429 TOO MANY REQUESTS
+    8. Too many passwords being checked right now: 503 SERVICE UNAVAILABLE
 
     Expected JSON:\n
     `{
@@ -139,22 +152,16 @@ def login(request):
             )
 
         # Case 3
-        probe_users = models.User.objects.filter(
-            phonenumber=serializer.data["phonenumber"]
-        )
-        if not probe_users:
+        name = patient_services.capitalize_name(serializer.data["name"])
+        stored_user = services.fetch_credentials(serializer.data["phonenumber"], name)
+        if stored_user is None:
             return Response(
                 {"error": "Phonenumber isn't registered by admin"},
                 status=status.HTTP_404_NOT_FOUND,
             )
 
         # Case 4
-        try:
-            stored_user = models.User.objects.get(
-                phonenumber=serializer.data["phonenumber"],
-                name=patient_services.capitalize_name(serializer.data["name"]),
-            )
-        except models.User.DoesNotExist:
+        if stored_user.name != name:
             return Response(
                 {"error": "Phonenumber not registered with this name. Register again."},
                 status=status.HTTP_404_NOT_FOUND,
@@ -166,18 +173,31 @@ def login(request):
             )
 
         # Case 5
-        password: bytes = bytes(serializer.data["password"], "utf-8")
-        hashed_password: bytes = bytes(stored_user.password, "utf-8")
-
-        if not bcrypt.checkpw(password, hashed_password):
+        try:
+            is_correct_password = passwords.check_password(
+                serializer.data["password"], stored_user.password
+            )
+        except passwords.HasherBusy:
+            return hasher_busy_response()
+        if not is_correct_password:
             return Response(
                 {"error": "Incorrect password"}, status=status.HTTP_409_CONFLICT
             )
+        # Upgrade hashes made with an older cost, fine to skip when busy
+        if passwords.needs_rehash(stored_user.password):
+            try:
+                stored_user.password = passwords.hash_password(
+                    serializer.data["password"]
+                )
+                stored_user.save(update_fields=["password"])
+            except passwords.HasherBusy:
+                pass
         # Case 6
         jwt = jsonwebtokens.create_jwt(
             role=stored_user.role,
             phonenumber=serializer.data["phonenumber"],
-            name=patient_services.capitalize_name(serializer.data["name"]),
+            name=name,
+            user_id=stored_user.id,
         )
 
         return Response({"token": jwt}, status=status.HTTP_201_CREATED)
@@ -185,6 +205,7 @@ def login(request):
 
 @api_view(["POST"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist", "admin")
 def password_reprompt(request):
     """
     In case patient forgets their password, admin and doctor can reset their password
@@ -196,15 +217,6 @@ def password_reprompt(request):
         "phoenumber": "7777777777",
     }
     """
-    # JWT authentication
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["dentist", "admin"])
-    )
-    if error:
-        return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
-        )
     if request.method == "POST":
         serialized_data, error = patient_services.serialize_identity(request.data)
         if error:
@@ -213,7 +225,7 @@ def password_reprompt(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         error, status_code = services.set_empty_password(
-            serialized_data, token.get("role")
+            serialized_data, request.auth.get("role")
         )
         if error:
             return Response(
@@ -229,16 +241,8 @@ def password_reprompt(request):
 
 @api_view(["POST"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist", "admin")
 def change_phonenumber(request):
-    # JWT authentication
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["dentist", "admin"])
-    )
-    if error:
-        return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
-        )
     if request.method == "POST":
         phone_reset_serializer = serializers.PhoneResetSerializer(data=request.data)
         if not phone_reset_serializer.is_valid():
@@ -247,7 +251,7 @@ def change_phonenumber(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         error, status_code = services.set_new_phonenumber(
-            phone_reset_serializer.data, token.get("role")
+            phone_reset_serializer.data, request.auth.get("role")
         )
         if error:
             return Response(
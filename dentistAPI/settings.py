@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+from celery.schedules import crontab
 from pathlib import Path
 from dotenv import load_dotenv
 import os
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_celery_beat",
     "rest_framework",
     "authentication",
@@ -74,8 +76,62 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly"
     ],
+    # Decodes the JWT once per request, views check roles with
+    # authentication.authorization.authorize/role_required
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "authentication.authorization.JWTAuthentication",
+    ],
+    # Password attempts per phonenumber (login/signup)
+    "DEFAULT_THROTTLE_RATES": {
+        "login": os.getenv("LOGIN_THROTTLE_RATE", "10/min"),
+    },
+}
+
+# Per process by default, set CACHE_TABLE (and run `python manage.py
+# createcachetable`) to share login throttling and catalogs between processes
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": os.getenv("CACHE_TABLE"),
+        }
+        if os.getenv("CACHE_TABLE")
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    )
 }
 
+# Printed on prescriptions, see patient/pdf.py
+CLINIC_NAME = os.getenv("CLINIC_NAME", "Ojas Dental Clinic")
+CLINIC_ADDRESS = os.getenv(
+    "CLINIC_ADDRESS",
+    "4G24+MQF, Hospital Rd, Panchavati Colony, Baran, Rajasthan 325205",
+)
+CLINIC_DOCTOR = os.getenv("CLINIC_DOCTOR", "Dr. Neha Gupta")
+
+# Rendered prescriptions, see patient/pdf_cache.py
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", BASE_DIR / "pdf_cache")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# A background render still pending after this long is reported failed
+PDF_JOB_TIMEOUT = 10 * 60
+# A day's export is rendered in parts of PDF_EXPORT_CHUNK sittings across
+# this many processes, 1 renders it in the request's own process
+PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS", os.cpu_count() or 1))
+PDF_EXPORT_CHUNK = 25
+
+# Doctor catalogs, see doctor/catalog.py
+CATALOG_TTL = 60 * 60 * 24
+CATALOG_LOCAL_TTL = 5
+# Without CACHE_TABLE changes only reach the process that made them, the
+# others rebuild the catalogs this often
+CATALOG_UNSHARED_TTL = 60
+
+# bcrypt gets a bounded pool of its own, see authentication/passwords.py
+# Pick the cost with `python manage.py recommend_bcrypt_cost`
+PASSWORD_HASHING_ROUNDS = int(os.getenv("PASSWORD_HASHING_ROUNDS", 12))
+PASSWORD_HASHING_WORKERS = int(os.getenv("PASSWORD_HASHING_WORKERS", 2))
+PASSWORD_HASHING_QUEUE = int(os.getenv("PASSWORD_HASHING_QUEUE", 8))
+PASSWORD_HASHING_TIMEOUT = 5
+
 
 TEMPLATES = [
     {
@@ -166,6 +222,43 @@ CORS_ALLOWED_ORIGINS = [
 
 WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL")
 WHATSAPP_ACCESS_TOKEN = os.getenv("WHATSAPP_ACCESS_TOKEN")
+# Prefixed to the (10 digit) phonenumbers patients register with
+WHATSAPP_COUNTRY_CODE = os.getenv("WHATSAPP_COUNTRY_CODE", "91")
+WHATSAPP_REMINDER_TEMPLATE = os.getenv(
+    "WHATSAPP_REMINDER_TEMPLATE", "appointment_reminder"
+)
+WHATSAPP_LANGUAGE_CODE = os.getenv("WHATSAPP_LANGUAGE_CODE", "en_US")
+WHATSAPP_CONNECT_TIMEOUT = float(os.getenv("WHATSAPP_CONNECT_TIMEOUT", 5))
+WHATSAPP_READ_TIMEOUT = float(os.getenv("WHATSAPP_READ_TIMEOUT", 10))
+# Messages in flight (and connections kept open) per client
+WHATSAPP_CONCURRENCY = int(os.getenv("WHATSAPP_CONCURRENCY", 8))
+# Bulk sends, see messaging/outbound.py. The rate is shared by all workers,
+# match it to the phone number's throughput on the Cloud API
+WHATSAPP_RATE = float(os.getenv("WHATSAPP_RATE", 80))
+WHATSAPP_BURST = float(os.getenv("WHATSAPP_BURST", 80))
+WHATSAPP_RECIPIENT_INTERVAL = 6
+WHATSAPP_MAX_ATTEMPTS = 4
+WHATSAPP_BACKOFF_BASE = 0.5
+WHATSAPP_BACKOFF_CAP = 30
+WHATSAPP_CIRCUIT_THRESHOLD = 20
+WHATSAPP_CIRCUIT_WINDOW = 30
+WHATSAPP_CIRCUIT_OPEN = 60
+# Webhook (/m/webhook/): callbacks are signed with the app secret, the verify
+# token is the one given when subscribing to it
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")
+WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN")
+# Delivery statuses are saved this many at a time, or this many seconds after
+# the first one arrived (see messaging/statuses.py)
+WHATSAPP_STATUS_BATCH_SIZE = 500
+WHATSAPP_STATUS_FLUSH_INTERVAL = 2
+# Reminders go out the evening before a followup, at this hour
+WHATSAPP_REMINDER_HOUR = 18
+
+# Outbox dispatch, see messaging/outbox.py
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_DISPATCHERS = 4
+OUTBOX_CLAIM_TIMEOUT = 10 * 60
+OUTBOX_MAX_ATTEMPTS = 10
 
 # Timezone for Celery
 CELERY_TIMEZONE = "Asia/Kolkata"
@@ -178,3 +271,22 @@ CELERY_TIMEZONE = "Asia/Kolkata"
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
 
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers.DatabaseScheduler"
+
+# Synced into the database scheduler when beat starts
+CELERY_BEAT_SCHEDULE = {
+    "followup-reminders": {
+        "task": "messaging.tasks.send_followup_reminders",
+        "schedule": crontab(hour=WHATSAPP_REMINDER_HOUR, minute=0),
+    },
+    "dispatch-outbox": {
+        "task": "messaging.tasks.dispatch_outbox",
+        "schedule": 60,
+    },
+}
+
+# PDF renders get a queue (and worker) of their own so a burst of them never
+# holds up messaging tasks
+CELERY_TASK_ROUTES = {"patient.tasks.render_prescription_pdf": {"queue": "pdf"}}
+
+# Run tasks inline, for trying things out without a broker or worker
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER") == "1"
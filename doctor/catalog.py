@@ -0,0 +1,102 @@
+"""
+Treatment and prescription catalogs change maybe once a week but are read on
+every visit, so each one is built once and kept in two tiers:
+
+- the Django cache, under a key carrying the catalog's current version, so
+  every process sees a change as soon as the version is bumped
+- a copy in this process, trusted for CATALOG_LOCAL_TTL seconds before the
+  shared version is checked again
+
+Saving or deleting a `Treatment`/`Prescription` bumps the version (see
+signals.py), old entries are never read again and just expire. Bulk writes
+skip the signals, call `invalidate` after them.
+
+A per-process cache (LocMemCache, the default without CACHE_TABLE) never
+sees other processes' bumps, so there everything is only kept for
+CATALOG_UNSHARED_TTL seconds.
+"""
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from . import models
+from . import services
+
+
+def build_treatments():
+    return list(models.Treatment.objects.values("id", "name", "price"))
+
+
+BUILDERS = {
+    "treatments": build_treatments,
+    "prescriptions": services.fetch_structured_prescriptions,
+}
+
+# name -> (checked at, version, (data, etag))
+local_catalogs = {}
+local_catalogs_lock = threading.Lock()
+
+
+def version_key(name):
+    return f"catalog:{name}:version"
+
+
+def timeouts():
+    """
+    How long the version and the catalog are kept in the cache
+    """
+    if isinstance(caches["default"], (LocMemCache, DummyCache)):
+        ttl = min(settings.CATALOG_TTL, settings.CATALOG_UNSHARED_TTL)
+        return ttl, ttl
+    return None, settings.CATALOG_TTL
+
+
+def fetch(name):
+    """
+    Catalog `name` and its ETag
+    1. Fresh copy in this process: no cache or database round trip
+    2. Current version in the shared cache: one cache read per tier
+    3. Otherwise built from the database and stored under the current version
+    """
+    now = time.monotonic()
+    with local_catalogs_lock:
+        local = local_catalogs.get(name)
+    if local and now - local[0] < settings.CATALOG_LOCAL_TTL:
+        return local[2]
+
+    version_ttl, catalog_ttl = timeouts()
+    version = cache.get(version_key(name))
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another process may have won the race, use whichever got stored
+        if not cache.add(version_key(name), version, version_ttl):
+            version = cache.get(version_key(name), version)
+
+    if local and local[1] == version:
+        catalog = local[2]
+    else:
+        catalog = cache.get(f"catalog:{name}:{version}")
+        if catalog is None:
+            data = BUILDERS[name]()
+            encoded = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+            etag = f'"{hashlib.sha1(encoded.encode("utf-8")).hexdigest()}"'
+            catalog = (data, etag)
+            cache.set(f"catalog:{name}:{version}", catalog, catalog_ttl)
+
+    with local_catalogs_lock:
+        local_catalogs[name] = (now, version, catalog)
+    return catalog
+
+
+def invalidate(name):
+    cache.set(version_key(name), uuid.uuid4().hex, timeouts()[0])
+    with local_catalogs_lock:
+        local_catalogs.pop(name, None)
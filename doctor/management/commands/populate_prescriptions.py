@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
-from doctor import models
-import uuid
+from doctor import catalog, models
+from dentistAPI.ids import uuid7
 
 
 class Command(BaseCommand):
@@ -9,73 +9,78 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         prescriptions = [
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Sensiclave 625",
                 "type": "Medication",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Ordent",
                 "type": "Medication",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Zerodol SP",
                 "type": "Medication",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Metrogill 400",
                 "type": "Medication",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Rabemac DSR",
                 "type": "Medication",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Voveron",
                 "type": "Injection",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Toothpaste",
                 "name": "Vantage",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Toothpaste",
                 "name": "Senquel F",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Toothpaste",
                 "name": "Thermokind F",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Mouthwash",
                 "name": "CloveHexPlus",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Mouthwash",
                 "name": "Bitadine Gargle",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Gel",
                 "name": "MetroHex",
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "type": "Gel",
                 "name": "Annabelle",
             },
         ]
 
-        for prescription in prescriptions:
-            models.Prescription.objects.get_or_create(**prescription)
+        # Existing names are left alone, so it can be run again
+        models.Prescription.objects.bulk_create(
+            [models.Prescription(**prescription) for prescription in prescriptions],
+            ignore_conflicts=True,
+        )
+        # bulk_create doesn't send the signals that bump the catalog version
+        catalog.invalidate("prescriptions")
 
         self.stdout.write(self.style.SUCCESS("Successfully populated prescriptions"))
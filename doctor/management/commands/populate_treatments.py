@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
-from doctor import models
-import uuid
+from doctor import catalog, models
+from dentistAPI.ids import uuid7
 
 
 class Command(BaseCommand):
@@ -9,83 +9,88 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         treatments = [
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Wisdom Tooth Extraction (Impaction)",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Mobile/Form Extraction",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "RCT",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Episectomy",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Temporary Filling",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "GIC Filling",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Composite (Light Cure) Filling",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Silver Filling",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Nickel Chrome Metal Cap",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Ceramic Cap",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "VitaCeramic Cap",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Cadcam Cap",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Zirconia Crown Cap",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Removable Orthodontics",
                 "price": 1000,
             },
             {
-                "id": uuid.uuid4(),
+                "id": uuid7(),
                 "name": "Fixed Appliance Orthodontics",
                 "price": 1000,
             },
         ]
 
-        for treatment in treatments:
-            models.Treatment.objects.get_or_create(**treatment)
+        # Existing names are left alone, so it can be run again
+        models.Treatment.objects.bulk_create(
+            [models.Treatment(**treatment) for treatment in treatments],
+            ignore_conflicts=True,
+        )
+        # bulk_create doesn't send the signals that bump the catalog version
+        catalog.invalidate("treatments")
 
         self.stdout.write(self.style.SUCCESS("Successfully populated treatments"))
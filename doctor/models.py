@@ -1,5 +1,7 @@
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
-import uuid
+from django.db.models.functions import Upper
+from dentistAPI.ids import uuid7
 
 
 class Treatment(models.Model):
@@ -9,7 +11,7 @@ class Treatment(models.Model):
     price: <Integer>
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     name = models.TextField(unique=True)
     price = models.IntegerField()
 
@@ -24,9 +26,17 @@ class Prescription(models.Model):
     type: <String>
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     name = models.TextField(unique=True)
     type = models.TextField()
 
     class Meta:
         db_table = "prescriptions"
+        indexes = [
+            # Case-insensitive prefix search (name__istartswith compares
+            # UPPER(name) with LIKE, which needs the pattern opclass)
+            models.Index(
+                OpClass(Upper("name"), name="text_pattern_ops"),
+                name="prescriptions_name_prefix",
+            ),
+        ]
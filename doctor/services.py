@@ -2,6 +2,8 @@ from . import models
 from patient import services as patient_services
 from django.db import IntegrityError
 from rest_framework import status
+from itertools import groupby
+from operator import itemgetter
 
 
 def delete_treatment_by_id(treatment_id):
@@ -28,18 +30,32 @@ def delete_prescription_by_id(prescription_id):
 
 
 def fetch_structured_prescriptions():
-    structured_prescriptions = {}
-    types = list(models.Prescription.objects.all(
-    ).values_list("type").distinct())
-    for prescription_type in types:
-        # returns a tuple i.e why ("medication",)[0] = "medication"
-        prescription_type = prescription_type[0]
-        structured_prescriptions[prescription_type] = (
-            models.Prescription.objects.filter(type=prescription_type).values(
-                "id", "name"
-            )
-        )
-    return structured_prescriptions
+    """
+    All prescriptions grouped by type, in one ordered scan
+    - {"Medication": [{"id": ..., "name": ...}, ...], ...}
+    """
+    prescriptions = models.Prescription.objects.order_by("type", "name").values(
+        "id", "name", "type"
+    )
+    return {
+        prescription_type: [
+            {"id": prescription["id"], "name": prescription["name"]}
+            for prescription in group
+        ]
+        for prescription_type, group in groupby(prescriptions, key=itemgetter("type"))
+    }
+
+
+def autocomplete_prescriptions(prefix, limit):
+    """
+    Prescriptions whose name starts with `prefix` (any case), by name
+    - served by the prescriptions_name_prefix index
+    """
+    return list(
+        models.Prescription.objects.filter(name__istartswith=prefix)
+        .order_by("name")
+        .values("id", "name", "type")[:limit]
+    )
 
 
 def update_prescription(prescription_id, prescription_data):
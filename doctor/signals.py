@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from functools import partial
+
+from . import catalog, models
+
+
+@receiver(post_save, sender=models.Treatment)
+@receiver(post_delete, sender=models.Treatment)
+def invalidate_treatments(sender, **kwargs):
+    # After commit, so nobody rebuilds the catalog from the old rows
+    transaction.on_commit(partial(catalog.invalidate, "treatments"))
+
+
+@receiver(post_save, sender=models.Prescription)
+@receiver(post_delete, sender=models.Prescription)
+def invalidate_prescriptions(sender, **kwargs):
+    transaction.on_commit(partial(catalog.invalidate, "prescriptions"))
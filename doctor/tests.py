@@ -1,3 +1,157 @@
+import io
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from authentication import jsonwebtokens
+from . import catalog, models, services
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog.local_catalogs.clear()
+        models.Prescription.objects.create(name="Zerodol SP", type="Medication")
+        models.Prescription.objects.create(name="Voveron", type="Injection")
+        token = jsonwebtokens.create_jwt(
+            role="dentist", phonenumber=7880589921, name="John Doe"
+        )
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+
+    def test_catalog_is_cached_until_changed(self):
+        """
+        1. First read builds the catalog, later reads don't touch the database
+        2. Matching ETag: 304 NOT MODIFIED
+        3. Saving a prescription rebuilds the catalog with a new ETag
+        """
+        # 1. cached
+        response = self.client.get("/doc/prescription/", headers=self.headers)
+        self.assertEqual(
+            response.json()["prescriptions"]["Injection"][0]["name"], "Voveron"
+        )
+        with self.assertNumQueries(0):
+            response = self.client.get("/doc/prescription/", headers=self.headers)
+        etag = response.headers["ETag"]
+
+        # 2. revalidation
+        response = self.client.get(
+            "/doc/prescription/", headers={**self.headers, "If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # 3. invalidation
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Prescription.objects.create(name="MetroHex", type="Gel")
+        response = self.client.get(
+            "/doc/prescription/", headers={**self.headers, "If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertIn("Gel", response.json()["prescriptions"])
+
+    def test_bulk_populate_bumps_the_version(self):
+        """
+        1. populate_prescriptions (bulk_create, no signals) shows up in the
+        catalog right away
+        2. A per-process cache only keeps it for CATALOG_UNSHARED_TTL
+        """
+        # 1. populate
+        data, etag = catalog.fetch("prescriptions")
+        call_command("populate_prescriptions", stdout=io.StringIO())
+        data, new_etag = catalog.fetch("prescriptions")
+        self.assertNotEqual(new_etag, etag)
+        self.assertIn("Mouthwash", data)
+
+        # 2. per-process cache
+        self.assertEqual(catalog.timeouts(), (60, 60))
+
+
+class PrescriptionSearchTests(TestCase):
+    def setUp(self):
+        for name, prescription_type in (
+            ("Zerodol SP", "Medication"),
+            ("Voveron", "Injection"),
+            ("Zerodol P", "Medication"),
+            ("Zinc Oxide", "Gel"),
+            ("Augmentin 625", "Medication"),
+        ):
+            models.Prescription.objects.create(name=name, type=prescription_type)
+        token = jsonwebtokens.create_jwt(
+            role="dentist", phonenumber=7880589921, name="John Doe"
+        )
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+
+    def autocomplete(self, prefix, **params):
+        response = self.client.get(
+            f"/doc/prescription/autocomplete/{quote(prefix)}/",
+            params,
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            prescription["name"] for prescription in response.json()["prescriptions"]
+        ]
+
+    def test_catalog_is_grouped_in_one_query(self):
+        with self.assertNumQueries(1):
+            prescriptions = services.fetch_structured_prescriptions()
+        self.assertEqual(
+            {
+                prescription_type: [prescription["name"] for prescription in group]
+                for prescription_type, group in prescriptions.items()
+            },
+            {
+                "Gel": ["Zinc Oxide"],
+                "Injection": ["Voveron"],
+                "Medication": ["Augmentin 625", "Zerodol P", "Zerodol SP"],
+            },
+        )
+
+    def test_autocomplete(self):
+        """
+        1. Prefix in any case, by name, in one query
+        2. `limit` bounds: at least 1, at most 50, 10 when it isn't a number
+        3. LIKE wildcards in the prefix are matched literally
+        """
+        # 1. prefix
+        self.assertEqual(self.autocomplete("zEr"), ["Zerodol P", "Zerodol SP"])
+        self.assertEqual(
+            self.autocomplete("Z"), ["Zerodol P", "Zerodol SP", "Zinc Oxide"]
+        )
+        with self.assertNumQueries(1):
+            prescriptions = services.autocomplete_prescriptions("voV", 10)
+        self.assertEqual(
+            prescriptions,
+            [
+                {
+                    "id": models.Prescription.objects.get(name="Voveron").id,
+                    "name": "Voveron",
+                    "type": "Injection",
+                }
+            ],
+        )
+
+        # 2. limit
+        models.Prescription.objects.bulk_create(
+            models.Prescription(name=f"Paracetamol {index:02}", type="Medication")
+            for index in range(60)
+        )
+        self.assertEqual(self.autocomplete("Z", limit=2), ["Zerodol P", "Zerodol SP"])
+        self.assertEqual(self.autocomplete("Z", limit=0), ["Zerodol P"])
+        self.assertEqual(len(self.autocomplete("para", limit=100)), 50)
+        self.assertEqual(
+            self.autocomplete("para", limit="all"),
+            [f"Paracetamol {index:02}" for index in range(10)],
+        )
+
+        # 3. wildcards
+        self.assertEqual(self.autocomplete("%"), [])
+        self.assertEqual(self.autocomplete("Zerodol_"), [])
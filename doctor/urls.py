@@ -5,6 +5,11 @@ urlpatterns = [
     path("treatment/", views.treatments, name="treatments"),
     path("treatment/<uuid:treatment_id>/", views.treatments, name="delete_treatments"),
     path("prescription/", views.prescriptions, name="prescription"),
+    path(
+        "prescription/autocomplete/<str:prefix>/",
+        views.autocomplete_prescription,
+        name="autocomplete_prescription",
+    ),
     path(
         "prescription/<uuid:prescription_id>/",
         views.prescriptions,
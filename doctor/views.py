@@ -2,19 +2,31 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework import permissions
 from rest_framework.response import Response
 from rest_framework import status
-import authentication.jsonwebtokens as jsonwebtokens
-from . import models
+from django.utils.http import parse_etags
+from authentication.authorization import role_required
+from . import catalog
 from . import serializers
 from . import services
 
 # Create your views here.
 
 
+def catalog_response(request, name):
+    """
+    Catalog `name`, or 304 NOT MODIFIED when the client's ETag still matches
+    """
+    data, etag = catalog.fetch(name)
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response({name: data}, headers={"ETag": etag})
+
+
 @api_view(["GET", "POST", "DELETE", "PUT"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist")
 def treatments(request, treatment_id=None):
     """
-    1. GET: Fetch all treatments
+    1. GET: Fetch all treatments (ETag, 304 when unchanged)
     2. POST: Add new treatment
     Expected JSON:
     {
@@ -32,19 +44,8 @@ def treatments(request, treatment_id=None):
         }
     }
     """
-    # JWT authentication
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["dentist"])
-    )
-    if error:
-        return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
-        )
-
     if request.method == "GET":
-        treatments = models.Treatment.objects.all().values()
-        return Response({"treatments": treatments})
+        return catalog_response(request, "treatments")
 
     if request.method == "DELETE":
         if treatment_id:
@@ -97,9 +98,10 @@ def treatments(request, treatment_id=None):
 
 @api_view(["GET", "POST", "DELETE", "PUT"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist")
 def prescriptions(request, prescription_id=None):
     """
-    1. GET: Fetch all prescriptions
+    1. GET: Fetch all prescriptions grouped by type (ETag, 304 when unchanged)
     2. POST: Add new prescriptions
     Expected JSON:
     {
@@ -116,19 +118,8 @@ def prescriptions(request, prescription_id=None):
         }
     }
     """
-    # JWT authentication
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["dentist"])
-    )
-    if error:
-        return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
-        )
-
     if request.method == "GET":
-        prescriptions = services.fetch_structured_prescriptions()
-        return Response({"prescriptions": prescriptions})
+        return catalog_response(request, "prescriptions")
 
     if request.method == "DELETE":
         if prescription_id:
@@ -175,3 +166,23 @@ def prescriptions(request, prescription_id=None):
             {"success": f"{prescription_serializer.data["name"]} updated!"},
             status=status.HTTP_200_OK,
         )
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+@role_required("dentist")
+def autocomplete_prescription(request, prefix=None):
+    """
+    Prescriptions whose name starts with what has been typed so far, so the
+    prescribing screen doesn't need the whole catalog
+    - ?limit=<int> prescriptions (default 10, max 50)
+    1. Success: 200 OK
+    """
+    if request.method == "GET":
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            limit = 10
+
+        prescriptions = services.autocomplete_prescriptions(prefix, max(limit, 1))
+        return Response({"prescriptions": prescriptions}, status=status.HTTP_200_OK)
@@ -0,0 +1,159 @@
+import datetime
+import json
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from messaging import models, outbound, outbox, services, whatsapp
+from messaging.stub_server import StubWhatsApp
+from patient.management.commands._synthetic import (
+    SYNTHETIC_PHONE_END,
+    SYNTHETIC_PHONE_START,
+    remove_patients,
+    seed_sittings,
+)
+
+
+def send_blocking(message):
+    """
+    How messages used to go out: a new connection and a blocking request
+    per message
+    """
+    request = urllib.request.Request(
+        settings.WHATSAPP_API_URL,
+        data=json.dumps(whatsapp.template_payload(**message)).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+
+class Command(BaseCommand):
+    help = (
+        "Tomorrow's followup reminders end to end against a local stub of the "
+        "WhatsApp API: scheduling them into the outbox, then claiming and "
+        "sending them with several dispatchers at once, vs one at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reminders", type=int, default=10_000)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Seconds the stub takes to answer, like a real API round trip",
+        )
+        parser.add_argument(
+            "--api-rate",
+            type=int,
+            default=80,
+            help="Messages per second the stub accepts before answering 429",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Override WHATSAPP_RATE, set it above --api-rate to see throttling",
+        )
+        parser.add_argument(
+            "--baseline",
+            type=int,
+            default=200,
+            help="Reminders to send one at a time for comparison",
+        )
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        seed_sittings(
+            kwargs["reminders"], prescriptions_per_sitting=0, followup_date=tomorrow
+        )
+        synthetic_messages = models.OutboxMessage.objects.filter(
+            recipient__gte=SYNTHETIC_PHONE_START, recipient__lte=SYNTHETIC_PHONE_END
+        )
+
+        rate = kwargs["rate"] or settings.WHATSAPP_RATE
+        with StubWhatsApp(
+            latency=kwargs["latency"], rate=kwargs["api_rate"]
+        ) as stub, override_settings(
+            WHATSAPP_API_URL=stub.url, WHATSAPP_RATE=rate, WHATSAPP_BURST=rate
+        ):
+            start = time.perf_counter()
+            reminders = services.fetch_reminders_by_date(tomorrow)
+            # Due now rather than this evening
+            outbox.schedule_reminders(reminders, send_after=timezone.now())
+            elapsed = time.perf_counter() - start
+            due = synthetic_messages.filter(status=outbox.Status.PENDING).count()
+            self.stdout.write(
+                f"Scheduled {len(reminders)} reminders in {elapsed:.2f} s, "
+                f"{due} due"
+            )
+
+            totals = {outbound.SENT: 0, outbound.FAILED: 0, outbound.DEFERRED: 0}
+            totals_lock = threading.Lock()
+
+            def dispatcher():
+                try:
+                    while True:
+                        counts = outbox.dispatch(settings.OUTBOX_BATCH_SIZE)
+                        if not any(counts.values()):
+                            # Deferred ones come due again shortly
+                            pending = synthetic_messages.filter(
+                                status=outbox.Status.PENDING
+                            )
+                            if not pending.exists():
+                                return
+                            time.sleep(0.1)
+                        with totals_lock:
+                            for outcome, count in counts.items():
+                                totals[outcome] += count
+                finally:
+                    connection.close()
+
+            start = time.perf_counter()
+            workers = [
+                threading.Thread(target=dispatcher) for _ in range(kwargs["workers"])
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            sent = totals[outbound.SENT]
+            received = [
+                message["biz_opaque_callback_data"] for message in stub.messages
+            ]
+            self.stdout.write(
+                f"{kwargs['workers']} dispatchers ({settings.WHATSAPP_CONCURRENCY} "
+                f"in flight each, {rate:g}/s): {sent / elapsed:,.0f} messages/s, "
+                f"{sent} sent, {totals[outbound.FAILED]} failed, "
+                f"{totals[outbound.DEFERRED]} deferred, "
+                f"{stub.throttled} throttled (429), "
+                f"{len(received) - len(set(received))} sent twice"
+            )
+
+            baseline = synthetic_messages.filter(status=outbox.Status.SENT)[
+                : kwargs["baseline"]
+            ]
+            if baseline:
+                start = time.perf_counter()
+                for message in baseline:
+                    send_blocking(outbox.template_message(message))
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"One at a time: {len(baseline) / elapsed:,.0f} messages/s"
+                )
+
+        if kwargs["cleanup"]:
+            synthetic_messages.delete()
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from messaging import whatsapp
+from messaging.stub_server import StubWhatsApp
+from patient.management.commands._synthetic import summarize
+from .benchmark_reminders import send_blocking
+
+
+async def send_all(messages):
+    """
+    The client alone, WHATSAPP_CONCURRENCY in flight (outbound.py adds rate
+    limiting and retries on top)
+    """
+    semaphore = asyncio.Semaphore(settings.WHATSAPP_CONCURRENCY)
+
+    async def send(message):
+        async with semaphore:
+            return await whatsapp.post_template(client, message)
+
+    async with whatsapp.async_client() as client:
+        return await asyncio.gather(*(send(message) for message in messages))
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-message latency and throughput of the WhatsApp client against a "
+        "local stub of the API: a new connection per message, the pooled client "
+        "and the asyncio bulk path"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument(
+            "--sequential",
+            type=int,
+            default=200,
+            help="Messages to send one at a time (with and without pooling)",
+        )
+        parser.add_argument("--latency", type=float, default=0.05)
+        parser.add_argument(
+            "--handshake",
+            type=float,
+            default=0.1,
+            help="Seconds the stub adds to every new connection (TLS)",
+        )
+
+    def handle(self, *args, **kwargs):
+        messages = [
+            {
+                "phonenumber": 6000000000 + number,
+                "template_name": "hello_world",
+                "language_code": "en_US",
+            }
+            for number in range(kwargs["messages"])
+        ]
+        sequential = messages[: kwargs["sequential"]]
+
+        with StubWhatsApp(
+            latency=kwargs["latency"], handshake=kwargs["handshake"]
+        ) as stub, override_settings(WHATSAPP_API_URL=stub.url):
+            self.report(
+                "New connection per message",
+                self.time_each(send_blocking, sequential),
+                len(sequential),
+            )
+            self.report(
+                "Pooled client, one at a time",
+                self.time_each(
+                    lambda message: whatsapp.send_template(**message), sequential
+                ),
+                len(sequential),
+            )
+
+            start = time.perf_counter()
+            results = asyncio.run(send_all(messages))
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for _, error_status, _ in results if error_status)
+            self.stdout.write(
+                f"Async, {settings.WHATSAPP_CONCURRENCY} in flight: "
+                f"{len(messages) / elapsed:,.0f} messages/s, "
+                f"{elapsed / len(messages) * 1000:.1f} ms per message, "
+                f"{failed} failed"
+            )
+
+    def time_each(self, send, messages):
+        samples = []
+        for message in messages:
+            start = time.perf_counter()
+            send(message)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def report(self, label, samples, count):
+        latency = summarize(samples)
+        self.stdout.write(
+            f"{label}: {count / sum(samples):,.0f} messages/s, "
+            f"p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms"
+        )
@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from messaging import models, statuses
+from patient.management.commands._synthetic import (
+    SYNTHETIC_PHONE_END,
+    SYNTHETIC_PHONE_START,
+    summarize,
+)
+
+APP_SECRET = "loadtest-secret"
+
+
+def callback_body(message, status, timestamp):
+    """
+    A status callback as the Cloud API sends it, one status per request
+    """
+    return json.dumps(
+        {
+            "object": "whatsapp_business_account",
+            "entry": [
+                {
+                    "id": "0",
+                    "changes": [
+                        {
+                            "field": "messages",
+                            "value": {
+                                "messaging_product": "whatsapp",
+                                "statuses": [
+                                    {
+                                        "id": message.provider_message_id,
+                                        "status": status,
+                                        "timestamp": str(timestamp),
+                                        "recipient_id": f"91{message.recipient}",
+                                        "biz_opaque_callback_data": str(message.id),
+                                    }
+                                ],
+                            },
+                        }
+                    ],
+                }
+            ],
+        }
+    ).encode("utf-8")
+
+
+def sign(body):
+    digest = hmac.new(APP_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a flood of WhatsApp status callbacks (sent, delivered, read for "
+        "each message of a bulk send, some out of order or repeated) against "
+        "the webhook, with statuses saved in batches vs one at a time"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--callbacks", type=int, default=50_000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--duplicates",
+            type=float,
+            default=0.02,
+            help="Share of callbacks WhatsApp sends again",
+        )
+        parser.add_argument(
+            "--baseline",
+            type=int,
+            default=5000,
+            help="Callbacks to replay with statuses saved one at a time",
+        )
+
+    def handle(self, *args, **kwargs):
+        rng = random.Random(0)
+        count = kwargs["callbacks"] // 3
+        now = int(time.time())
+        messages = models.OutboxMessage.objects.bulk_create(
+            [
+                models.OutboxMessage(
+                    dedupe_key=f"loadtest:{index}",
+                    recipient=SYNTHETIC_PHONE_START + index,
+                    template="appointment_reminder",
+                    language_code="en_US",
+                    status=models.OutboxMessage.StatusChoices.SENT,
+                    sent_at=timezone.now(),
+                    provider_message_id=f"wamid.loadtest.{index}",
+                )
+                for index in range(count)
+            ],
+            batch_size=5000,
+        )
+        synthetic_messages = models.OutboxMessage.objects.filter(
+            recipient__gte=SYNTHETIC_PHONE_START, recipient__lte=SYNTHETIC_PHONE_END
+        )
+
+        callbacks = [
+            (message, status, now + offset)
+            for message in messages
+            for offset, status in enumerate(("sent", "delivered", "read"))
+        ]
+        callbacks += rng.sample(callbacks, int(len(callbacks) * kwargs["duplicates"]))
+        # Arrive roughly in order, shuffled within a few hundred
+        window = 300
+        for start in range(0, len(callbacks), window):
+            chunk = callbacks[start : start + window]
+            rng.shuffle(chunk)
+            callbacks[start : start + window] = chunk
+        requests = []
+        for callback in callbacks:
+            body = callback_body(*callback)
+            requests.append((body, sign(body)))
+        self.stdout.write(
+            f"{len(requests)} callbacks for {count} messages "
+            f"({len(requests) - count * 3} repeated)"
+        )
+
+        try:
+            with override_settings(WHATSAPP_APP_SECRET=APP_SECRET):
+                self.replay("Batched", requests, kwargs["threads"])
+                self.check_saved(synthetic_messages, count)
+                self.reset(synthetic_messages)
+                if kwargs["baseline"]:
+                    with override_settings(WHATSAPP_STATUS_BATCH_SIZE=1):
+                        self.replay(
+                            "One at a time",
+                            requests[: kwargs["baseline"]],
+                            kwargs["threads"],
+                        )
+        finally:
+            statuses.buffer.flush()
+            synthetic_messages.delete()
+
+    def replay(self, label, requests, threads):
+        samples, rejected, lock = [], [], threading.Lock()
+
+        def post(share):
+            client = Client(SERVER_NAME="localhost")
+            times, failures = [], 0
+            try:
+                for body, signature in share:
+                    start = time.perf_counter()
+                    try:
+                        response = client.post(
+                            "/m/webhook/",
+                            body,
+                            content_type="application/json",
+                            headers={"X-Hub-Signature-256": signature},
+                        )
+                    except Exception:
+                        # e.g. "database is locked" on sqlite, flushing
+                        failures += 1
+                        continue
+                    times.append(time.perf_counter() - start)
+                    failures += response.status_code != 200
+            finally:
+                with lock:
+                    samples.extend(times)
+                    rejected.append(failures)
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=post, args=(requests[index::threads],))
+            for index in range(threads)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        answered = time.perf_counter() - start
+        statuses.buffer.flush()
+        saved = time.perf_counter() - start
+
+        if not samples:
+            self.stdout.write(
+                f"{label}: no callbacks answered, {sum(rejected)} rejected"
+            )
+            return
+        latency = summarize(samples)
+        self.stdout.write(
+            f"{label}: {len(samples) / answered:,.0f} callbacks/s, "
+            f"p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+            f"all saved after {saved:.1f} s, {sum(rejected)} rejected"
+        )
+
+    def check_saved(self, synthetic_messages, count):
+        counts = statuses.delivery_counts(synthetic_messages)
+        recorded = models.MessageStatus.objects.filter(
+            message__in=synthetic_messages
+        ).count()
+        self.stdout.write(
+            f"Delivery statuses: {counts}, {recorded} recorded "
+            f"({count * 3} expected)"
+        )
+
+    def reset(self, synthetic_messages):
+        models.MessageStatus.objects.filter(message__in=synthetic_messages).delete()
+        synthetic_messages.update(delivery_status="", delivered_at=None, read_at=None)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from messaging.stub_server import StubWhatsApp
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in for the WhatsApp API (set WHATSAPP_API_URL to it)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.0)
+        parser.add_argument("--handshake", type=float, default=0.0)
+
+    def handle(self, *args, **kwargs):
+        with StubWhatsApp(
+            port=kwargs["port"], latency=kwargs["latency"], handshake=kwargs["handshake"]
+        ) as stub:
+            self.stdout.write(f"Listening, WHATSAPP_API_URL={stub.url}")
+            try:
+                while True:
+                    time.sleep(60)
+                    self.stdout.write(f"{len(stub.messages)} messages received")
+            except KeyboardInterrupt:
+                pass
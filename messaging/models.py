@@ -1,3 +1,139 @@
 from django.db import models
+from django.utils import timezone
+from dentistAPI.ids import uuid7
 
-# Create your models here.
+
+class TokenBucket(models.Model):
+    """
+    name: <String> what is being rate limited (Primary key)
+    tokens: <Float> tokens left as of `refilled_at`
+    refilled_at: <Float> unix time tokens were last counted
+    """
+
+    name = models.CharField(primary_key=True, max_length=50)
+    tokens = models.FloatField()
+    refilled_at = models.FloatField()
+
+    class Meta:
+        db_table = "token_buckets"
+
+
+class OutboxMessage(models.Model):
+    """
+    id: <UUID>
+    dedupe_key: <String> at most one message per key, ever (e.g.
+    "reminder:<followup id>:<followup date>")
+    recipient: <BigInt> phonenumber
+    template: <String> WhatsApp template name
+    language_code: <String>
+    parameters: <JSON> template body parameters
+    status: <pending | sending | sent | failed | cancelled>
+    attempts: <Int> times it has been claimed for sending
+    send_after: <DateTime> not sent before this
+    claim: <UUID> dispatcher run holding it while it is sending
+    claimed_at: <DateTime>
+    provider_message_id: <String> WhatsApp's id for it, once sent
+    last_error: <String>
+    created_at: <DateTime>
+    sent_at: <DateTime>
+    delivery_status: <sent | delivered | read | failed> furthest along of the
+    statuses WhatsApp reported for it (see statuses.py)
+    delivered_at: <DateTime>
+    read_at: <DateTime>
+    """
+
+    class StatusChoices(models.TextChoices):
+        PENDING = "pending"
+        SENDING = "sending"
+        SENT = "sent"
+        FAILED = "failed"
+        CANCELLED = "cancelled"
+
+    id = models.UUIDField(primary_key=True, default=uuid7)
+    dedupe_key = models.CharField(max_length=255, unique=True)
+    recipient = models.BigIntegerField()
+    template = models.CharField(max_length=100)
+    language_code = models.CharField(max_length=10)
+    parameters = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=10, choices=StatusChoices.choices, default=StatusChoices.PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    send_after = models.DateTimeField(default=timezone.now)
+    claim = models.UUIDField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    provider_message_id = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    delivery_status = models.CharField(max_length=10, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "outbox_messages"
+        indexes = [
+            # Due messages, for dispatchers to claim
+            models.Index(
+                fields=["send_after"],
+                condition=models.Q(status="pending"),
+                name="outbox_due_idx",
+            ),
+            # A dispatcher's claimed batch
+            models.Index(
+                fields=["claim"],
+                condition=models.Q(claim__isnull=False),
+                name="outbox_claim_idx",
+            ),
+            # Claims left behind by dispatchers that died mid-send
+            models.Index(
+                fields=["claimed_at"],
+                condition=models.Q(status="sending"),
+                name="outbox_sending_idx",
+            ),
+            # Status callbacks without our callback data
+            models.Index(
+                fields=["provider_message_id"],
+                condition=~models.Q(provider_message_id=""),
+                name="outbox_provider_id_idx",
+            ),
+        ]
+
+
+class MessageStatus(models.Model):
+    """
+    A status callback from WhatsApp, as received
+    id: <UUID>
+    message: <OutboxMessage> null for messages not sent from the outbox
+    provider_message_id: <String>
+    status: <sent | delivered | read | failed>
+    timestamp: <DateTime> when WhatsApp says it happened
+    recipient: <String> WhatsApp number (with country code)
+    errors: <JSON> WhatsApp's errors, for failed
+    received_at: <DateTime>
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid7)
+    message = models.ForeignKey(
+        OutboxMessage,
+        on_delete=models.CASCADE,
+        related_name="statuses",
+        null=True,
+        blank=True,
+    )
+    provider_message_id = models.CharField(max_length=255)
+    status = models.CharField(max_length=10)
+    timestamp = models.DateTimeField()
+    recipient = models.CharField(max_length=20, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "message_statuses"
+        constraints = [
+            # WhatsApp retries callbacks it thinks weren't received
+            models.UniqueConstraint(
+                fields=["provider_message_id", "status"],
+                name="message_status_once",
+            ),
+        ]
@@ -0,0 +1,214 @@
+"""
+Scheduling of bulk WhatsApp sends, so that a reminder run goes out as fast as
+the Cloud API allows without getting throttled, and backs off when it fails
+
+- Throughput: one token bucket (WHATSAPP_RATE messages per second, bursts of
+  up to WHATSAPP_BURST) in the database, shared by every worker. A run takes
+  tokens WHATSAPP_CONCURRENCY at a time, not one query per message.
+- Recipients: at most one message per WHATSAPP_RECIPIENT_INTERVAL seconds to
+  the same number.
+- Retries: 429s, 5xx and connection errors are retried up to
+  WHATSAPP_MAX_ATTEMPTS times, after Retry-After or an exponential backoff
+  with full jitter. A request that got no response once sent (read timeout)
+  may have gone out, it fails instead, so nobody gets a message twice.
+- Circuit breaker: WHATSAPP_CIRCUIT_THRESHOLD such failures within
+  WHATSAPP_CIRCUIT_WINDOW seconds stop all sending for WHATSAPP_CIRCUIT_OPEN
+  seconds.
+
+Messages that can't go out yet come back deferred, with how long to wait,
+for the caller to queue again. Recipients and the circuit are kept in the
+cache, which has to be shared (CACHE_TABLE) for them to hold across workers.
+"""
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+import asyncio
+import random
+import time
+
+from . import models, whatsapp
+
+SENT = "sent"
+FAILED = "failed"
+DEFERRED = "deferred"
+
+BUCKET = "whatsapp"
+CIRCUIT_KEY = "whatsapp:circuit:open_until"
+FAILURES_KEY = "whatsapp:circuit:failures"
+
+
+def take_tokens(name, count, rate, burst):
+    """
+    Take up to `count` tokens from bucket `name`, refilled at `rate` per second
+    - returns tokens taken, seconds until the next one
+    """
+    with transaction.atomic():
+        buckets = models.TokenBucket.objects.select_for_update()
+        bucket = buckets.filter(name=name).first()
+        if bucket is None:
+            models.TokenBucket.objects.get_or_create(
+                name=name, defaults={"tokens": burst, "refilled_at": time.time()}
+            )
+            bucket = buckets.get(name=name)
+        now = time.time()
+        tokens = min(burst, bucket.tokens + max(0, now - bucket.refilled_at) * rate)
+        taken = min(count, int(tokens))
+        bucket.tokens = tokens - taken
+        bucket.refilled_at = now
+        bucket.save(update_fields=["tokens", "refilled_at"])
+    return taken, max(0, 1 - bucket.tokens) / rate
+
+
+def circuit_wait():
+    """
+    Seconds until sending may resume, 0 while the circuit is closed
+    """
+    open_until = cache.get(CIRCUIT_KEY)
+    return max(0, open_until - time.time()) if open_until else 0
+
+
+def record_failure():
+    """
+    Count a retryable failure, opening the circuit at the threshold
+    - returns seconds the circuit is open for, 0 if it stays closed
+    """
+    cache.add(FAILURES_KEY, 0, settings.WHATSAPP_CIRCUIT_WINDOW)
+    try:
+        failures = cache.incr(FAILURES_KEY)
+    except ValueError:
+        # The window ran out between add and incr
+        failures = 1
+    if failures < settings.WHATSAPP_CIRCUIT_THRESHOLD:
+        return 0
+    cache.set(
+        CIRCUIT_KEY,
+        time.time() + settings.WHATSAPP_CIRCUIT_OPEN,
+        settings.WHATSAPP_CIRCUIT_OPEN,
+    )
+    cache.delete(FAILURES_KEY)
+    return settings.WHATSAPP_CIRCUIT_OPEN
+
+
+def claim_recipient(phonenumber):
+    """
+    Reserve the next message to `phonenumber`
+    - returns 0 if reserved, otherwise seconds until it can be
+    """
+    key = f"whatsapp:recipient:{whatsapp.to_whatsapp_number(phonenumber)}"
+    interval = settings.WHATSAPP_RECIPIENT_INTERVAL
+    if cache.add(key, time.time() + interval, interval):
+        return 0
+    return max(0, (cache.get(key) or 0) - time.time()) or interval
+
+
+def retryable(error_status):
+    if error_status == whatsapp.MAYBE_SENT:
+        return False
+    return error_status == 429 or error_status >= 500
+
+
+def backoff(attempt, retry_after=None):
+    if retry_after is not None:
+        return retry_after
+    ceiling = settings.WHATSAPP_BACKOFF_BASE * 2**attempt
+    return random.uniform(0, min(settings.WHATSAPP_BACKOFF_CAP, ceiling))
+
+
+class Limiter:
+    """
+    One run's view of the shared bucket and circuit, refilled from the
+    database a few tokens at a time
+    """
+
+    def __init__(self):
+        self.tokens = 0
+        self.open_until = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Wait for a token
+        - returns 0 once it has one, or the seconds left while the circuit
+        is open
+        """
+        async with self.lock:
+            while not self.tokens:
+                wait = await sync_to_async(circuit_wait)()
+                self.open_until = time.time() + wait
+                if wait:
+                    return wait
+                taken, wait = await sync_to_async(take_tokens)(
+                    BUCKET,
+                    settings.WHATSAPP_CONCURRENCY,
+                    settings.WHATSAPP_RATE,
+                    settings.WHATSAPP_BURST,
+                )
+                self.tokens += taken
+                if not taken:
+                    await asyncio.sleep(wait)
+            if self.open_until > time.time():
+                return self.open_until - time.time()
+            self.tokens -= 1
+            return 0
+
+    async def failed(self):
+        open_for = await sync_to_async(record_failure)()
+        if open_for:
+            self.open_until = time.time() + open_for
+
+
+async def deliver(client, limiter, semaphore, message):
+    """
+    Send one message, retrying transient failures
+    1. Sent: returns SENT, API response
+    2. Refused, no response once sent, or still failing after
+    WHATSAPP_MAX_ATTEMPTS: returns FAILED, API error
+    3. Recipient messaged too recently or circuit open: returns DEFERRED,
+    seconds to wait
+    """
+    wait = await sync_to_async(claim_recipient)(message["phonenumber"])
+    if wait:
+        return DEFERRED, wait
+    for attempt in range(settings.WHATSAPP_MAX_ATTEMPTS):
+        wait = await limiter.acquire()
+        if wait:
+            return DEFERRED, wait
+        async with semaphore:
+            response, error_status, retry_after = await whatsapp.post_template(
+                client, message
+            )
+        if not error_status:
+            return SENT, response
+        if error_status == whatsapp.MAYBE_SENT:
+            # Counts against the circuit, but may have been sent
+            await limiter.failed()
+            break
+        if not retryable(error_status):
+            break
+        await limiter.failed()
+        if attempt + 1 < settings.WHATSAPP_MAX_ATTEMPTS:
+            await asyncio.sleep(backoff(attempt, retry_after))
+    return FAILED, {"error": response, "status": error_status}
+
+
+async def send_async(messages):
+    limiter = Limiter()
+    semaphore = asyncio.Semaphore(settings.WHATSAPP_CONCURRENCY)
+    async with whatsapp.async_client() as client:
+        return await asyncio.gather(
+            *(deliver(client, limiter, semaphore, message) for message in messages)
+        )
+
+
+def send(messages):
+    """
+    Send template messages, WHATSAPP_CONCURRENCY in flight at a time
+    - messages: [{"phonenumber", "template_name", "language_code", "parameters"}]
+    - returns [(SENT | FAILED | DEFERRED, detail)] in the same order, see
+    `deliver`
+    """
+    # async_to_sync (not asyncio.run) so the database and cache calls made
+    # through sync_to_async run on this thread and its connection
+    return async_to_sync(send_async)(messages)
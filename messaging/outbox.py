@@ -0,0 +1,207 @@
+"""
+Transactional outbox for WhatsApp messages
+
+Messages are written to `outbox_messages` in the same transaction as what
+they are about (a followup's reminder with the followup) and sent later by
+dispatchers (tasks.dispatch_outbox). Nothing goes out for a change that was
+rolled back, nothing is lost while the API is down, and there is a record of
+what was sent.
+
+Each message is delivered at most once:
+
+- its dedupe_key is unique, so scheduling the same reminder again is a no-op
+- dispatchers claim batches with SELECT ... FOR UPDATE SKIP LOCKED and stamp
+  them with their own claim id, so no two dispatchers send the same message
+- a message still `sending` OUTBOX_CLAIM_TIMEOUT seconds after it was
+  claimed (its dispatcher died mid-send) is marked failed, not sent again,
+  as the patient may already have it
+- likewise a message the API may have taken without answering (read
+  timeout) is failed rather than retried (see outbound.py)
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+import datetime
+import json
+import uuid
+
+from patient import models as patient_models
+from . import models, outbound, services
+
+Status = models.OutboxMessage.StatusChoices
+
+
+def reminder_key(followup_id, date):
+    return f"reminder:{followup_id}:{date.isoformat()}"
+
+
+def reminder_message(reminder, send_after=None):
+    """
+    Outbox row for a reminder (see services.fetch_reminders), sent on the
+    evening before the followup unless `send_after`
+    """
+    if send_after is None:
+        send_after = timezone.make_aware(
+            datetime.datetime.combine(
+                reminder["date"] - datetime.timedelta(days=1),
+                datetime.time(settings.WHATSAPP_REMINDER_HOUR),
+            )
+        )
+    return models.OutboxMessage(
+        dedupe_key=reminder_key(reminder["followup_id"], reminder["date"]),
+        recipient=reminder["phonenumber"],
+        template=settings.WHATSAPP_REMINDER_TEMPLATE,
+        language_code=settings.WHATSAPP_LANGUAGE_CODE,
+        parameters=[
+            reminder["name"],
+            reminder["title"],
+            reminder["date"].strftime("%d %b %Y"),
+            reminder["time"].strftime("%I:%M %p") if reminder["time"] else "",
+        ],
+        send_after=send_after,
+    )
+
+
+def schedule_reminders(reminders, send_after=None):
+    """
+    Add reminders for followups still ahead to the outbox, in bulk, leaving
+    alone the ones already in it
+    """
+    today = datetime.date.today()
+    messages = [
+        reminder_message(reminder, send_after)
+        for reminder in reminders
+        if reminder["date"] > today
+    ]
+    # Cancelled when the followup moved away, wanted again now it's back
+    models.OutboxMessage.objects.filter(
+        dedupe_key__in=[message.dedupe_key for message in messages],
+        status=Status.CANCELLED,
+    ).update(status=Status.PENDING)
+    models.OutboxMessage.objects.bulk_create(
+        messages, batch_size=1000, ignore_conflicts=True
+    )
+
+
+def reschedule_reminders(followup_ids):
+    """
+    Bring the outbox in line with created or changed followups: cancel their
+    pending reminders for dates they are no longer on, and schedule ones for
+    the dates they are on (unless completed). Call it in the transaction that
+    changes them.
+    """
+    reminders = services.fetch_reminders(
+        patient_models.FollowUp.objects.filter(id__in=followup_ids, completed=False)
+    )
+    previous = Q()
+    for followup_id in followup_ids:
+        previous |= Q(dedupe_key__startswith=f"reminder:{followup_id}:")
+    models.OutboxMessage.objects.filter(previous, status=Status.PENDING).exclude(
+        dedupe_key__in=[
+            reminder_key(reminder["followup_id"], reminder["date"])
+            for reminder in reminders
+        ]
+    ).update(status=Status.CANCELLED)
+    schedule_reminders(reminders)
+
+
+def claim(batch_size):
+    """
+    Claim up to `batch_size` due messages for this dispatcher
+    - returns the claimed messages
+    """
+    claim_id = uuid.uuid4()
+    now = timezone.now()
+    with transaction.atomic():
+        due = (
+            models.OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=Status.PENDING, send_after__lte=now)
+            .order_by("send_after")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        # Checking the status again keeps this safe where rows can't be
+        # locked (sqlite)
+        models.OutboxMessage.objects.filter(
+            id__in=list(due), status=Status.PENDING
+        ).update(
+            status=Status.SENDING,
+            claim=claim_id,
+            claimed_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(models.OutboxMessage.objects.filter(claim=claim_id))
+
+
+def expire_claims():
+    """
+    Fail messages whose dispatcher stopped mid-send
+    - returns the number of messages failed
+    """
+    timeout = datetime.timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+    cutoff = timezone.now() - timeout
+    return models.OutboxMessage.objects.filter(
+        status=Status.SENDING, claimed_at__lt=cutoff
+    ).update(
+        status=Status.FAILED,
+        claim=None,
+        last_error="Dispatcher stopped mid-send, not retried in case it arrived",
+    )
+
+
+def template_message(message):
+    """
+    What to send for an outbox row (keyword arguments for the client)
+    """
+    return {
+        "phonenumber": message.recipient,
+        "template_name": message.template,
+        "language_code": message.language_code,
+        "parameters": message.parameters,
+        "callback_data": str(message.id),
+    }
+
+
+def dispatch(batch_size):
+    """
+    Claim a batch of due messages and send it
+    - returns {"sent", "failed", "deferred"} counts, all 0 when nothing was due
+    """
+    counts = {outbound.SENT: 0, outbound.FAILED: 0, outbound.DEFERRED: 0}
+    messages = claim(batch_size)
+    if not messages:
+        return counts
+    results = outbound.send([template_message(message) for message in messages])
+    now = timezone.now()
+    for message, (outcome, detail) in zip(messages, results):
+        if (
+            outcome == outbound.DEFERRED
+            and message.attempts >= settings.OUTBOX_MAX_ATTEMPTS
+        ):
+            outcome, detail = outbound.FAILED, {"error": "Deferred too many times"}
+        counts[outcome] += 1
+        message.claim = None
+        if outcome == outbound.SENT:
+            message.status = Status.SENT
+            message.sent_at = now
+            provider_message = detail.get("messages", [{}])[0]
+            message.provider_message_id = provider_message.get("id", "")
+        elif outcome == outbound.DEFERRED:
+            message.status = Status.PENDING
+            message.send_after = now + datetime.timedelta(seconds=detail)
+        else:
+            message.status = Status.FAILED
+            message.last_error = json.dumps(detail, default=str)
+    models.OutboxMessage.objects.bulk_update(
+        messages,
+        [
+            "status",
+            "claim",
+            "sent_at",
+            "provider_message_id",
+            "send_after",
+            "last_error",
+        ],
+    )
+    return counts
@@ -0,0 +1,37 @@
+from patient import models as patient_models
+
+
+def fetch_reminders(followups):
+    """
+    Everything needed to remind patients of `followups` (a FollowUp queryset),
+    in one query
+    - returns [{"followup_id", "phonenumber", "name", "title", "date", "time"}]
+    """
+    followups = followups.order_by("date", "time").values_list(
+        "id",
+        "complaint__user__phonenumber",
+        "complaint__user__name",
+        "title",
+        "date",
+        "time",
+    )
+    return [
+        {
+            "followup_id": str(followup_id),
+            "phonenumber": phonenumber,
+            "name": name,
+            "title": title,
+            "date": date,
+            "time": time,
+        }
+        for followup_id, phonenumber, name, title, date, time in followups
+    ]
+
+
+def fetch_reminders_by_date(date):
+    """
+    Reminders for the pending followups on `date` (on followups_pending_date_idx)
+    """
+    return fetch_reminders(
+        patient_models.FollowUp.objects.filter(date=date, completed=False)
+    )
@@ -0,0 +1,240 @@
+"""
+WhatsApp delivery statuses (sent, delivered, read, failed), from the Cloud
+API's status callbacks to the webhook (views.whatsapp_webhook)
+
+A bulk send is followed by a flood of callbacks, up to three per message
+within seconds. Rather than an UPDATE per callback they are buffered in
+memory, per process, and written together once WHATSAPP_STATUS_BATCH_SIZE
+have arrived or WHATSAPP_STATUS_FLUSH_INTERVAL seconds after the first of
+them, whichever comes first: one query to find their outbox messages, one
+bulk_update and one bulk_create.
+
+The webhook answers WhatsApp before a status is written, so statuses still
+buffered in a process that is killed are lost (they are written on a normal
+exit). A batch that fails to save is logged and put back, to be retried with
+the next flush. They are only reported on, nothing is sent because of them.
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+import atexit
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import uuid
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Statuses can arrive out of order, a message keeps the furthest along
+RANK = {"sent": 1, "delivered": 2, "read": 3, "failed": 4}
+
+
+def valid_signature(body, signature):
+    """
+    Whether `body` was signed with the app secret (X-Hub-Signature-256)
+    """
+    if not settings.WHATSAPP_APP_SECRET or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(
+        settings.WHATSAPP_APP_SECRET.encode("utf-8"), body, hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature.removeprefix("sha256="))
+
+
+def parse_statuses(payload):
+    """
+    The statuses in a webhook payload, ignoring anything else (e.g. incoming
+    messages) and statuses we don't know
+    - returns [{"provider_message_id", "status", "timestamp", "recipient",
+    "callback_data", "errors"}]
+    """
+    statuses = []
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for status in change.get("value", {}).get("statuses", []):
+                if status.get("status") not in RANK or not status.get("id"):
+                    continue
+                statuses.append(
+                    {
+                        "provider_message_id": status["id"],
+                        "status": status["status"],
+                        "timestamp": datetime.datetime.fromtimestamp(
+                            int(status.get("timestamp", 0)), datetime.timezone.utc
+                        ),
+                        "recipient": status.get("recipient_id", ""),
+                        "callback_data": status.get("biz_opaque_callback_data", ""),
+                        "errors": status.get("errors", []),
+                    }
+                )
+    return statuses
+
+
+def outbox_id(callback_data):
+    # Messages sent from the outbox carry their id (outbox.template_message)
+    try:
+        return uuid.UUID(callback_data)
+    except (TypeError, ValueError):
+        return None
+
+
+def save_statuses(statuses):
+    """
+    Record `statuses` and update the outbox messages they are about
+    - returns the number of outbox messages updated
+    """
+    ids = {outbox_id(status["callback_data"]) for status in statuses} - {None}
+    provider_ids = {status["provider_message_id"] for status in statuses}
+    with transaction.atomic():
+        # Locked in id order, so flushes from other processes touching the
+        # same messages wait rather than overwrite (or deadlock)
+        messages = list(
+            models.OutboxMessage.objects.select_for_update()
+            .filter(Q(id__in=ids) | Q(provider_message_id__in=provider_ids))
+            .order_by("id")
+        )
+        by_id = {message.id: message for message in messages}
+        by_provider_id = {
+            message.provider_message_id: message
+            for message in messages
+            if message.provider_message_id
+        }
+
+        updated, events = {}, []
+        for status in sorted(statuses, key=lambda status: status["timestamp"]):
+            message = by_id.get(
+                outbox_id(status["callback_data"])
+            ) or by_provider_id.get(status["provider_message_id"])
+            events.append(
+                models.MessageStatus(
+                    message=message,
+                    provider_message_id=status["provider_message_id"],
+                    status=status["status"],
+                    timestamp=status["timestamp"],
+                    recipient=status["recipient"],
+                    errors=status["errors"],
+                )
+            )
+            if message is None:
+                continue
+            updated[message.id] = message
+            # Sent, though its dispatcher died before recording it
+            if not message.provider_message_id:
+                message.provider_message_id = status["provider_message_id"]
+            if status["status"] == "delivered" and message.delivered_at is None:
+                message.delivered_at = status["timestamp"]
+            elif status["status"] == "read" and message.read_at is None:
+                message.read_at = status["timestamp"]
+            elif status["status"] == "failed":
+                message.last_error = json.dumps(status["errors"])
+            if RANK[status["status"]] > RANK.get(message.delivery_status, 0):
+                message.delivery_status = status["status"]
+
+        models.OutboxMessage.objects.bulk_update(
+            updated.values(),
+            [
+                "provider_message_id",
+                "delivery_status",
+                "delivered_at",
+                "read_at",
+                "last_error",
+            ],
+            batch_size=1000,
+        )
+        models.MessageStatus.objects.bulk_create(
+            events, batch_size=1000, ignore_conflicts=True
+        )
+    return len(updated)
+
+
+class StatusBuffer:
+    """
+    Statuses waiting to be saved, flushed on size (in the thread adding the
+    one that fills it) or on time (in a timer thread)
+    """
+
+    def __init__(self):
+        self.statuses = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, statuses):
+        with self.lock:
+            self.statuses.extend(statuses)
+            if len(self.statuses) >= settings.WHATSAPP_STATUS_BATCH_SIZE:
+                batch = self.take()
+            else:
+                batch = []
+                self.start_timer()
+        if batch:
+            self.save(batch)
+
+    def start_timer(self):
+        # Called holding the lock
+        if self.statuses and self.timer is None:
+            self.timer = threading.Timer(
+                settings.WHATSAPP_STATUS_FLUSH_INTERVAL, self.flush_on_timer
+            )
+            self.timer.daemon = True
+            self.timer.start()
+
+    def take(self):
+        # Called holding the lock
+        batch, self.statuses = self.statuses, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def flush(self):
+        """
+        Save whatever is buffered now
+        - returns the number of statuses saved
+        """
+        with self.lock:
+            batch = self.take()
+        if batch and not self.save(batch):
+            return 0
+        return len(batch)
+
+    def save(self, batch):
+        """
+        Save a batch taken from the buffer, putting it back in front of anything
+        added since if that fails (it is retried with the next flush)
+        - returns whether it was saved
+        """
+        try:
+            save_statuses(batch)
+        except Exception:
+            logger.exception("Couldn't save %d WhatsApp statuses", len(batch))
+            with self.lock:
+                self.statuses[:0] = batch
+                self.start_timer()
+            return False
+        return True
+
+    def flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+
+buffer = StatusBuffer()
+atexit.register(buffer.flush)
+
+
+def delivery_counts(messages):
+    """
+    How far `messages` (an OutboxMessage queryset) got
+    - returns {"sent", "delivered", "read", "failed", "unknown"} counts
+    """
+    counts = dict.fromkeys([*RANK, "unknown"], 0)
+    for row in messages.values("delivery_status").annotate(count=Count("id")):
+        counts[row["delivery_status"] or "unknown"] += row["count"]
+    return counts
@@ -0,0 +1,129 @@
+"""
+A stand-in for the WhatsApp Cloud API, for tests, benchmarks and local
+development (see the `whatsapp_stub_server` command). It accepts template
+messages, answers like the real API after `latency` seconds and keeps what it
+received in `messages`. New connections take `handshake` seconds more, like
+a TLS handshake would, and messages beyond `rate` per second are refused
+with 429 like the real API's throughput limit. With `stalling` set it takes
+messages but only answers after that many seconds, past a client's timeout.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import uuid
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients can reuse connections like with the real API
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, don't let the second one
+    # wait for the client's (delayed) ACK of the first
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        # A new connection, pretend to negotiate TLS
+        time.sleep(self.server.stub.handshake)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        stub = self.server.stub
+        time.sleep(stub.latency)
+        if stub.failing:
+            return self.reply(stub.failing, {"error": {"message": "Unavailable"}})
+        if stub.over_rate():
+            return self.reply(
+                429, {"error": {"code": 130429, "message": "Rate limit hit"}}
+            )
+        try:
+            message = json.loads(body)
+            recipient = message["to"]
+        except (ValueError, KeyError):
+            return self.reply(400, {"error": {"message": "Invalid payload"}})
+        with stub.lock:
+            stub.messages.append(message)
+        if stub.stalling:
+            time.sleep(stub.stalling)
+        self.reply(
+            200,
+            {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": recipient, "wa_id": recipient}],
+                "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+            },
+        )
+
+    def reply(self, status, body):
+        encoded = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting (stalling)
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubWhatsApp:
+    """
+    with StubWhatsApp(latency=0.05) as stub:
+        # point WHATSAPP_API_URL at stub.url
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, latency=0.0, handshake=0.0, rate=None
+    ):
+        self.latency = latency
+        self.handshake = handshake
+        # Messages per second accepted, the rest are answered 429
+        self.rate = rate
+        self.allowance = rate
+        self.allowance_at = time.monotonic()
+        self.throttled = 0
+        # Status to answer every message with, to simulate an outage
+        self.failing = None
+        # Seconds to wait before answering messages it has taken
+        self.stalling = None
+        self.messages = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        host, port = self.server.server_address[:2]
+        self.url = f"http://{host}:{port}/v1/messages"
+
+    def over_rate(self):
+        if self.rate is None:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(
+                self.rate, self.allowance + (now - self.allowance_at) * self.rate
+            )
+            self.allowance_at = now
+            if self.allowance >= 1:
+                self.allowance -= 1
+                return False
+            self.throttled += 1
+            return True
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
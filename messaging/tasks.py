@@ -1,100 +1,55 @@
-# from celery import shared_task
-# from django.utils import timezone
-# from myapp.models import Appointment  # Import your model 
-# import json
-# import urllib.request
-# from django.conf import settings
-
-# @shared_task
-# def send_whatsapp_reminder():
-#     """
-#     Fetch appointments from the database and send reminders via WhatsApp API.
-#     Runs 24 hours before the appointment time.
-#     """
-#     now = timezone.now()
-#     reminder_time = now + timezone.timedelta(days=1)  # 24 hours before
-
-#     # Get appointments scheduled for tomorrow
-#     appointments = Appointment.objects.filter(followup_datetime__date=reminder_time.date())
-
-#     for appointment in appointments:
-#         phone_number = appointment.patient_phone
-#         template_name = "appointment_reminder"
-#         language_code = "en_US"
-
-#         payload = json.dumps({
-#             "messaging_product": "whatsapp",
-#             "to": phone_number,
-#             "type": "template",
-#             "template": {
-#                 "name": template_name,
-#                 "language": {"code": language_code},
-#             },
-#         }).encode("utf-8")
-
-#         headers = {
-#             "Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}",
-#             "Content-Type": "application/json",
-#         }
-
-#         try:
-#             req = urllib.request.Request(settings.WHATSAPP_API_URL, data=payload, headers=headers, method="POST")
-#             with urllib.request.urlopen(req) as response:
-#                 response.read()
-#         except Exception as e:
-#             print(f"Failed to send message to {phone_number}: {e}")
-
-#     return f"Sent {len(appointments)} reminders"
-
 from celery import shared_task
-from django.utils import timezone
-import json
-import urllib.request
 from django.conf import settings
+import datetime
+
+from . import outbound, outbox, services, whatsapp
+
 
 @shared_task
-def send_whatsapp_message():
+def send_whatsapp_message(
+    phone_number, template_name="hello_world", language_code="en_US"
+):
     """
-    Send a WhatsApp message using the WhatsApp Cloud API.
+    Send a single WhatsApp template message
+    - returns {"response": ...} or {"error": ..., "status": ...}
     """
+    response, error_status = whatsapp.send_template(
+        phone_number, template_name, language_code
+    )
+    if error_status:
+        return {"error": response, "status": error_status}
+    return {"response": response}
 
-    try:
-        phone_number = "91XXXXXXXXXX" # Change this to your phone number
-        template_name = "hello_world"
-        language_code = "en_US"
 
-        # WhatsApp API payload
-        payload = json.dumps(
-            {
-                "messaging_product": "whatsapp",
-                "to": phone_number,
-                "type": "template",
-                "template": {
-                    "name": template_name,
-                    "language": {"code": language_code},
-                },
-            }
-        ).encode("utf-8")
-
-        # Headers
-        headers = {
-            "Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}",
-            "Content-Type": "application/json",
-        }
-
-        # Create API request
-        req = urllib.request.Request(
-            settings.WHATSAPP_API_URL, data=payload, headers=headers, method="POST"
-        )
-
-        # Send API request
-        with urllib.request.urlopen(req) as response:
-            result = response.read().decode("utf-8")
-            
+@shared_task
+def send_followup_reminders(days_ahead=1):
+    """
+    Run by beat every evening (CELERY_BEAT_SCHEDULE): make sure all of
+    tomorrow's pending followups have a reminder in the outbox (followups
+    saved before it existed included), then start OUTBOX_DISPATCHERS
+    dispatchers to share sending them
+    - returns the number of pending followups
+    """
+    date = datetime.date.today() + datetime.timedelta(days=days_ahead)
+    reminders = services.fetch_reminders_by_date(date)
+    outbox.schedule_reminders(reminders)
+    for _ in range(settings.OUTBOX_DISPATCHERS):
+        dispatch_outbox.delay()
+    return len(reminders)
 
-    except urllib.error.HTTPError as e:
-        error_message = e.read().decode("utf-8")
-        return Response(json.loads(error_message), status=e.code)
 
-    except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+@shared_task
+def dispatch_outbox():
+    """
+    Send due outbox messages, a batch at a time, until none are left. Run by
+    beat every minute, any number can run at once (see outbox.py)
+    - returns {"sent": <int>, "failed": <int>, "deferred": <int>}
+    """
+    outbox.expire_claims()
+    totals = {outbound.SENT: 0, outbound.FAILED: 0, outbound.DEFERRED: 0}
+    while True:
+        counts = outbox.dispatch(settings.OUTBOX_BATCH_SIZE)
+        if not any(counts.values()):
+            return totals
+        for outcome, count in counts.items():
+            totals[outcome] += count
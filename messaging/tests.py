@@ -1,3 +1,337 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import json
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from authentication.models import User
+from patient import models as patient_models
+from patient import services as patient_services
+from . import models, outbound, outbox, services, statuses
+from .stub_server import StubWhatsApp
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patient = User.objects.create(
+            name="John Doe", phonenumber=7880589921, role="patient"
+        )
+        complaint = patient_models.Complaint.objects.create(
+            user=patient, complaint="tooth-ache"
+        )
+        self.tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        for number, date, completed in (
+            (1, self.tomorrow, False),
+            (2, self.tomorrow, True),
+            (3, self.tomorrow + datetime.timedelta(days=1), False),
+        ):
+            patient_models.FollowUp.objects.create(
+                complaint=complaint,
+                date=date,
+                time=datetime.time(11, 30),
+                title=f"sitting {number}",
+                number=number,
+                completed=completed,
+            )
+
+    def test_reminders_are_sent_once(self):
+        """
+        1. Only tomorrow's pending followups, in one query
+        2. Scheduling them twice leaves one outbox row each
+        3. Dispatch sends them to the patient's number (with country code) as
+        the reminder template and records WhatsApp's message id
+        4. Nothing is claimed (or sent) again
+        """
+        # 1. selection
+        with self.assertNumQueries(1):
+            reminders = services.fetch_reminders_by_date(self.tomorrow)
+        self.assertEqual([reminder["title"] for reminder in reminders], ["sitting 1"])
+
+        # 2. dedupe
+        outbox.schedule_reminders(reminders, send_after=timezone.now())
+        outbox.schedule_reminders(reminders, send_after=timezone.now())
+        self.assertEqual(models.OutboxMessage.objects.count(), 1)
+
+        with StubWhatsApp() as stub, override_settings(WHATSAPP_API_URL=stub.url):
+            # 3. dispatch
+            self.assertEqual(
+                outbox.dispatch(10), {"sent": 1, "failed": 0, "deferred": 0}
+            )
+            message = stub.messages[0]
+            self.assertEqual(message["to"], "917880589921")
+            self.assertEqual(message["template"]["name"], "appointment_reminder")
+            self.assertEqual(
+                message["template"]["components"][0]["parameters"][1]["text"],
+                "sitting 1",
+            )
+            row = models.OutboxMessage.objects.get()
+            self.assertEqual(row.status, "sent")
+            self.assertTrue(row.provider_message_id.startswith("wamid."))
+
+            # 4. at most once
+            self.assertEqual(
+                outbox.dispatch(10), {"sent": 0, "failed": 0, "deferred": 0}
+            )
+            self.assertEqual(len(stub.messages), 1)
+
+    @override_settings(WHATSAPP_READ_TIMEOUT=0.2, WHATSAPP_BACKOFF_BASE=0)
+    def test_timed_out_reminder_is_not_resent(self):
+        """
+        1. The API takes the message but doesn't answer in time: it fails
+        without a retry, as it may have been sent
+        2. Later dispatches don't send it again
+        """
+        reminders = services.fetch_reminders_by_date(self.tomorrow)
+        outbox.schedule_reminders(reminders, send_after=timezone.now())
+
+        with StubWhatsApp() as stub, override_settings(WHATSAPP_API_URL=stub.url):
+            # 1. timed out
+            stub.stalling = 1
+            self.assertEqual(
+                outbox.dispatch(10), {"sent": 0, "failed": 1, "deferred": 0}
+            )
+            self.assertEqual(len(stub.messages), 1)
+            self.assertEqual(models.OutboxMessage.objects.get().status, "failed")
+
+            # 2. not resent
+            stub.stalling = None
+            outbox.dispatch(10)
+            self.assertEqual(len(stub.messages), 1)
+
+    def test_reminders_follow_followup_changes(self):
+        """
+        1. Creating a followup schedules its reminder for the evening before
+        2. Moving it cancels that reminder and schedules another
+        3. Completing it cancels the reminder
+        """
+        complaint = patient_models.Complaint.objects.get()
+        date = datetime.date.today() + datetime.timedelta(days=5)
+        followup = {
+            "title": "sitting 4",
+            "description": "",
+            "date": date,
+            "time": datetime.time(10),
+            "number": 4,
+        }
+
+        # 1. created
+        patient_services.create_followup(str(complaint.id), followup)
+        reminder = models.OutboxMessage.objects.get(status="pending")
+        self.assertEqual(
+            timezone.localtime(reminder.send_after),
+            timezone.make_aware(
+                datetime.datetime.combine(
+                    date - datetime.timedelta(days=1), datetime.time(18)
+                )
+            ),
+        )
+
+        # 2. moved
+        followup["id"] = patient_models.FollowUp.objects.get(number=4).id
+        followup["date"] = date + datetime.timedelta(days=1)
+        followup["completed"] = False
+        patient_services.update_followup(followup)
+        self.assertEqual(
+            models.OutboxMessage.objects.get(id=reminder.id).status, "cancelled"
+        )
+        self.assertTrue(
+            models.OutboxMessage.objects.get(status="pending").dedupe_key.endswith(
+                str(followup["date"])
+            )
+        )
+
+        # 3. completed
+        followup["completed"] = True
+        patient_services.update_followup(followup)
+        self.assertFalse(models.OutboxMessage.objects.filter(status="pending").exists())
+
+
+class OutboundTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_bucket(self):
+        """
+        1. A full bucket gives out up to its burst
+        2. An empty one gives nothing, and says when the next token is due
+        """
+        # 1. burst
+        taken, _ = outbound.take_tokens("test", 5, rate=1, burst=3)
+        self.assertEqual(taken, 3)
+
+        # 2. empty
+        taken, wait = outbound.take_tokens("test", 5, rate=1, burst=3)
+        self.assertEqual(taken, 0)
+        self.assertTrue(0 < wait <= 1)
+
+    @override_settings(
+        WHATSAPP_MAX_ATTEMPTS=2,
+        WHATSAPP_BACKOFF_BASE=0,
+        WHATSAPP_CIRCUIT_THRESHOLD=2,
+    )
+    def test_failing_api_opens_the_circuit(self):
+        """
+        1. 5xx are retried, and enough of them open the circuit
+        2. While it's open nothing is sent, messages are deferred
+        3. A recipient messaged moments ago is deferred
+        """
+        messages = [
+            {
+                "phonenumber": phonenumber,
+                "template_name": "hello_world",
+                "language_code": "en_US",
+            }
+            for phonenumber in (7880589921, 7880589922)
+        ]
+        with StubWhatsApp() as stub, override_settings(WHATSAPP_API_URL=stub.url):
+            # 1. failing
+            stub.failing = 503
+            results = outbound.send(messages)
+            self.assertNotIn(outbound.SENT, [outcome for outcome, _ in results])
+            self.assertGreater(outbound.circuit_wait(), 0)
+
+            # 2. open
+            stub.failing = None
+            cache.clear()
+            cache.set(outbound.CIRCUIT_KEY, time.time() + 60)
+            ((outcome, wait),) = outbound.send(messages[:1])
+            self.assertEqual(outcome, outbound.DEFERRED)
+            self.assertGreater(wait, 50)
+            self.assertEqual(stub.messages, [])
+
+            # 3. recipient limit
+            cache.delete(outbound.CIRCUIT_KEY)
+            ((outcome, _),) = outbound.send(messages[:1])
+            self.assertEqual(outcome, outbound.DEFERRED)
+            ((outcome, _),) = outbound.send(messages[1:])
+            self.assertEqual(outcome, outbound.SENT)
+
+
+@override_settings(
+    WHATSAPP_APP_SECRET="secret",
+    WHATSAPP_VERIFY_TOKEN="token",
+    WHATSAPP_STATUS_BATCH_SIZE=100,
+    WHATSAPP_STATUS_FLUSH_INTERVAL=60,
+)
+class WebhookTests(TestCase):
+    def setUp(self):
+        self.message = models.OutboxMessage.objects.create(
+            dedupe_key="reminder:test",
+            recipient=7880589921,
+            template="appointment_reminder",
+            language_code="en_US",
+            status="sent",
+            provider_message_id="wamid.1",
+        )
+
+    def callback(self, status, timestamp, signature=None):
+        body = json.dumps(
+            {
+                "object": "whatsapp_business_account",
+                "entry": [
+                    {
+                        "changes": [
+                            {
+                                "field": "messages",
+                                "value": {
+                                    "statuses": [
+                                        {
+                                            "id": "wamid.1",
+                                            "status": status,
+                                            "timestamp": str(timestamp),
+                                            "recipient_id": "917880589921",
+                                            "biz_opaque_callback_data": str(
+                                                self.message.id
+                                            ),
+                                        }
+                                    ]
+                                },
+                            }
+                        ]
+                    }
+                ],
+            }
+        ).encode("utf-8")
+        return self.post(body, signature)
+
+    def post(self, body, signature=None):
+        if signature is None:
+            digest = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+            signature = f"sha256={digest}"
+        return self.client.post(
+            "/m/webhook/",
+            body,
+            content_type="application/json",
+            headers={"X-Hub-Signature-256": signature},
+        )
+
+    def test_statuses_are_saved_in_batches(self):
+        """
+        1. Meta verifying the subscription gets its challenge back
+        2. Callbacks not signed with the app secret are rejected
+        3. Signed ones are buffered, not written one by one
+        4. A flush saves them: out of order and repeated, the message ends up
+        read, each status recorded once
+        """
+        # 1. verification
+        response = self.client.get(
+            "/m/webhook/",
+            {
+                "hub.mode": "subscribe",
+                "hub.verify_token": "token",
+                "hub.challenge": "42",
+            },
+        )
+        self.assertEqual(response.content, b"42")
+
+        # 2. signature
+        response = self.callback("read", 1, signature="sha256=00")
+        self.assertEqual(response.status_code, 403)
+
+        # 3. buffered
+        callbacks = (("delivered", 2), ("read", 3), ("sent", 1), ("read", 3))
+        for status, timestamp in callbacks:
+            self.assertEqual(self.callback(status, timestamp).status_code, 200)
+        self.assertFalse(models.MessageStatus.objects.exists())
+
+        # 4. flush
+        self.assertEqual(statuses.buffer.flush(), 4)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.delivery_status, "read")
+        self.assertEqual(self.message.delivered_at.timestamp(), 2)
+        self.assertEqual(self.message.read_at.timestamp(), 3)
+        self.assertEqual(self.message.statuses.count(), 3)
+
+    def test_failed_save_keeps_the_statuses(self):
+        """
+        1. Signed bodies that aren't a JSON object: 400
+        2. A batch that fails to save stays buffered, the webhook still says 200
+        3. The next flush saves it
+        """
+        # 1. not an object
+        for body in (b"[]", b"1", b'"entry"'):
+            self.assertEqual(self.post(body).status_code, 400)
+
+        # 2. failed save
+        with (
+            override_settings(WHATSAPP_STATUS_BATCH_SIZE=2),
+            mock.patch.object(
+                statuses, "save_statuses", side_effect=DatabaseError("down")
+            ),
+            self.assertLogs("messaging.statuses", "ERROR"),
+        ):
+            self.assertEqual(self.callback("delivered", 2).status_code, 200)
+            self.assertEqual(self.callback("read", 3).status_code, 200)
+        self.assertEqual(len(statuses.buffer.statuses), 2)
+
+        # 3. retried
+        self.assertEqual(statuses.buffer.flush(), 2)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.delivery_status, "read")
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path("sendwhatsapp/", views.send_whatsapp_message),
+    path("webhook/", views.whatsapp_webhook),
 ]
\ No newline at end of file
@@ -1,9 +1,17 @@
-from rest_framework.decorators import api_view, permission_classes
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+    renderer_classes,
+)
 from rest_framework import permissions, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.conf import settings
 import json
-import urllib.request
+
+from . import statuses, whatsapp
 
 
 @api_view(["POST"])
@@ -12,50 +20,68 @@ def send_whatsapp_message(request):
     """
     Send a WhatsApp message using the WhatsApp Cloud API.
     """
-    try:
-        # Extract data from request
-        phone_number = request.data.get("phone_number")
-        template_name = request.data.get("template_name", "hello_world")
-        language_code = request.data.get("language_code", "en_US")
-
-        if not phone_number:
-            return Response(
-                {"error": "Phone number is required"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        # WhatsApp API payload
-        payload = json.dumps(
-            {
-                "messaging_product": "whatsapp",
-                "to": phone_number,
-                "type": "template",
-                "template": {
-                    "name": template_name,
-                    "language": {"code": language_code},
-                },
-            }
-        ).encode("utf-8")
-
-        # Headers
-        headers = {
-            "Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}",
-            "Content-Type": "application/json",
-        }
-
-        # Create API request
-        req = urllib.request.Request(
-            settings.WHATSAPP_API_URL, data=payload, headers=headers, method="POST"
+    # Extract data from request
+    phone_number = request.data.get("phone_number")
+    template_name = request.data.get("template_name", "hello_world")
+    language_code = request.data.get("language_code", "en_US")
+
+    if not phone_number:
+        return Response(
+            {"error": "Phone number is required"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
-        # Send API request
-        with urllib.request.urlopen(req) as response:
-            result = response.read().decode("utf-8")
-            return Response(json.loads(result), status=status.HTTP_200_OK)
+    response, error_status = whatsapp.send_template(
+        phone_number, template_name, language_code
+    )
+    if error_status == whatsapp.MAYBE_SENT:
+        return Response(response, status=status.HTTP_504_GATEWAY_TIMEOUT)
+    if error_status:
+        return Response(response, status=error_status)
+    return Response(response, status=status.HTTP_200_OK)
 
-    except urllib.error.HTTPError as e:
-        error_message = e.read().decode("utf-8")
-        return Response(json.loads(error_message), status=e.code)
 
-    except Exception as e:
-        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+@api_view(["GET", "POST"])
+@authentication_classes(())
+@permission_classes((permissions.AllowAny,))
+@renderer_classes((JSONRenderer,))
+def whatsapp_webhook(request):
+    """
+    Webhook for the WhatsApp Cloud API
+    1. GET: Meta verifying the subscription, answered with its challenge when
+    the verify token is WHATSAPP_VERIFY_TOKEN
+    2. POST: callbacks signed with the app secret (X-Hub-Signature-256), their
+    delivery statuses are saved in batches (see statuses.py)
+    3. POST not signed: 403 FORBIDDEN
+    4. POST of anything but a JSON object: 400 BAD REQUEST
+    """
+    if request.method == "GET":
+        if (
+            settings.WHATSAPP_VERIFY_TOKEN
+            and request.query_params.get("hub.mode") == "subscribe"
+            and request.query_params.get("hub.verify_token")
+            == settings.WHATSAPP_VERIFY_TOKEN
+        ):
+            return HttpResponse(request.query_params.get("hub.challenge", ""))
+        return Response(
+            {"error": "Invalid verify token"}, status=status.HTTP_403_FORBIDDEN
+        )
+
+    # Signed over the raw body, so read before (and instead of) request.data
+    body = request.body
+    if not statuses.valid_signature(
+        body, request.headers.get("X-Hub-Signature-256", "")
+    ):
+        return Response(
+            {"error": "Invalid signature"}, status=status.HTTP_403_FORBIDDEN
+        )
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return Response({"error": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(payload, dict):
+        return Response(
+            {"error": "Expected a JSON object"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    statuses.buffer.add(statuses.parse_statuses(payload))
+    return Response(status=status.HTTP_200_OK)
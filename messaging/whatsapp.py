@@ -0,0 +1,148 @@
+"""
+WhatsApp Cloud API client, used by the view and the tasks
+
+Connections to the API are kept alive and reused, so only the first message
+on each one pays for the TCP and TLS handshake:
+
+- `send_template` sends one message over a per-process `httpx.Client`
+- `post_template` sends one over an `async_client()`, for bulk sends from
+  an event loop (rate limited and retried by outbound.py), with at most
+  WHATSAPP_CONCURRENCY connections per client
+
+Timeouts are WHATSAPP_CONNECT_TIMEOUT and WHATSAPP_READ_TIMEOUT.
+"""
+
+from django.conf import settings
+import httpx
+import threading
+
+client = None
+client_lock = threading.Lock()
+
+
+def client_options():
+    return {
+        "headers": {"Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}"},
+        "timeout": httpx.Timeout(
+            settings.WHATSAPP_READ_TIMEOUT, connect=settings.WHATSAPP_CONNECT_TIMEOUT
+        ),
+        "limits": httpx.Limits(
+            max_connections=settings.WHATSAPP_CONCURRENCY,
+            max_keepalive_connections=settings.WHATSAPP_CONCURRENCY,
+        ),
+    }
+
+
+def get_client():
+    # Created on first use, so forked (celery) workers don't share sockets
+    global client
+    with client_lock:
+        if client is None:
+            client = httpx.Client(**client_options())
+        return client
+
+
+def to_whatsapp_number(phonenumber):
+    """
+    Phonenumbers are stored without a country code, WhatsApp wants one
+    """
+    phonenumber = str(phonenumber)
+    if len(phonenumber) == 10:
+        return f"{settings.WHATSAPP_COUNTRY_CODE}{phonenumber}"
+    return phonenumber
+
+
+def template_payload(
+    phonenumber, template_name, language_code, parameters=(), callback_data=None
+):
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": to_whatsapp_number(phonenumber),
+        "type": "template",
+        "template": {"name": template_name, "language": {"code": language_code}},
+    }
+    if callback_data:
+        # Echoed back in status webhooks, to tell which message they are about
+        payload["biz_opaque_callback_data"] = callback_data
+    if parameters:
+        payload["template"]["components"] = [
+            {
+                "type": "body",
+                "parameters": [
+                    {"type": "text", "text": str(parameter)}
+                    for parameter in parameters
+                ],
+            }
+        ]
+    return payload
+
+
+def parse_response(response):
+    try:
+        body = response.json()
+    except ValueError:
+        body = {"error": response.text}
+    if response.is_success:
+        return body, None
+    return body, response.status_code
+
+
+# No response, but the request may have reached the API and been sent (e.g.
+# timed out reading the response), so it mustn't be sent again
+MAYBE_SENT = 599
+
+# Failed before the request left, safe to send again
+NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def request_error(error):
+    if isinstance(error, NOT_SENT):
+        return {"error": str(error) or type(error).__name__}, 503
+    return {"error": str(error) or type(error).__name__}, MAYBE_SENT
+
+
+def send_template(phonenumber, template_name, language_code, parameters=()):
+    """
+    Send a template message
+    1. Sent: returns API response, None
+    2. API refused it: returns API error body, status code
+    3. API unreachable: returns {"error": ...}, 503
+    4. No response after sending (e.g. read timeout): returns {"error": ...},
+    MAYBE_SENT
+    """
+    try:
+        response = get_client().post(
+            settings.WHATSAPP_API_URL,
+            json=template_payload(
+                phonenumber, template_name, language_code, parameters
+            ),
+        )
+    except httpx.HTTPError as error:
+        return request_error(error)
+    return parse_response(response)
+
+
+def async_client():
+    return httpx.AsyncClient(**client_options())
+
+
+def retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def post_template(client, message):
+    """
+    Send a template message from an event loop (see outbound.py)
+    - message: keyword arguments of `template_payload`
+    - returns as `send_template`, and the Retry-After the API asked for
+    """
+    try:
+        response = await client.post(
+            settings.WHATSAPP_API_URL, json=template_payload(**message)
+        )
+    except httpx.HTTPError as error:
+        return *request_error(error), None
+    return *parse_response(response), retry_after(response)
@@ -0,0 +1,207 @@
+"""
+Synthetic data helpers shared by the benchmark commands (not a command)
+"""
+
+import datetime
+import random
+import statistics
+
+from django.utils import timezone
+
+from authentication import jsonwebtokens
+from authentication.models import User, normalize_name
+from dentistAPI.ids import uuid7
+from doctor import models as doc_models
+from patient import models
+
+# Synthetic patients get their own block of phonenumbers so that they can
+# be told apart from real ones and removed afterwards
+SYNTHETIC_PHONE_START = 6000000000
+SYNTHETIC_PHONE_END = 6099999999
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Akash", "Ananya", "Arjun", "Bhavna", "Chetan", "Deepa",
+    "Divya", "Gaurav", "Harsh", "Ishita", "Karan", "Kavya", "Manish", "Meera",
+    "Neha", "Nikhil", "Pooja", "Priya", "Rahul", "Riya", "Rohan", "Sakshi",
+    "Sanjay", "Shreya", "Sneha", "Suresh", "Tanvi", "Varun", "Vikram", "Yash",
+]
+LAST_NAMES = [
+    "Agarwal", "Bansal", "Chauhan", "Desai", "Gupta", "Iyer", "Jain", "Joshi",
+    "Kapoor", "Khan", "Kulkarni", "Mehta", "Mishra", "Nair", "Patel", "Pillai",
+    "Rao", "Reddy", "Saxena", "Shah", "Sharma", "Singh", "Sinha", "Verma",
+]
+
+
+def synthetic_users():
+    return User.objects.filter(
+        phonenumber__gte=SYNTHETIC_PHONE_START, phonenumber__lte=SYNTHETIC_PHONE_END
+    )
+
+
+def random_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def seed_patients(count, batch_size=5000):
+    """
+    Top the synthetic patients up to `count` rows (User + Details)
+    - returns the number of patients created
+    """
+    existing = synthetic_users().count()
+    rng = random.Random(existing)
+    created = 0
+    while existing + created < count:
+        users, details = [], []
+        for offset in range(min(batch_size, count - existing - created)):
+            name = random_name(rng)
+            user = User(
+                id=uuid7(),
+                name=name,
+                search_name=normalize_name(name),
+                phonenumber=SYNTHETIC_PHONE_START + existing + created + offset,
+                role="patient",
+                password="",
+            )
+            users.append(user)
+            details.append(
+                models.Details(
+                    id=user,
+                    date_of_birth=datetime.date(rng.randint(1950, 2015), 1, 1),
+                    address="Synthetic address",
+                    gender=rng.choice("MF"),
+                )
+            )
+        User.objects.bulk_create(users)
+        models.Details.objects.bulk_create(details)
+        created += len(users)
+    return created
+
+
+def seed_sittings(count, prescriptions_per_sitting=5, followup_date=None):
+    """
+    A complaint (today) with one followup (a week later, unless
+    `followup_date`) and prescriptions for each of the first `count`
+    synthetic patients, patients are seeded as needed
+    - returns [(complaint_id, sitting)] for the followups
+    """
+    if followup_date is None:
+        followup_date = datetime.date.today() + datetime.timedelta(days=7)
+    seed_patients(count)
+    catalog = [
+        doc_models.Prescription.objects.get_or_create(
+            name=f"Synthetic drug {number}",
+            defaults={"type": "Medication" if number % 3 else "Gel"},
+        )[0]
+        for number in range(prescriptions_per_sitting)
+    ]
+    complaints, followups, prescriptions = [], [], []
+    for user in synthetic_users().order_by("phonenumber")[:count]:
+        complaint = models.Complaint(
+            id=uuid7(), user=user, complaint="Synthetic toothache"
+        )
+        complaints.append(complaint)
+        followups.append(
+            models.FollowUp(
+                complaint=complaint,
+                date=followup_date,
+                time=datetime.time(11, 30),
+                title="Synthetic followup",
+                number=1,
+            )
+        )
+        for sitting in (0, 1):
+            prescriptions.extend(
+                models.PatientPrescription(
+                    complaint=complaint,
+                    sitting=sitting,
+                    prescription=prescription,
+                    days=5,
+                    dosage="BD",
+                )
+                for prescription in catalog
+            )
+    models.Complaint.objects.bulk_create(complaints)
+    models.FollowUp.objects.bulk_create(followups)
+    models.PatientPrescription.objects.bulk_create(prescriptions)
+    return [(followup.complaint_id, followup.number) for followup in followups]
+
+
+def seed_history(days, per_day, batch_size=5000):
+    """
+    `per_day` complaints (each with a followup a week later) for every one
+    of the last `days` days, spread over the synthetic patients
+    - returns the number of complaints created
+    """
+    existing = models.Complaint.objects.filter(
+        complaint="Synthetic history", user__in=synthetic_users()
+    ).count()
+    count = days * per_day
+    if existing >= count:
+        return 0
+    seed_patients(min(count, 10_000))
+    users = list(synthetic_users().values_list("id", flat=True)[:10_000])
+    rng = random.Random(count)
+    today = datetime.date.today()
+    for start in range(existing, count, batch_size):
+        complaints, followups = [], []
+        for index in range(start, min(start + batch_size, count)):
+            date = today - datetime.timedelta(days=index // per_day)
+            time = datetime.time(rng.randint(9, 19), rng.choice((0, 15, 30, 45)))
+            complaint = models.Complaint(
+                id=uuid7(),
+                user_id=users[index % len(users)],
+                complaint="Synthetic history",
+                date=date,
+                time=time,
+                created_at=timezone.make_aware(datetime.datetime.combine(date, time)),
+            )
+            complaints.append(complaint)
+            followups.append(
+                models.FollowUp(
+                    complaint=complaint,
+                    date=date + datetime.timedelta(days=7),
+                    time=time,
+                    title="Synthetic followup",
+                    number=1,
+                    completed=date + datetime.timedelta(days=7) < today,
+                )
+            )
+        # date/time are auto_now_add, so insert first and then backdate
+        backdated = [
+            models.Complaint(id=complaint.id, date=complaint.date, time=complaint.time)
+            for complaint in complaints
+        ]
+        models.Complaint.objects.bulk_create(complaints)
+        models.Complaint.objects.bulk_update(
+            backdated, ["date", "time"], batch_size=1000
+        )
+        models.FollowUp.objects.bulk_create(followups)
+    return count - existing
+
+
+def remove_patients():
+    deleted, _ = synthetic_users().delete()
+    doc_models.Prescription.objects.filter(name__startswith="Synthetic drug ").delete()
+    return deleted
+
+
+def staff_headers(role="dentist"):
+    """
+    Headers for test-client requests, JSON so the browsable API isn't rendered
+    """
+    token = jsonwebtokens.create_jwt(
+        role=role, phonenumber=SYNTHETIC_PHONE_START, name="Benchmark"
+    )
+    return {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+
+
+def summarize(samples):
+    """
+    p50/p95 in milliseconds for a list of durations in seconds
+    """
+    ordered = sorted(samples)
+    p95_index = max(0, round(0.95 * len(ordered)) - 1)
+    return {
+        "p50": statistics.median(ordered) * 1000,
+        "p95": ordered[p95_index] * 1000,
+    }
@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from patient import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Set complaints.created_at/updated_at from the registered date and time "
+        "for complaints saved before those columns existed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs["batch_size"]
+        # Rows added before the columns got the migration's time instead
+        complaints = models.Complaint.objects.exclude(
+            created_at__date=F("date")
+        ).only("id", "date", "time")
+        batch, updated = [], 0
+        for complaint in complaints.iterator(chunk_size=batch_size):
+            complaint.created_at = timezone.make_aware(
+                datetime.datetime.combine(complaint.date, complaint.time)
+            )
+            complaint.updated_at = complaint.created_at
+            batch.append(complaint)
+            if len(batch) == batch_size:
+                updated += models.Complaint.objects.bulk_update(
+                    batch, ["created_at", "updated_at"]
+                )
+                batch = []
+        if batch:
+            updated += models.Complaint.objects.bulk_update(
+                batch, ["created_at", "updated_at"]
+            )
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} complaints"))
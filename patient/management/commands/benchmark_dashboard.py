@@ -0,0 +1,77 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+
+from patient import models, utils
+from ._synthetic import remove_patients, seed_history, staff_headers, summarize
+
+DATE_INDEXES = ("complaints_created_at_idx", "followups_date_idx")
+
+
+class Command(BaseCommand):
+    help = (
+        "Dashboard latency (today's complaints and followups) over years of "
+        "history, with and without the date indexes. The run without indexes "
+        "drops them inside a transaction that is rolled back, which locks the "
+        "tables meanwhile: don't run this against a live database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=int, default=3)
+        parser.add_argument("--per-day", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        client = Client(SERVER_NAME="localhost")
+        headers = staff_headers()
+        self.stdout.write("Seeding history...")
+        seed_history(kwargs["years"] * 365, kwargs["per_day"])
+        today = datetime.date.today()
+        start, end = utils.day_range(today)
+        queries = {
+            "complaints": models.Complaint.objects.select_related(
+                "user", "user__details"
+            ).filter(created_at__gte=start, created_at__lt=end),
+            "followups": models.FollowUp.objects.select_related(
+                "complaint", "complaint__user", "complaint__user__details"
+            ).filter(date=today),
+        }
+        # Postgres can run the query and time it, sqlite can only plan it
+        explain_options = {"analyze": True} if connection.vendor == "postgresql" else {}
+
+        def measure(label):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            for name, url in (
+                ("complaints", "/p/complaints/"),
+                ("followups", "/p/followup/"),
+            ):
+                client.get(url, headers=headers)
+                samples = []
+                for _ in range(kwargs["requests"]):
+                    start = time.perf_counter()
+                    response = client.get(url, headers=headers)
+                    samples.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.status_code
+                latency = summarize(samples)
+                self.stdout.write(
+                    f"{name:>10}: p50 {latency['p50']:.1f} ms, "
+                    f"p95 {latency['p95']:.1f} ms"
+                )
+                self.stdout.write(queries[name].explain(**explain_options))
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for name in DATE_INDEXES:
+                    cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+            measure("Without date indexes")
+            transaction.set_rollback(True)
+        measure("With date indexes")
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
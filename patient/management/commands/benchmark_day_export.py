@@ -0,0 +1,49 @@
+import datetime
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from ._synthetic import remove_patients, seed_sittings, staff_headers
+
+
+class Command(BaseCommand):
+    help = "Time to export one day's prescriptions as a single PDF"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sittings", type=int, default=200)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        client = Client(SERVER_NAME="localhost")
+        headers = staff_headers()
+        # Synthetic complaints are registered today
+        seed_sittings(kwargs["sittings"])
+        url = f"/p/prescription/pdf/day/{datetime.date.today()}/"
+
+        def export():
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200, response.status_code
+            return sum(len(chunk) for chunk in response.streaming_content)
+
+        start = time.perf_counter()
+        size = export()
+        elapsed = time.perf_counter() - start
+
+        # Separate run, tracing allocations slows everything down
+        tracemalloc.start()
+        export()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(
+            f"{kwargs['sittings']} sittings: {elapsed:.2f} s "
+            f"({elapsed / kwargs['sittings'] * 1000:.1f} ms each), "
+            f"{size / 1024:.0f} KB PDF, {peak / (1024 * 1024):.1f} MB peak"
+        )
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
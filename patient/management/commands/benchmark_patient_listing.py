@@ -0,0 +1,69 @@
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from patient import models
+from ._synthetic import remove_patients, seed_patients, staff_headers
+
+
+def peak_memory(run):
+    """
+    Peak python heap allocated (in MB) while `run` executes
+    """
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = "Peak per-request memory of listing all patients as the table grows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+        )
+        parser.add_argument(
+            "--skip-legacy",
+            action="store_true",
+            help="Don't load the whole table the old way (slow at large sizes)",
+        )
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        client = Client(SERVER_NAME="localhost")
+        headers = staff_headers()
+
+        def first_page():
+            client.get("/p/", {"page_size": 50}, headers=headers)
+
+        def full_stream():
+            response = client.get("/p/", {"stream": "ndjson"}, headers=headers)
+            for _ in response.streaming_content:
+                pass
+
+        def legacy():
+            # What the old fallback branch serialized in a single response
+            list(models.Details.objects.all().values_list())
+
+        # Warm up imports and url resolution so they don't count as request memory
+        first_page()
+        self.stdout.write(
+            f"{'patients':>10} | {'page':>10} | {'ndjson stream':>14} | {'legacy':>10}"
+        )
+        for size in sorted(kwargs["sizes"]):
+            seed_patients(size)
+            legacy_peak = "-" if kwargs["skip_legacy"] else f"{peak_memory(legacy):.1f}"
+            self.stdout.write(
+                f"{size:>10} | {peak_memory(first_page):>7.1f} MB | "
+                f"{peak_memory(full_stream):>11.1f} MB | {legacy_peak:>7} MB"
+            )
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
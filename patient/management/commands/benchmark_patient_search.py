@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from patient import models, services
+from ._synthetic import (
+    FIRST_NAMES,
+    LAST_NAMES,
+    remove_patients,
+    seed_patients,
+    staff_headers,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark GET /p/<name>/ against growing numbers of synthetic patients"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+        )
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        client = Client(SERVER_NAME="localhost")
+        headers = staff_headers()
+        rng = random.Random(0)
+
+        self.stdout.write(
+            f"{'patients':>10} | {'legacy icontains p50/p95':>26} | "
+            f"{'indexed query p50/p95':>24} | {'GET /p/<name>/ p50/p95':>24}"
+        )
+        for size in sorted(kwargs["sizes"]):
+            seed_patients(size)
+            legacy, indexed, endpoint = [], [], []
+            for _ in range(kwargs["runs"]):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:3]}"
+
+                # What fetch_patients_with_name used to run
+                start = time.perf_counter()
+                list(
+                    models.Details.objects.filter(id__name__icontains=name).values(
+                        "id", "id__name", "id__phonenumber", "date_of_birth"
+                    )
+                )
+                legacy.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                services.fetch_patients_with_name(name)
+                indexed.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                client.get(f"/p/{name.lower().replace(' ', '_')}/", headers=headers)
+                endpoint.append(time.perf_counter() - start)
+
+            row = [summarize(samples) for samples in (legacy, indexed, endpoint)]
+            self.stdout.write(
+                f"{size:>10} | "
+                + " | ".join(
+                    f"{stats['p50']:>10.2f} / {stats['p95']:>8.2f} ms" for stats in row
+                )
+            )
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
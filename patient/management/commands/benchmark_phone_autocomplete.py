@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from ._synthetic import (
+    SYNTHETIC_PHONE_START,
+    remove_patients,
+    seed_patients,
+    staff_headers,
+    summarize,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark phonenumber prefix autocomplete against synthetic patients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=1_000_000)
+        parser.add_argument("--runs", type=int, default=200)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        seed_patients(kwargs["size"])
+        client = Client(SERVER_NAME="localhost")
+        headers = staff_headers()
+        rng = random.Random(0)
+
+        first_pages, next_pages = [], []
+        for _ in range(kwargs["runs"]):
+            phonenumber = str(SYNTHETIC_PHONE_START + rng.randrange(kwargs["size"]))
+            url = f"/p/autocomplete/phonenumber/{phonenumber[: rng.randint(3, 9)]}/"
+
+            start = time.perf_counter()
+            response = client.get(url, headers=headers)
+            first_pages.append(time.perf_counter() - start)
+
+            next_cursor = response.json().get("next")
+            if next_cursor:
+                start = time.perf_counter()
+                client.get(url, {"cursor": next_cursor}, headers=headers)
+                next_pages.append(time.perf_counter() - start)
+
+        for label, samples in (("first page", first_pages), ("next page", next_pages)):
+            if samples:
+                stats = summarize(samples)
+                self.stdout.write(
+                    f"{label:>10}: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms"
+                )
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from patient import pdf
+from ._synthetic import remove_patients, seed_sittings, staff_headers, summarize
+
+
+class Command(BaseCommand):
+    help = "Prescription PDFs per second through GET /p/prescription/pdf/..."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        client = Client(SERVER_NAME="localhost")
+        headers = staff_headers()
+        sittings = seed_sittings(kwargs["requests"])
+        urls = [
+            f"/p/prescription/pdf/{complaint_id}/{sitting}/"
+            for complaint_id, sitting in sittings
+        ]
+
+        def run(cold):
+            samples = []
+            start = time.perf_counter()
+            for url in urls:
+                if cold:
+                    # What every request used to pay: styles and letterhead
+                    pdf.clear_template_cache()
+                request_start = time.perf_counter()
+                response = client.get(url, headers=headers)
+                samples.append(time.perf_counter() - request_start)
+                assert response.status_code == 200, response.status_code
+                response.close()
+            return len(urls) / (time.perf_counter() - start), summarize(samples)
+
+        self.stdout.write(f"{'render':>16} | {'PDFs/s':>8} | {'p50':>8} | {'p95':>8}")
+        with tempfile.TemporaryDirectory() as cache_root:
+            # Warm up imports and url resolution outside the measured runs
+            with override_settings(PDF_CACHE_DIR=os.path.join(cache_root, "warm-up")):
+                client.get(urls[0], headers=headers).close()
+            # Misses render into an empty directory, hits reuse the one before
+            for label, cold, cache_dir in (
+                ("cold template", True, "cold"),
+                ("cached template", False, "cached"),
+                ("disk cache hit", False, "cached"),
+            ):
+                with override_settings(
+                    PDF_CACHE_DIR=os.path.join(cache_root, cache_dir)
+                ):
+                    rate, latency = run(cold)
+                self.stdout.write(
+                    f"{label:>16} | {rate:>8.1f} | {latency['p50']:>5.1f} ms | "
+                    f"{latency['p95']:>5.1f} ms"
+                )
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
@@ -0,0 +1,166 @@
+import datetime
+import time
+import uuid
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection, models as db_models
+
+from dentistAPI.ids import uuid7
+from doctor import models as doc_models
+from patient import models
+from ._synthetic import remove_patients, seed_sittings, summarize
+
+KEYS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+def scratch_model(model):
+    """
+    A copy of `model` (fields, foreign keys, indexes and constraints) on its
+    own table, so every run starts from an empty primary key index
+    """
+    meta = type(
+        "Meta",
+        (),
+        {
+            "app_label": model._meta.app_label,
+            "db_table": f"benchmark_{model._meta.db_table}",
+            "indexes": [rename(index) for index in model._meta.indexes],
+            "constraints": [
+                rename(constraint) for constraint in model._meta.constraints
+            ],
+        },
+    )
+    fields = {field.name: field.clone() for field in model._meta.local_fields}
+    return type(
+        f"Benchmark{model.__name__}",
+        (db_models.Model,),
+        {"__module__": __name__, "Meta": meta, **fields},
+    )
+
+
+def forget(model):
+    """
+    Unregister a scratch model, or deleting patients would cascade into its
+    (dropped) table
+    """
+    del apps.all_models[model._meta.app_label][model._meta.model_name]
+    apps.clear_cache()
+
+
+def rename(index_or_constraint):
+    copy = index_or_constraint.clone()
+    copy.name = f"bench_{index_or_constraint.name}"[:30]
+    return copy
+
+
+def primary_key_size(table):
+    """
+    Bytes in the primary key index of `table`, None if the backend can't tell
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            constraints = connection.introspection.get_constraints(cursor, table)
+            name = next(
+                name for name, details in constraints.items() if details["primary_key"]
+            )
+            cursor.execute("SELECT pg_relation_size(%s::regclass)", [name])
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s",
+                [f"sqlite_autoindex_{table}_1"],
+            )
+        else:
+            return None
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert latency and primary key index size of followups and patient "
+        "prescriptions with UUID4 and UUIDv7 keys, each run into an empty copy "
+        "of the table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete synthetic patients after"
+        )
+
+    def handle(self, *args, **kwargs):
+        ((complaint_id, _),) = seed_sittings(1, prescriptions_per_sitting=1)
+        prescription = doc_models.Prescription.objects.get(name="Synthetic drug 0")
+        today = datetime.date.today()
+        rows = {
+            models.FollowUp: lambda model, key, number: model(
+                id=key(),
+                complaint_id=complaint_id,
+                date=today,
+                time=datetime.time(11, 30),
+                title="Synthetic followup",
+                number=number,
+            ),
+            models.PatientPrescription: lambda model, key, number: model(
+                id=key(),
+                complaint_id=complaint_id,
+                sitting=number,
+                prescription=prescription,
+                days=5,
+                dosage="BD",
+            ),
+        }
+
+        for original, row in rows.items():
+            model = scratch_model(original)
+            self.stdout.write(self.style.MIGRATE_HEADING(original._meta.db_table))
+            for name, key in KEYS.items():
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.create_model(model)
+                try:
+                    samples = self.insert(model, row, key, kwargs)
+                    size = primary_key_size(model._meta.db_table)
+                finally:
+                    with connection.schema_editor() as schema_editor:
+                        schema_editor.delete_model(model)
+                self.report(name, samples, size, kwargs)
+            forget(model)
+
+        if kwargs["cleanup"]:
+            self.stdout.write(f"Removed {remove_patients()} synthetic rows")
+
+    def insert(self, model, row, key, kwargs):
+        """
+        Seconds taken by each batch
+        """
+        samples = []
+        for start in range(0, kwargs["rows"], kwargs["batch_size"]):
+            batch = [
+                row(model, key, number)
+                for number in range(
+                    start, min(start + kwargs["batch_size"], kwargs["rows"])
+                )
+            ]
+            begin = time.perf_counter()
+            model.objects.bulk_create(batch)
+            samples.append(time.perf_counter() - begin)
+        return samples
+
+    def report(self, name, samples, size, kwargs):
+        """
+        Per-row latency (ms per batch -> us per row) overall and over the
+        last tenth of the run, where a growing index hurts most
+        """
+        overall = summarize(samples)
+        tail = summarize(samples[-max(1, len(samples) // 10) :])
+        batch_size = kwargs["batch_size"]
+        rows_per_second = kwargs["rows"] / sum(samples)
+        size = "n/a" if size is None else f"{size / 2**20:.1f} MB"
+        self.stdout.write(
+            f"{name}: {rows_per_second:,.0f} rows/s, "
+            f"p50 {overall['p50'] * 1000 / batch_size:.1f} us/row, "
+            f"last 10% p50 {tail['p50'] * 1000 / batch_size:.1f} us/row, "
+            f"p95 {tail['p95'] * 1000 / batch_size:.1f} us/row, "
+            f"primary key index {size}"
+        )
@@ -1,6 +1,7 @@
 from django.db import models
+from django.utils import timezone
 from authentication.models import User
-import uuid
+from dentistAPI.ids import uuid7
 from doctor.models import Treatment, Prescription
 
 
@@ -51,17 +52,28 @@ class Complaint(models.Model):
     description: <String> What doctor did during sitting
     date:<Date> when complaint was registered
     time: <Time> when complaint was registered
+    created_at: <DateTime> when complaint was registered (for range queries)
+    updated_at: <DateTime> last time the complaint was saved
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     complaint = models.TextField()
     description = models.TextField(default="")
-    date = models.DateField(auto_now=True)
-    time = models.TimeField(auto_now=True, blank=True)
+    date = models.DateField(auto_now_add=True)
+    time = models.TimeField(auto_now_add=True, blank=True)
+    # A default rather than auto_now_add so that backfills can set it
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = "complaints"
+        indexes = [
+            # Complaints of a day (dashboard) or any other time range
+            models.Index(fields=["created_at"], name="complaints_created_at_idx"),
+            # Complaints changed since a client last synced
+            models.Index(fields=["updated_at"], name="complaints_updated_at_idx"),
+        ]
 
 
 class Diagnosis(models.Model):
@@ -72,7 +84,7 @@ class Diagnosis(models.Model):
     treatment: <Treatment> (Foreight Key for treatment)
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE)
     tooth_number = models.IntegerField()
     treatment = models.ForeignKey(Treatment, on_delete=models.PROTECT)
@@ -99,7 +111,7 @@ class FollowUp(models.Model):
     number: <Int> Followup no. since complaint
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE)
     date = models.DateField()
     time = models.TimeField(null=True, blank=True)
@@ -115,6 +127,16 @@ class FollowUp(models.Model):
                 fields=["complaint", "number"], name="unique_complaint+number"
             )
         ]
+        indexes = [
+            # Followups of a day, for the dashboard and the day's prescriptions
+            models.Index(fields=["date", "time"], name="followups_date_idx"),
+            # Pending followups of a day, for reminders
+            models.Index(
+                fields=["date"],
+                condition=models.Q(completed=False),
+                name="followups_pending_date_idx",
+            ),
+        ]
 
 
 class Bill(models.Model):
@@ -125,7 +147,7 @@ class Bill(models.Model):
     discount: <Integer> Amount of discount given by the dentist
     """
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     complaint = models.OneToOneField(Complaint, on_delete=models.CASCADE)
     full_bill = models.IntegerField()
     discount = models.IntegerField()
@@ -152,7 +174,7 @@ class PatientPrescription(models.Model):
         HALF_TDS = "HALF TDS"
         EMPTY = ""
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE)
     sitting = models.IntegerField()
     prescription = models.ForeignKey(Prescription, on_delete=models.PROTECT)
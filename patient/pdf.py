@@ -0,0 +1,329 @@
+"""
+Prescription PDFs
+
+Everything that is the same on every prescription (styles, the clinic's
+letterhead, table styles) is built once per process. The letterhead is drawn
+into each document once as a form XObject and stamped on every page, only the
+patient's fields and tables are laid out per prescription.
+
+A day's export (render_day) is split into parts rendered in worker processes
+and merged with pypdf. Each part carries its own copy of the letterhead.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from functools import cache
+from pypdf import PdfWriter
+import io
+import multiprocessing
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+from xml.sax.saxutils import escape
+
+# Bump whenever the layout changes, cached PDFs are keyed on it
+TEMPLATE_VERSION = 1
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 72
+LEFT = MARGIN
+WIDTH = PAGE_WIDTH - 2 * MARGIN
+TOP = PAGE_HEIGHT - MARGIN
+BOTTOM = MARGIN
+
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+BODY_SIZE = 12
+BODY_LEADING = 16
+
+
+@cache
+def table_style():
+    return TableStyle(
+        [
+            ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.darkblue),
+            ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+            ("FONTNAME", (0, 0), (-1, 0), BOLD_FONT),
+            ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+            ("BACKGROUND", (0, 1), (-1, -1), colors.lightgrey),
+            ("GRID", (0, 0), (-1, -1), 1, colors.lightgrey),
+        ]
+    )
+
+
+@cache
+def letterhead():
+    """
+    Clinic name and address, parsed and wrapped once
+    - returns [(paragraph, height)], and the height of the whole letterhead
+    """
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        "TitleStyle",
+        parent=styles["Heading1"],
+        textColor=colors.darkblue,
+        fontSize=20,
+        alignment=1,
+    )
+    address_style = ParagraphStyle(
+        "AddressStyle",
+        parent=styles["BodyText"],
+        textColor=colors.darkblue,
+        fontSize=12,
+        alignment=1,
+    )
+    paragraphs = []
+    for text, style in (
+        (settings.CLINIC_NAME, title_style),
+        (settings.CLINIC_ADDRESS, address_style),
+    ):
+        paragraph = Paragraph(escape(text), style)
+        paragraphs.append((paragraph, paragraph.wrap(WIDTH, TOP)[1]))
+    # paragraphs, 5pt gap, divider, 20pt gap
+    return paragraphs, sum(height for _, height in paragraphs) + 26
+
+
+def clear_template_cache():
+    """
+    Rebuild the letterhead and styles on next render (after settings change)
+    """
+    table_style.cache_clear()
+    letterhead.cache_clear()
+
+
+def draw_letterhead(canvas):
+    """
+    Stamp the letterhead, defining the form the first time in this document
+    """
+    if not canvas.hasForm("letterhead"):
+        paragraphs, _ = letterhead()
+        canvas.beginForm("letterhead")
+        y = TOP
+        for paragraph, height in paragraphs:
+            y -= height
+            paragraph.drawOn(canvas, LEFT, y)
+        y -= 5
+        canvas.setStrokeColor(colors.darkblue)
+        canvas.line(PAGE_WIDTH / 2 - 220, y, PAGE_WIDTH / 2 + 220, y)
+        canvas.endForm()
+    canvas.doForm("letterhead")
+
+
+class Page:
+    """
+    Top-down layout on a canvas, starting a new page (with the letterhead)
+    when the current one is full
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.new_page()
+
+    def new_page(self, show_previous=False):
+        if show_previous:
+            self.canvas.showPage()
+        draw_letterhead(self.canvas)
+        self.top = self.y = TOP - letterhead()[1]
+
+    def space(self, height):
+        self.y -= height
+
+    def ensure(self, height):
+        if self.y - height < BOTTOM:
+            self.new_page(show_previous=True)
+
+    def field(self, label, value):
+        """
+        "label: <b>value</b>", wrapping long values
+        """
+        label = f"{label}: "
+        indent = self.canvas.stringWidth(label, FONT, BODY_SIZE)
+        lines = simpleSplit(str(value), BOLD_FONT, BODY_SIZE, WIDTH - indent) or [""]
+        self.ensure(BODY_LEADING * len(lines))
+        self.y -= BODY_LEADING
+        self.canvas.setFillColor(colors.black)
+        self.canvas.setFont(FONT, BODY_SIZE)
+        self.canvas.drawString(LEFT, self.y, label)
+        self.canvas.setFont(BOLD_FONT, BODY_SIZE)
+        for number, line in enumerate(lines):
+            if number:
+                self.y -= BODY_LEADING
+            self.canvas.drawString(LEFT + indent, self.y, line)
+
+    def heading(self, text):
+        self.ensure(40)
+        self.y -= 20
+        self.canvas.setFillColor(colors.darkblue)
+        self.canvas.setStrokeColor(colors.darkblue)
+        self.canvas.setFont(BOLD_FONT, 16)
+        self.canvas.drawCentredString(PAGE_WIDTH / 2, self.y, text)
+        half_width = self.canvas.stringWidth(text, BOLD_FONT, 16) / 2
+        self.canvas.line(
+            PAGE_WIDTH / 2 - half_width,
+            self.y - 2,
+            PAGE_WIDTH / 2 + half_width,
+            self.y - 2,
+        )
+        self.y -= 10
+
+    def note(self, text):
+        self.ensure(BODY_LEADING)
+        self.y -= BODY_LEADING
+        self.canvas.setFillColor(colors.darkblue)
+        self.canvas.setFont(FONT, BODY_SIZE)
+        self.canvas.drawCentredString(PAGE_WIDTH / 2, self.y, text)
+
+    def table(self, rows, col_widths):
+        table = Table(rows, colWidths=col_widths, style=table_style(), repeatRows=1)
+        x = LEFT + (WIDTH - sum(col_widths)) / 2
+        while table:
+            height = table.wrapOn(self.canvas, WIDTH, self.y - BOTTOM)[1]
+            if height <= self.y - BOTTOM:
+                table.drawOn(self.canvas, x, self.y - height)
+                self.y -= height
+                return
+            parts = table.split(WIDTH, self.y - BOTTOM)
+            if len(parts) == 2:
+                height = parts[0].wrapOn(self.canvas, WIDTH, self.y - BOTTOM)[1]
+                parts[0].drawOn(self.canvas, x, self.y - height)
+                table = parts[1]
+            elif self.y == self.top:
+                # Doesn't fit an empty page either, let it run over the margin
+                table.drawOn(self.canvas, x, self.y - height)
+                self.y -= height
+                return
+            self.new_page(show_previous=True)
+
+    def signature(self):
+        self.ensure(100 + 10 + BODY_LEADING)
+        self.y -= 100
+        self.canvas.setStrokeColor(colors.black)
+        self.canvas.line(LEFT, self.y, LEFT + 100, self.y)
+        self.y -= BODY_LEADING
+        self.canvas.setFillColor(colors.black)
+        self.canvas.setFont(BOLD_FONT, BODY_SIZE)
+        self.canvas.drawString(LEFT, self.y, "Doctor's Signature")
+
+
+def draw_prescription(canvas, followup_and_personal_data, prescriptions):
+    """
+    One sitting's prescription, on as many pages as it takes
+    """
+    page = Page(canvas)
+    personal = followup_and_personal_data.get("personal")
+    if personal:
+        page.field("Patient", personal.get("name"))
+        page.field("Age", personal.get("age"))
+        page.field("Date", personal.get("current_date"))
+        page.field("Doctor", settings.CLINIC_DOCTOR)
+        page.field("Complaint", personal.get("complaint"))
+        page.space(12)
+
+    page.space(12)
+    page.heading("Prescription")
+    if len(prescriptions):
+        rows = [["Medication", "Dosage", "Days"]]
+        for prescription in prescriptions:
+            if prescription.get("prescription_type") == "Medication":
+                rows.append(
+                    [
+                        prescription.get("prescription_name"),
+                        prescription.get("dosage"),
+                        prescription.get("days"),
+                    ]
+                )
+            else:
+                rows.append([prescription.get("prescription_name"), "-", "-"])
+        page.table(rows, [240, 100, 100])
+    else:
+        page.note("No prescriptions given")
+
+    page.space(20)
+    page.heading("Followup")
+    followup = followup_and_personal_data.get("followup")
+    if followup:
+        rows = [
+            ["Sitting", "Followup", "Date", "Time"],
+            [
+                followup.get("sitting"),
+                followup.get("followup"),
+                followup.get("next_date"),
+                followup.get("time"),
+            ],
+        ]
+        page.table(rows, [40, 240, 80, 80])
+    else:
+        page.note("No followups scheduled up next")
+
+    page.signature()
+    canvas.showPage()
+
+
+def render_prescription(output, followup_and_personal_data, prescriptions):
+    """
+    Write the prescription PDF to `output` (a file or an HttpResponse)
+    """
+    canvas = Canvas(output, pagesize=letter)
+    draw_prescription(canvas, followup_and_personal_data, prescriptions)
+    canvas.save()
+
+
+def render_prescriptions(output, prescription_inputs):
+    """
+    Several sittings' prescriptions in one document, each from a new page,
+    sharing one copy of the letterhead
+    - prescription_inputs: iterable of {"followup_and_personal_data", "prescriptions"}
+    """
+    canvas = Canvas(output, pagesize=letter)
+    for inputs in prescription_inputs:
+        draw_prescription(canvas, **inputs)
+    canvas.save()
+
+
+
+def render_part(prescription_inputs):
+    """
+    render_prescriptions into a PDF of its own, run in the export pool
+    - returns the PDF's bytes
+    """
+    output = io.BytesIO()
+    render_prescriptions(output, prescription_inputs)
+    return output.getvalue()
+
+
+@cache
+def export_pool():
+    # Spawned, forking a server that runs threads can deadlock the child
+    return ProcessPoolExecutor(
+        max_workers=settings.PDF_EXPORT_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def render_day(output, prescription_inputs):
+    """
+    render_prescriptions, with the sittings split into parts of
+    PDF_EXPORT_CHUNK rendered across PDF_EXPORT_WORKERS processes, merged in
+    order once the last part is done
+    """
+    inputs = list(prescription_inputs)
+    size = settings.PDF_EXPORT_CHUNK
+    parts = [inputs[start : start + size] for start in range(0, len(inputs), size)]
+    if len(parts) <= 1 or settings.PDF_EXPORT_WORKERS <= 1:
+        render_prescriptions(output, inputs)
+        return
+    writer = PdfWriter()
+    try:
+        for part in export_pool().map(render_part, parts):
+            writer.append(io.BytesIO(part))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory), start a new pool next time
+        export_pool.cache_clear()
+        render_prescriptions(output, inputs)
+        return
+    writer.write(output)
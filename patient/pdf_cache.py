@@ -0,0 +1,197 @@
+"""
+Rendered prescription PDFs on disk, named by a digest of everything printed
+on them (personal data, prescriptions, next followup, clinic details and the
+template version). Any change to a sitting's prescriptions or followups gives
+a new digest, so entries never need invalidating, old ones just age out.
+
+The directory is bounded by PDF_CACHE_MAX_BYTES, the least recently served
+files (by mtime, bumped on every hit) are removed first.
+
+Background renders (tasks.render_prescription_pdf) leave a `.queued` marker
+while they wait or run and a `.error` one if they fail, see `job_status`.
+"""
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import pdf
+
+# Bytes this process believes are in the cache, None until the first scan
+cached_bytes = None
+cached_bytes_lock = threading.Lock()
+
+
+def digest(followup_and_personal_data, prescriptions):
+    inputs = {
+        "template": pdf.TEMPLATE_VERSION,
+        "clinic": [
+            settings.CLINIC_NAME,
+            settings.CLINIC_ADDRESS,
+            settings.CLINIC_DOCTOR,
+        ],
+        "data": followup_and_personal_data,
+        "prescriptions": list(prescriptions),
+    }
+    encoded = json.dumps(inputs, cls=DjangoJSONEncoder, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def path_for(key):
+    return os.path.join(settings.PDF_CACHE_DIR, key[:2], f"{key}.pdf")
+
+
+def lookup(key):
+    """
+    Open the cached PDF for `key`, or None on a miss
+    """
+    path = path_for(key)
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # Evicted since we opened it, the open file is still readable
+        pass
+    return file
+
+
+def store(key, followup_and_personal_data, prescriptions):
+    """
+    Render into the cache (atomically, readers never see half a file)
+    - returns the open file
+    """
+    path = path_for(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rendering = tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), suffix=".tmp", delete=False
+    )
+    try:
+        with rendering:
+            pdf.render_prescription(
+                rendering, followup_and_personal_data, prescriptions
+            )
+        os.replace(rendering.name, path)
+    except Exception:
+        # Nothing else would ever remove it (or count it in the cache size)
+        remove(rendering.name)
+        raise
+    remove(queued_path_for(key))
+    file = open(path, "rb")
+    grow(os.fstat(file.fileno()).st_size)
+    return file
+
+
+def open_prescription(key, followup_and_personal_data, prescriptions):
+    """
+    The cached PDF for `key`, rendered first on a miss
+    """
+    return lookup(key) or store(key, followup_and_personal_data, prescriptions)
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def error_path_for(key):
+    return os.path.join(settings.PDF_CACHE_DIR, key[:2], f"{key}.error")
+
+
+def queued_path_for(key):
+    return os.path.join(settings.PDF_CACHE_DIR, key[:2], f"{key}.queued")
+
+
+def mark_queued(key):
+    os.makedirs(os.path.dirname(queued_path_for(key)), exist_ok=True)
+    open(queued_path_for(key), "w").close()
+
+
+def mark_failed(key, error):
+    os.makedirs(os.path.dirname(error_path_for(key)), exist_ok=True)
+    with open(error_path_for(key), "w") as error_file:
+        error_file.write(str(error) or error.__class__.__name__)
+    remove(queued_path_for(key))
+
+
+def clear_failure(key):
+    remove(error_path_for(key))
+
+
+def job_status(key):
+    """
+    Where a background render of `key` is (see tasks.render_prescription_pdf)
+    1. In the cache: returns "ready", None
+    2. Rendering raised: returns "failed", error
+    3. Queued or rendering: returns "pending", None
+    4. Queued more than PDF_JOB_TIMEOUT seconds ago (lost by its worker):
+    returns "failed", error
+    5. Never queued, or long evicted: returns None, None
+    """
+    if os.path.exists(path_for(key)):
+        return "ready", None
+    try:
+        with open(error_path_for(key)) as error_file:
+            return "failed", error_file.read()
+    except FileNotFoundError:
+        pass
+    try:
+        queued_at = os.stat(queued_path_for(key)).st_mtime
+    except FileNotFoundError:
+        return None, None
+    if time.time() - queued_at > settings.PDF_JOB_TIMEOUT:
+        return "failed", "Not rendered in time, request it again"
+    return "pending", None
+
+
+def scan():
+    """
+    [(mtime, size, path)] of every cached PDF
+    """
+    entries = []
+    for directory, _, names in os.walk(settings.PDF_CACHE_DIR):
+        for name in names:
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def grow(size):
+    """
+    Account for a new file, evicting down to 90% of the limit when over it
+    """
+    global cached_bytes
+    with cached_bytes_lock:
+        if cached_bytes is None:
+            cached_bytes = sum(size for _, size, _ in scan())
+        else:
+            cached_bytes += size
+        if cached_bytes <= settings.PDF_CACHE_MAX_BYTES:
+            return
+
+        # Other processes write here too, so evict from what's actually there
+        entries = sorted(scan())
+        cached_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if cached_bytes <= settings.PDF_CACHE_MAX_BYTES * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            cached_bytes -= size
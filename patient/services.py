@@ -1,19 +1,22 @@
 import datetime
+import json
 import uuid
 from . import models
 from doctor import models as doc_models
 from . import serializers
 from . import utils
-from authentication.models import User
-from django.db import IntegrityError
-from django.db.models import F
+from authentication.models import User, normalize_name
+from messaging import outbox
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery
 from django.forms.models import model_to_dict
 from rest_framework import status
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.graphics.shapes import Drawing, Line
+
+# Upper bound on rows returned by a name search, best matches first
+NAME_SEARCH_LIMIT = 50
+PHONENUMBER_DIGITS = 10
 
 
 def capitalize_name(name, snake_case=False):
@@ -28,10 +31,32 @@ def capitalize_name(name, snake_case=False):
     return capitalized_name.strip()
 
 
+def rank_by_name(patients, name):
+    """
+    Narrow a `Details` queryset down to patients whose name contains `name`,
+    or is close to it (typos, pg_trgm's similarity threshold)
+    - matches on the normalized `search_name` column (trigram GIN indexed)
+    - closest matches by trigram similarity come first
+    """
+    search_name = normalize_name(name)
+    return (
+        patients.filter(
+            Q(id__search_name__contains=search_name)
+            | Q(id__search_name__trigram_similar=search_name)
+        )
+        .annotate(similarity=TrigramSimilarity("id__search_name", search_name))
+        .order_by("-similarity", "id__name")
+    )
+
+
 def fetch_patients_with_phone_and_name(phonenumber, name):
     patients = (
-        models.Details.objects.select_related("user")
-        .filter(id__phonenumber=phonenumber, id__name__icontains=name)
+        rank_by_name(
+            models.Details.objects.select_related("user").filter(
+                id__phonenumber=phonenumber
+            ),
+            name,
+        )
         .annotate(name=F("id_id__name"), phonenumber=F("id_id__phonenumber"))
         .values(
             "id",
@@ -45,7 +70,7 @@ def fetch_patients_with_phone_and_name(phonenumber, name):
             "smoking",
             "drinking",
             "tobacco",
-        )
+        )[:NAME_SEARCH_LIMIT]
     )
     if not len(patients):
         return (
@@ -85,8 +110,7 @@ def fetch_patients_with_phone(phonenumber):
 
 def fetch_patients_with_name(name):
     patients = (
-        models.Details.objects.select_related("user")
-        .filter(id__name__icontains=name)
+        rank_by_name(models.Details.objects.select_related("user"), name)
         .annotate(name=F("id_id__name"), phonenumber=F("id_id__phonenumber"))
         .values(
             "id",
@@ -100,7 +124,7 @@ def fetch_patients_with_name(name):
             "smoking",
             "drinking",
             "tobacco",
-        )
+        )[:NAME_SEARCH_LIMIT]
     )
     if not len(patients):
         return (
@@ -110,37 +134,273 @@ def fetch_patients_with_name(name):
     return patients, None
 
 
-def fetch_complaint_and_followup_history(patient_id):
+def phonenumber_prefix_range(prefix):
+    """
+    The inclusive range of phonenumbers starting with `prefix`
+    eg: "98765" -> (9876500000, 9876599999)
+    """
+    padding = 10 ** (PHONENUMBER_DIGITS - len(prefix))
+    start = int(prefix) * padding
+    return start, start + padding - 1
+
+
+def autocomplete_patients_with_phone(prefix, limit, cursor=None):
+    """
+    Patients whose phonenumber starts with `prefix`, ordered by phonenumber
+    - prefix becomes a BETWEEN on credentials_phone_idx (no LIKE on a number)
+    - cursor is the (phonenumber, id) of the last patient on the previous page
+    - returns the page and the cursor for the next one (None on the last page)
+    """
+    low, high = phonenumber_prefix_range(prefix)
+    patients = User.objects.filter(
+        role=User.RoleChoices.PATIENT,
+        phonenumber__range=(low, high),
+        details__isnull=False,
+    )
+    if cursor:
+        last_phonenumber, last_id = cursor
+        # The __gte is the index range to start from, the OR breaks ties on id
+        patients = patients.filter(phonenumber__gte=last_phonenumber).filter(
+            Q(phonenumber__gt=last_phonenumber)
+            | Q(phonenumber=last_phonenumber, id__gt=last_id)
+        )
+    page = list(
+        patients.order_by("phonenumber", "id").values(
+            "id", "name", "phonenumber", date_of_birth=F("details__date_of_birth")
+        )[: limit + 1]
+    )
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = utils.encode_cursor(page[-1]["phonenumber"], page[-1]["id"])
+    for patient in page:
+        patient["age"] = utils.get_age(patient.pop("date_of_birth"))
+    return page, next_cursor
+
+
+def fetch_patients_page(page_size, cursor=None):
+    """
+    One page of all patients ordered by (name, id)
+    - cursor is the (name, id) of the last patient on the previous page, so
+      every page is an index range scan on credentials_name_idx, never OFFSET
+    - returns the page and the cursor for the next one (None on the last page)
+    """
+    patients = User.objects.filter(
+        role=User.RoleChoices.PATIENT, details__isnull=False
+    )
+    if cursor:
+        last_name, last_id = cursor
+        # The __gte is the index range to start from, the OR breaks ties on id
+        patients = patients.filter(name__gte=last_name).filter(
+            Q(name__gt=last_name) | Q(name=last_name, id__gt=last_id)
+        )
+    page = list(
+        patients.order_by("name", "id").values(
+            "id",
+            "name",
+            "phonenumber",
+            date_of_birth=F("details__date_of_birth"),
+            address=F("details__address"),
+            gender=F("details__gender"),
+            allergies=F("details__allergies"),
+            illnesses=F("details__illnesses"),
+            smoking=F("details__smoking"),
+            drinking=F("details__drinking"),
+            tobacco=F("details__tobacco"),
+        )[: page_size + 1]
+    )
+
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = utils.encode_cursor(page[-1]["name"], page[-1]["id"])
+    return page, next_cursor
+
+
+def stream_all_patients(chunk_size=1000):
+    """
+    Every patient as one JSON document per line (NDJSON)
+    - walks the table one keyset page at a time so memory stays constant
+    """
+    cursor = None
+    while True:
+        page, next_cursor = fetch_patients_page(chunk_size, cursor)
+        for patient in page:
+            yield json.dumps(patient, cls=DjangoJSONEncoder) + "\n"
+        if not next_cursor:
+            return
+        cursor = (page[-1]["name"], page[-1]["id"])
+
+
+def prefetch_history(complaints, include_summaries=False):
+    """
+    Attach ordered followups (and diagnoses + bill with include_summaries)
+    to a `Complaint` queryset using a fixed number of extra queries
+    """
+    complaints = complaints.prefetch_related(
+        Prefetch(
+            "followup_set",
+            queryset=models.FollowUp.objects.order_by("number").only(
+                "complaint_id", "title", "date", "completed", "number"
+            ),
+        )
+    )
+    if include_summaries:
+        complaints = complaints.annotate(
+            full_bill=F("bill__full_bill"), discount=F("bill__discount")
+        ).prefetch_related(
+            Prefetch(
+                "diagnosis_set",
+                queryset=models.Diagnosis.objects.annotate(
+                    treatment_name=F("treatment__name")
+                ).order_by("tooth_number"),
+            )
+        )
+    return complaints
+
+
+def format_history(complaint, include_summaries=False):
+    """
+    History entry for one complaint fetched through `prefetch_history`
+    """
+    complaint_history = {
+        "complaint_details": {
+            "complaint": complaint.complaint,
+            "date": complaint.date,
+        },
+        "followups": [
+            {
+                "title": followup.title,
+                "date": followup.date,
+                "completed": followup.completed,
+                "number": followup.number,
+            }
+            for followup in complaint.followup_set.all()
+        ],
+    }
+    if include_summaries:
+        complaint_history["diagnosis"] = [
+            {
+                "tooth_number": diagnosis.tooth_number,
+                "treatment_name": diagnosis.treatment_name,
+            }
+            for diagnosis in complaint.diagnosis_set.all()
+        ]
+        complaint_history["bill"] = None
+        if complaint.full_bill is not None:
+            complaint_history["bill"] = {
+                "full_bill": complaint.full_bill,
+                "discount": complaint.discount,
+            }
+    return {str(complaint.id): complaint_history}
+
+
+def fetch_complaint_and_followup_history(patient_id, include_summaries=False):
     """
     - Fetch complaints and followups for given patient
+    - include_summaries adds the diagnoses and bill of every complaint
+    - Constant number of queries however many complaints the patient has
+      (followups and diagnoses are prefetched, bill is joined in)
     1. Invaild patient_id
     2. Success
     """
+    if not User.objects.filter(id=patient_id).exists():
+        return None, "This patient does not exist"
+    complaints = prefetch_history(
+        models.Complaint.objects.filter(user_id=patient_id).order_by("created_at"),
+        include_summaries,
+    )
+    complaint_followup_mapping = [
+        format_history(complaint, include_summaries) for complaint in complaints
+    ]
+    return complaint_followup_mapping, None
+
+
+def fetch_patient_chart(patient_id, sections):
+    """
+    Everything the frontend shows for a patient, limited to `sections`
+    - details, medical_details, history, bills, prescriptions
+    - at most 4 queries: user+details, complaints+bills, followups,
+      prescriptions (only the ones the sections need are run)
+    1. Invalid patient_id
+    2. Success
+    """
     try:
-        patient = User.objects.get(id=patient_id)
-    except User.DoesNotExist:
+        patient = User.objects.select_related("details").get(id=patient_id)
+        patient_details = patient.details
+    except (User.DoesNotExist, models.Details.DoesNotExist):
         return None, "This patient does not exist"
-    complaints = models.Complaint.objects.filter(user=patient)
-    complaint_followup_mapping = []
-    for complaint in complaints:
-        followups_by_complaint = (
-            models.FollowUp.objects.filter(complaint=complaint)
-            .values("title", "date", "completed", "number")
-            .order_by("number")
-        )
-        complaint_details = {
-            "complaint": complaint.complaint,
-            "date": complaint.date,
+
+    chart = {}
+    if "details" in sections:
+        chart["details"] = {
+            "id": patient.id,
+            "name": patient.name,
+            "phonenumber": patient.phonenumber,
+            "date_of_birth": patient_details.date_of_birth,
+            "age": utils.get_age(patient_details.date_of_birth),
+            "address": patient_details.address,
+            "gender": patient_details.gender,
         }
-        complaint_followup_mapping.append(
-            {
-                str(complaint.id): {
-                    "complaint_details": complaint_details,
-                    "followups": followups_by_complaint,
-                }
-            }
+    if "medical_details" in sections:
+        chart["medical_details"] = format_medical_details(patient_details)
+
+    if not sections & {"history", "bills", "prescriptions"}:
+        return chart, None
+
+    complaints = models.Complaint.objects.filter(user=patient).order_by("created_at")
+    if "history" in sections:
+        complaints = prefetch_history(complaints)
+    if "bills" in sections:
+        complaints = complaints.annotate(
+            bill_id=F("bill__id"),
+            full_bill=F("bill__full_bill"),
+            discount=F("bill__discount"),
         )
-    return complaint_followup_mapping, None
+    if "prescriptions" in sections:
+        complaints = complaints.prefetch_related(
+            Prefetch(
+                "patientprescription_set",
+                queryset=models.PatientPrescription.objects.annotate(
+                    prescription_name=F("prescription__name"),
+                    prescription_type=F("prescription__type"),
+                ).order_by("sitting", "prescription_name"),
+            )
+        )
+
+    if "history" in sections:
+        chart["history"] = []
+    if "bills" in sections:
+        chart["bills"] = {}
+    if "prescriptions" in sections:
+        chart["prescriptions"] = {}
+    for complaint in complaints:
+        complaint_id = str(complaint.id)
+        if "history" in sections:
+            chart["history"].append(format_history(complaint))
+        if "bills" in sections and complaint.bill_id:
+            chart["bills"][complaint_id] = {
+                "id": complaint.bill_id,
+                "full_bill": complaint.full_bill,
+                "discount": complaint.discount,
+            }
+        if "prescriptions" in sections:
+            sittings = {}
+            for patient_prescription in complaint.patientprescription_set.all():
+                sittings.setdefault(patient_prescription.sitting, []).append(
+                    {
+                        "id": patient_prescription.id,
+                        "prescription_id": patient_prescription.prescription_id,
+                        "prescription_name": patient_prescription.prescription_name,
+                        "prescription_type": patient_prescription.prescription_type,
+                        "days": patient_prescription.days,
+                        "dosage": patient_prescription.dosage,
+                    }
+                )
+            if sittings:
+                chart["prescriptions"][complaint_id] = sittings
+    return chart, None
 
 
 def serialize_identity(medical_data):
@@ -223,7 +483,13 @@ def fetch_medical_details(capitalized_name, phonenumber):
     error, user_details = fetch_details_object(capitalized_name, phonenumber)
     if error:
         return None, error
+    return format_medical_details(user_details), None
+
 
+def format_medical_details(user_details):
+    """
+    Medical details of a `Details` object with the csv fields as lists
+    """
     illnesses = user_details.illnesses.split(",")
     if not user_details.illnesses:
         illnesses = []
@@ -231,14 +497,13 @@ def fetch_medical_details(capitalized_name, phonenumber):
     if not user_details.allergies:
         allergies = []
 
-    medical_details = {
+    return {
         "illnesses": illnesses,
         "allergies": allergies,
         "smoking": user_details.smoking,
         "drinking": user_details.drinking,
         "tobacco": user_details.tobacco,
     }
-    return medical_details, None
 
 
 def fetch_diagnosis_by_complaint(complaint_id):
@@ -369,6 +634,48 @@ def fetch_followups_by_date(date: datetime.datetime.date):
     return formatted_followups
 
 
+def fetch_complaints_by_date(date):
+    """
+    Returns list of all the complaints registered on the given date
+    """
+    start, end = utils.day_range(date)
+    complaints_for_date = (
+        models.Complaint.objects.select_related("user", "user__details")
+        .filter(created_at__gte=start, created_at__lt=end)
+        .order_by("created_at")
+    )
+    return [
+        {
+            "id": complaint.id,
+            "patient_id": complaint.user.id,
+            "name": complaint.user.name,
+            "age": utils.get_age(complaint.user.details.date_of_birth),
+            "phonenumber": complaint.user.phonenumber,
+            "time": complaint.time,
+            "complaint": complaint.complaint,
+        }
+        for complaint in complaints_for_date
+    ]
+
+
+def fetch_sittings_by_date(date):
+    """
+    Every sitting of the given date: complaints registered on it (sitting 0)
+    and followups scheduled for it, in order of time
+    - returns [(complaint_id, sitting)]
+    """
+    sittings = [
+        (complaint["time"], complaint["id"], 0)
+        for complaint in fetch_complaints_by_date(date)
+    ] + [
+        (followup["time"], followup["id"], followup["sitting"])
+        for followup in fetch_followups_by_date(date)
+    ]
+    # Followups without a time go last
+    sittings.sort(key=lambda sitting: (sitting[0] is None, sitting[0] or 0))
+    return [(complaint_id, sitting) for _, complaint_id, sitting in sittings]
+
+
 def fetch_followups_by_complaint(complaint_id):
     """
     Fetch all the past followups for a particular complaint
@@ -387,7 +694,7 @@ def fetch_followups_by_complaint(complaint_id):
 
 def is_valid_uuid(uuid_string):
     try:
-        uuid.UUID(uuid_string, version=4)
+        uuid.UUID(uuid_string)
     except ValueError:
         return False
     return True
@@ -410,14 +717,17 @@ def create_followup(complaint_id, followup_data):
     except models.Complaint.DoesNotExist:
         return "Invalid followup, chief complaint is not registered"
     try:
-        models.FollowUp.objects.create(
-            complaint=complaint_data,
-            title=followup_data["title"],
-            description=followup_data["description"],
-            date=followup_data["date"],
-            time=followup_data["time"],
-            number=followup_data["number"],
-        )
+        with transaction.atomic():
+            followup = models.FollowUp.objects.create(
+                complaint=complaint_data,
+                title=followup_data["title"],
+                description=followup_data["description"],
+                date=followup_data["date"],
+                time=followup_data["time"],
+                number=followup_data["number"],
+            )
+            # Its reminder commits (or not) with it
+            outbox.reschedule_reminders([followup.id])
     except IntegrityError:
         return "Duplicate followup, it already exists"
     return None
@@ -438,7 +748,9 @@ def update_followup(followup_data):
     followup_to_update.date = followup_data["date"]
     followup_to_update.time = followup_data["time"]
     followup_to_update.completed = followup_data["completed"]
-    followup_to_update.save()
+    with transaction.atomic():
+        followup_to_update.save()
+        outbox.reschedule_reminders([followup_to_update.id])
     return None
 
 
@@ -557,8 +869,25 @@ def fetch_patients_prescriptions(complaint_id, sitting):
                 "Invalid followup, no prescription found",
             )
 
-    patient_prescription = (
-        models.PatientPrescription.objects.filter(complaint=complaint, sitting=sitting)
+    return sitting_prescriptions(complaint.id, sitting), None
+
+
+def sitting_prescriptions(complaint_id, sitting):
+    """
+    Prescriptions of one sitting with their catalog name and type (one query)
+    """
+    return sitting_prescriptions_of([complaint_id], [sitting])
+
+
+def sitting_prescriptions_of(complaint_ids, sittings):
+    """
+    Prescriptions of those sittings of those complaints, as
+    `sitting_prescriptions` (one query)
+    """
+    return (
+        models.PatientPrescription.objects.filter(
+            complaint_id__in=complaint_ids, sitting__in=sittings
+        )
         .annotate(
             prescription_name=F("prescription_id__name"),
             prescription_type=F("prescription_id__type"),
@@ -574,7 +903,6 @@ def fetch_patients_prescriptions(complaint_id, sitting):
             "dosage",
         )
     )
-    return patient_prescription, None
 
 
 def update_patients_prescription(serializer_data):
@@ -630,209 +958,125 @@ def delete_patient_prescription(patient_prescription_id):
     return name, None
 
 
-def fetch_followup_and_personal_data_for_prescription_pdf(
-    complaint_id, current_sitting
-):
+def fetch_prescription_pdf_inputs(complaint_id, sitting):
     """
-    - Personal data using current followup
-    - Data for next followup
+    Everything printed on a sitting's prescription PDF in two queries: the
+    complaint with its patient, details and current/next followup, then the
+    sitting's prescriptions
+    1. Invalid complaint: returns None, error
+    2. Invalid followup: returns None, error
+    3. Success: returns {"followup_and_personal_data", "prescriptions"}, None
     """
-    if current_sitting == 0:
-        current_complaint = models.Complaint.objects.get(id=complaint_id)
-        personal = {
-            "name": current_complaint.user.name,
-            "age": utils.get_age(current_complaint.user.details.date_of_birth),
-            "complaint": current_complaint.complaint,
-            "current_date": current_complaint.date,
+    followups = models.FollowUp.objects.filter(complaint=OuterRef("pk"))
+    next_followup = followups.filter(number=sitting + 1)
+    complaint = (
+        models.Complaint.objects.select_related("user", "user__details")
+        .annotate(
+            current_date=(
+                Subquery(followups.filter(number=sitting).values("date")[:1])
+                if sitting
+                else F("date")
+            ),
+            next_title=Subquery(next_followup.values("title")[:1]),
+            next_date=Subquery(next_followup.values("date")[:1]),
+            next_time=Subquery(next_followup.values("time")[:1]),
+        )
+        .filter(id=complaint_id)
+        .first()
+    )
+    if complaint is None:
+        return None, "Invalid complaint, no prescription found"
+    # Only check incase its followup and not initial complaint
+    if complaint.current_date is None:
+        return None, "Invalid followup, no prescription found"
+
+    next_followup = None
+    if complaint.next_date is not None:
+        next_followup = {
+            "title": complaint.next_title,
+            "date": complaint.next_date,
+            "time": complaint.next_time,
         }
+    return prescription_pdf_inputs(
+        complaint,
+        sitting,
+        complaint.current_date,
+        next_followup,
+        list(sitting_prescriptions(complaint.id, sitting)),
+    ), None
 
-    else:
-        current_followup = models.FollowUp.objects.select_related("complaint").get(
-            complaint__id=complaint_id, number=current_sitting
-        )
-        personal = {
-            "name": current_followup.complaint.user.name,
-            "age": utils.get_age(current_followup.complaint.user.details.date_of_birth),
-            "complaint": current_followup.complaint.complaint,
-            "current_date": current_followup.date,
-        }
-    print("personal: ", personal)
 
-    try:
-        followup = models.FollowUp.objects.select_related("complaint").get(
-            complaint__id=complaint_id, number=current_sitting + 1
-        )
+def prescription_pdf_inputs(
+    complaint, sitting, current_date, next_followup, prescriptions
+):
+    personal = {
+        "name": complaint.user.name,
+        "age": utils.get_age(complaint.user.details.date_of_birth),
+        "complaint": complaint.complaint,
+        "current_date": current_date,
+    }
+    followup = {}
+    if next_followup is not None:
         followup = {
-            "followup": followup.title,
-            "next_date": followup.date,
-            "time": followup.time,
-            "sitting": followup.number,
+            "followup": next_followup["title"],
+            "next_date": next_followup["date"],
+            "time": next_followup["time"],
+            "sitting": sitting + 1,
         }
-    except models.FollowUp.DoesNotExist:
-        return {"personal": personal, "followup": {}}
-    return {"personal": personal, "followup": followup}
-
-
-def create_pdf(response, followup_and_personal_data, prescriptions):
-    """ """
-    # Create a PDF document
-    pdf = SimpleDocTemplate(response, pagesize=letter)
-    elements = []
-
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        "TitleStyle",
-        parent=styles["Heading1"],
-        textColor=colors.darkblue,
-        fontSize=20,
-        alignment=1,
-    )
-    subtitle_style = ParagraphStyle(
-        "SubtitleStyle",
-        parent=styles["Heading2"],
-        textColor=colors.darkblue,
-        fontSize=16,
-        alignment=1,
-    )
-    address_style = ParagraphStyle(
-        "AddressStyle",
-        parent=styles["BodyText"],
-        textColor=colors.darkblue,
-        fontSize=12,
-        alignment=1,
-    )
-    body_style = ParagraphStyle(
-        "BodyStyle",
-        parent=styles["BodyText"],
-        textColor=colors.black,
-        fontSize=12,
-        leading=16,
-    )
-
-    # Title
-    elements.append(Paragraph("Ojas Dental Clinic", title_style))
-    elements.append(
-        Paragraph(
-            "4G24+MQF, Hospital Rd, Panchavati Colony, Baran, Rajasthan 325205",
-            address_style,
-        )
-    )
-    elements.append(Spacer(1, 5))
-    header_divider = create_divider(440, 1, colors.darkblue)
-    elements.append(header_divider)
-    elements.append(Spacer(1, 20))
-
-    # Patient Info
-    if followup_and_personal_data:
-        elements.append(
-            Paragraph(
-                f"Patient: <b>{followup_and_personal_data.get("personal").get("name")}</b>",
-                body_style,
-            )
-        )
-        elements.append(
-            Paragraph(
-                f"Age: <b>{followup_and_personal_data.get("personal").get("age")}</b>",
-                body_style,
-            )
-        )
-        elements.append(
-            Paragraph(
-                f"Date: <b>{followup_and_personal_data.get("personal").get("current_date")}</b>",
-                body_style,
-            )
-        )
-        elements.append(Paragraph("Doctor: <b>Dr. Neha Gupta</b>", body_style))
-        elements.append(
-            Paragraph(
-                f"Complaint: <b>{followup_and_personal_data.get("personal").get("complaint")}</b>",
-                body_style,
-            )
-        )
-        elements.append(Spacer(1, 12))
-
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph("<u>Prescription</u>", subtitle_style))
-    elements.append(Spacer(1, 5))
-    # Medicines Table
-    if len(prescriptions):
-        data = [["Medication", "Dosage", "Days"]]
-        for prescription in prescriptions:
-            if prescription.get("prescription_type") == "Medication":
-                data.append(
-                    [
-                        prescription.get("prescription_name"),
-                        prescription.get("dosage"),
-                        prescription.get("days"),
-                    ]
-                )
-            else:
-                data.append([prescription.get("prescription_name"), "-", "-"])
-
-        table = Table(data, colWidths=[240, 100, 100])
-        table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.darkblue),
-                    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                    ("BACKGROUND", (0, 1), (-1, -1), colors.lightgrey),
-                    ("GRID", (0, 0), (-1, -1), 1, colors.lightgrey),
-                ]
-            )
-        )
-        elements.append(table)
-    else:
-        elements.append(Paragraph("No prescriptions given", address_style))
-
-    # Followup section
-    elements.append(Spacer(1, 20))
-    elements.append(Paragraph("<u>Followup</u>", subtitle_style))
-    elements.append(Spacer(1, 5))
-    if followup_and_personal_data.get("followup"):
-        followup_data = [
-            ["Sitting", "Followup", "Date", "Time"],
-            [
-                followup_and_personal_data.get("followup").get("sitting"),
-                followup_and_personal_data.get("followup").get("followup"),
-                followup_and_personal_data.get("followup").get("next_date"),
-                followup_and_personal_data.get("followup").get("time"),
-            ],
-        ]
-        table = Table(followup_data, colWidths=[40, 240, 80, 80])
-        table.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
-                    ("TEXTCOLOR", (0, 0), (-1, 0), colors.darkblue),
-                    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-                    ("BACKGROUND", (0, 1), (-1, -1), colors.lightgrey),
-                    ("GRID", (0, 0), (-1, -1), 1, colors.lightgrey),
-                ]
-            )
-        )
-        elements.append(table)
-    else:
-        elements.append(Paragraph("No followups scheduled up next", address_style))
-    d = Drawing(150, 10)
-    d.add(Line(0, 5, 100, 5, strokeColor=colors.black, strokeWidth=1))
-
-    # Add the text below the line
-    elements.append(Spacer(1, 100))
-    elements.append(Spacer(400, 1))
-    elements.append(d)
-    elements.append(Paragraph("<b>Doctor's Signature</b>", body_style))
+    return {
+        "followup_and_personal_data": {"personal": personal, "followup": followup},
+        "prescriptions": prescriptions,
+    }
 
-    # Build PDF
-    pdf.build(elements)
 
+def iter_prescription_pdf_inputs(sittings):
+    """
+    PDF inputs for each of [(complaint_id, sitting)], in order, in three
+    queries however many sittings: complaints with patient and details, their
+    followups, then the sittings' prescriptions. Sittings that no longer exist
+    are skipped.
+    """
+    sittings = [
+        (uuid.UUID(str(complaint_id)), sitting) for complaint_id, sitting in sittings
+    ]
+    complaint_ids = {complaint_id for complaint_id, _ in sittings}
+    complaints = {
+        complaint.id: complaint
+        for complaint in models.Complaint.objects.select_related(
+            "user", "user__details"
+        ).filter(id__in=complaint_ids)
+    }
+    followups = {
+        (followup["complaint_id"], followup["number"]): followup
+        for followup in models.FollowUp.objects.filter(
+            complaint_id__in=complaint_ids
+        ).values("complaint_id", "number", "title", "date", "time")
+    }
+    wanted = set(sittings)
+    prescriptions = {}
+    for prescription in sitting_prescriptions_of(
+        complaint_ids, {sitting for _, sitting in sittings}
+    ):
+        key = (prescription["complaint"], prescription["sitting"])
+        if key in wanted:
+            prescriptions.setdefault(key, []).append(prescription)
+
+    for complaint_id, sitting in sittings:
+        complaint = complaints.get(complaint_id)
+        if complaint is None:
+            continue
+        if sitting:
+            current = followups.get((complaint_id, sitting))
+            if current is None:
+                continue
+            current_date = current["date"]
+        else:
+            current_date = complaint.date
+        yield prescription_pdf_inputs(
+            complaint,
+            sitting,
+            current_date,
+            followups.get((complaint_id, sitting + 1)),
+            prescriptions.get((complaint_id, sitting), []),
+        )
 
-def create_divider(width=500, height=1, color=colors.black):
-    d = Drawing(width, height)
-    d.add(Line(0, height / 2, width, height / 2, strokeColor=color, strokeWidth=1))
-    return d
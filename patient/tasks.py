@@ -0,0 +1,17 @@
+from celery import shared_task
+
+from . import pdf_cache
+
+
+@shared_task(ignore_result=True)
+def render_prescription_pdf(key, followup_and_personal_data, prescriptions):
+    """
+    Render a prescription into the PDF cache off the request, routed to the
+    "pdf" queue (CELERY_TASK_ROUTES). Progress is read back from the cache
+    with `pdf_cache.job_status`, so no result backend is needed
+    """
+    try:
+        pdf_cache.store(key, followup_and_personal_data, prescriptions).close()
+    except Exception as error:
+        pdf_cache.mark_failed(key, error)
+        raise
@@ -1,3 +1,506 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from pypdf import PdfReader
+
+from authentication import jsonwebtokens
+from authentication import services as auth_services
+from authentication.models import User
+from doctor.models import Prescription, Treatment
+from . import models, pdf, pdf_cache, services, utils
+
+
+class PatientHistoryTests(TestCase):
+    def setUp(self):
+        self.patient = User.objects.create(
+            name="John Doe", phonenumber=7880589921, role="patient"
+        )
+        models.Details.objects.create(
+            id=self.patient, date_of_birth=datetime.date(1990, 2, 14), address="x"
+        )
+        self.treatment = Treatment.objects.create(name="RCT", price=1000)
+        self.prescription = Prescription.objects.create(
+            name="Zerodol SP", type="Medication"
+        )
+
+    def add_complaints(self, count):
+        for index in range(count):
+            complaint = models.Complaint.objects.create(
+                user=self.patient, complaint=f"tooth-ache {index}"
+            )
+            for number in (2, 1):
+                models.FollowUp.objects.create(
+                    complaint=complaint,
+                    date=datetime.date(2025, 1, 1),
+                    title=f"sitting {number}",
+                    number=number,
+                )
+            models.Diagnosis.objects.create(
+                complaint=complaint, tooth_number=44, treatment=self.treatment
+            )
+            models.Bill.objects.create(complaint=complaint, full_bill=500, discount=0)
+            models.PatientPrescription.objects.create(
+                complaint=complaint,
+                sitting=1,
+                prescription=self.prescription,
+                days=3,
+                dosage="OD",
+            )
+
+    def test_history_query_count_is_constant(self):
+        """
+        1. Patient with one complaint
+        2. Patient with 30 complaints takes the same number of queries
+        3. Summaries add a single query for diagnoses
+        """
+        # 1. one complaint
+        self.add_complaints(1)
+        with self.assertNumQueries(3):
+            history, error = services.fetch_complaint_and_followup_history(
+                self.patient.id
+            )
+        self.assertIsNone(error)
+        self.assertEqual(len(history), 1)
+
+        # 2. 30 complaints
+        self.add_complaints(29)
+        with self.assertNumQueries(3):
+            history, error = services.fetch_complaint_and_followup_history(
+                self.patient.id
+            )
+        self.assertEqual(len(history), 30)
+        followups = list(history[0].values())[0]["followups"]
+        self.assertEqual([followup["number"] for followup in followups], [1, 2])
+
+        # 3. with diagnosis and bill summaries
+        with self.assertNumQueries(4):
+            history, error = services.fetch_complaint_and_followup_history(
+                self.patient.id, include_summaries=True
+            )
+        summary = list(history[0].values())[0]
+        self.assertEqual(summary["diagnosis"][0]["treatment_name"], "RCT")
+        self.assertEqual(summary["bill"], {"full_bill": 500, "discount": 0})
+
+    def test_chart_query_count_is_constant(self):
+        """
+        1. Every section for a patient with 50 complaints in 4 queries
+        2. Only details and medical details in 1 query
+        """
+        self.add_complaints(50)
+        sections = {"details", "medical_details", "history", "bills", "prescriptions"}
+
+        # 1. full chart
+        with self.assertNumQueries(4):
+            chart, error = services.fetch_patient_chart(self.patient.id, sections)
+        self.assertIsNone(error)
+        self.assertEqual(len(chart["history"]), 50)
+        self.assertEqual(len(chart["bills"]), 50)
+        complaint_prescriptions = list(chart["prescriptions"].values())[0]
+        self.assertEqual(complaint_prescriptions[1][0]["prescription_name"], "Zerodol SP")
+
+        # 2. sparse chart
+        with self.assertNumQueries(1):
+            chart, error = services.fetch_patient_chart(
+                self.patient.id, {"details", "medical_details"}
+            )
+        self.assertEqual(set(chart), {"details", "medical_details"})
+
+    def test_chart_fields(self):
+        """
+        1. Spaces and empty entries in ?fields= are ignored
+        2. Only empty entries: every section the role may see
+        3. A section the role may not see: 400 BAD REQUEST
+        """
+        token = jsonwebtokens.create_jwt(
+            role="admin", phonenumber=7880589000, name="Admin"
+        )
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        url = f"/p/chart/{self.patient.id}/"
+
+        # 1. spaces, empty entries
+        response = self.client.get(url, {"fields": " details, ,"}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["chart"]), {"details"})
+
+        # 2. nothing asked for
+        response = self.client.get(url, {"fields": ","}, headers=headers)
+        self.assertEqual(set(response.json()["chart"]), {"details", "history"})
+
+        # 3. not allowed
+        response = self.client.get(url, {"fields": "details,bills"}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Can't fetch bills")
+
+    def test_prescription_pdf_inputs_query_count(self):
+        """
+        1. Followup with a next followup and prescriptions in 2 queries
+        2. Last followup has no next followup
+        3. Followup that doesn't exist stops after 1 query
+        """
+        self.add_complaints(1)
+        complaint = models.Complaint.objects.get()
+
+        # 1. sitting 1, followed by sitting 2
+        with self.assertNumQueries(2):
+            inputs, error = services.fetch_prescription_pdf_inputs(complaint.id, 1)
+        self.assertIsNone(error)
+        data = inputs["followup_and_personal_data"]
+        self.assertEqual(data["personal"]["name"], "John Doe")
+        self.assertEqual(data["personal"]["current_date"], datetime.date(2025, 1, 1))
+        self.assertEqual(data["followup"]["followup"], "sitting 2")
+        self.assertEqual(inputs["prescriptions"][0]["prescription_name"], "Zerodol SP")
+
+        # 2. last sitting
+        with self.assertNumQueries(2):
+            inputs, error = services.fetch_prescription_pdf_inputs(complaint.id, 2)
+        self.assertEqual(inputs["followup_and_personal_data"]["followup"], {})
+
+        # 3. no such sitting
+        with self.assertNumQueries(1):
+            inputs, error = services.fetch_prescription_pdf_inputs(complaint.id, 3)
+        self.assertEqual(error, "Invalid followup, no prescription found")
+
+    def test_day_export_query_count_is_constant(self):
+        """
+        1. Every sitting of one complaint in 3 queries
+        2. Every sitting of 10 complaints in the same 3, with the same inputs as
+        fetching them one at a time
+        """
+        # 1. one complaint
+        self.add_complaints(1)
+        sittings = [
+            (complaint.id, sitting)
+            for complaint in models.Complaint.objects.all()
+            for sitting in (0, 1, 2)
+        ]
+        with self.assertNumQueries(3):
+            inputs = list(services.iter_prescription_pdf_inputs(sittings))
+        self.assertEqual(len(inputs), 3)
+
+        # 2. ten complaints
+        self.add_complaints(9)
+        sittings = [
+            (complaint.id, sitting)
+            for complaint in models.Complaint.objects.all()
+            for sitting in (0, 1, 2)
+        ]
+        with self.assertNumQueries(3):
+            inputs = list(services.iter_prescription_pdf_inputs(sittings))
+        self.assertEqual(
+            inputs,
+            [
+                services.fetch_prescription_pdf_inputs(complaint_id, sitting)[0]
+                for complaint_id, sitting in sittings
+            ],
+        )
+
+    @override_settings(PDF_EXPORT_WORKERS=2, PDF_EXPORT_CHUNK=2)
+    def test_day_export_is_merged_in_order(self):
+        self.add_complaints(5)
+        sittings = [
+            (complaint.id, 0)
+            for complaint in models.Complaint.objects.order_by("complaint")
+        ]
+        inputs = list(services.iter_prescription_pdf_inputs(sittings))
+        pdf.export_pool.cache_clear()
+        self.addCleanup(pdf.export_pool.cache_clear)
+        self.addCleanup(lambda: pdf.export_pool().shutdown())
+        output = io.BytesIO()
+        pdf.render_day(output, inputs)
+        pages = PdfReader(output).pages
+        self.assertEqual(len(pages), 5)
+        for index, page in enumerate(pages):
+            self.assertIn(f"tooth-ache {index}", page.extract_text())
+
+    def test_history_of_unknown_patient(self):
+        history, error = services.fetch_complaint_and_followup_history(
+            "1002931f-d1b3-4408-9147-2e3432c67cc2"
+        )
+        self.assertIsNone(history)
+        self.assertEqual(error, "This patient does not exist")
+
+
+class TokenUserTests(TestCase):
+    def setUp(self):
+        auth_services.token_users.clear()
+        self.patient = User.objects.create(
+            name="John Doe", phonenumber=7880589921, role="patient"
+        )
+        models.Details.objects.create(
+            id=self.patient,
+            date_of_birth=datetime.date(1990, 2, 14),
+            address="x",
+            allergies="pollen",
+        )
+
+    def get(self, url, **claims):
+        token = jsonwebtokens.create_jwt(
+            role="patient", phonenumber=7880589921, name="John Doe", **claims
+        )
+        return self.client.get(
+            url,
+            headers={"Authorization": f"Bearer {token}", "Accept": "application/json"},
+        )
+
+    def test_patient_endpoints_resolve_user_by_id(self):
+        """
+        1. Token with user id: 1 query (was 2 for details), then cached
+        2. Saving details drops the cached user
+        3. Older token without user id still works
+        """
+        # 1. user id in token
+        with self.assertNumQueries(1):
+            response = self.get("/p/details/", user_id=self.patient.id)
+        self.assertEqual(response.json()["name"], "John Doe")
+        with self.assertNumQueries(0):
+            response = self.get("/p/medical_details/", user_id=self.patient.id)
+        self.assertEqual(response.json()["medical_details"]["allergies"], ["pollen"])
+
+        # 2. invalidation
+        self.patient.details.allergies = "peanuts"
+        self.patient.details.save()
+        with self.assertNumQueries(1):
+            response = self.get("/p/medical_details/", user_id=self.patient.id)
+        self.assertEqual(response.json()["medical_details"]["allergies"], ["peanuts"])
+
+        # 3. old token
+        with self.assertNumQueries(1):
+            response = self.get("/p/details/")
+        self.assertEqual(response.status_code, 200)
+
+
+class PatientListingTests(TestCase):
+    def setUp(self):
+        for index, name in enumerate(("Anil Rao", "Anil Rao", "Bela Shah")):
+            patient = User.objects.create(
+                name=name, phonenumber=7880589921 + index, role="patient"
+            )
+            models.Details.objects.create(
+                id=patient, date_of_birth=datetime.date(1990, 2, 14), address="x"
+            )
+        token = jsonwebtokens.create_jwt(
+            role="dentist", phonenumber=7880589000, name="Dentist"
+        )
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+
+    def test_pages_follow_the_cursor(self):
+        """
+        1. Pages of 2 cover every patient once, in (name, id) order
+        2. Cursors that aren't [name, id] are rejected
+        """
+        # 1. paging
+        listed, cursor = [], None
+        while True:
+            params = {"page_size": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get("/p/", params, headers=self.headers)
+            listed += response.json()["patients"]
+            cursor = response.json()["next"]
+            if not cursor:
+                break
+        self.assertEqual(
+            [(patient["name"], patient["phonenumber"]) for patient in listed],
+            [
+                (patient.name, patient.phonenumber)
+                for patient in User.objects.order_by("name", "id")
+            ],
+        )
+
+        # 2. tampered cursors
+        for cursor in (
+            "not-a-cursor",
+            utils.encode_cursor("Anil Rao"),
+            utils.encode_cursor(1, str(User.objects.first().id)),
+            utils.encode_cursor("Anil Rao", "not-a-uuid"),
+        ):
+            response = self.client.get("/p/", {"cursor": cursor}, headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+
+
+class PhonenumberAutocompleteTests(TestCase):
+    def setUp(self):
+        self.patients = []
+        for index in range(5):
+            patient = User.objects.create(
+                name=f"Patient {index}",
+                phonenumber=7880589920 + index,
+                role="patient",
+            )
+            models.Details.objects.create(
+                id=patient, date_of_birth=datetime.date(1990, 2, 14), address="x"
+            )
+            self.patients.append(patient)
+        token = jsonwebtokens.create_jwt(
+            role="dentist", phonenumber=7880589000, name="Dentist"
+        )
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+
+    def test_pages_of_matching_patients(self):
+        """
+        1. Only patients whose phonenumber starts with the prefix
+        2. `limit` per page
+        3. Following the cursor gives each of them once, in phonenumber order
+        """
+        other = User.objects.create(
+            name="Other", phonenumber=9880589920, role="patient"
+        )
+        models.Details.objects.create(
+            id=other, date_of_birth=datetime.date(1990, 2, 14), address="x"
+        )
+
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get(
+                "/p/autocomplete/phonenumber/78805899/", params, headers=self.headers
+            )
+            self.assertEqual(response.status_code, 200)
+            pages.append(
+                [patient["phonenumber"] for patient in response.json()["patients"]]
+            )
+            cursor = response.json()["next"]
+            if not cursor:
+                break
+
+        # 1. prefix, 2. page size
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        # 3. no duplicates or gaps
+        self.assertEqual(
+            [phonenumber for page in pages for phonenumber in page],
+            [patient.phonenumber for patient in self.patients],
+        )
+
+
+    def test_tampered_cursor(self):
+        """
+        Cursors that aren't [phonenumber, id] are rejected, not sent to the ORM
+        """
+        for cursor in (
+            "not-a-cursor",
+            utils.encode_cursor(7880589921),
+            utils.encode_cursor("7880589921", str(self.patients[0].id)),
+            utils.encode_cursor(7880589921, "not-a-uuid"),
+        ):
+            response = self.client.get(
+                "/p/autocomplete/phonenumber/788/",
+                {"cursor": cursor},
+                headers=self.headers,
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_invalid_prefix(self):
+        """
+        Too short, too long, not starting with 6-9, or with digits other than
+        0-9 (superscripts, other scripts): 400 rather than reaching the query
+        """
+        for prefix in ("78", "7880589921", "5880", "78²", "٧٨٨", "78a"):
+            response = self.client.get(
+                f"/p/autocomplete/phonenumber/{prefix}/", headers=self.headers
+            )
+            self.assertEqual(response.status_code, 400, prefix)
+
+
+class PrescriptionPdfJobTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        self.enterContext(override_settings(PDF_CACHE_DIR=self.cache_dir))
+        token = jsonwebtokens.create_jwt(
+            role="dentist", phonenumber=7880589000, name="Dentist"
+        )
+        self.headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+        }
+
+    def test_job_status(self):
+        """
+        1. A job nobody queued: 404 NOT FOUND
+        2. Queued: pending
+        3. A failed render leaves no temporary file behind
+        """
+        key = "ab" * 32
+
+        # 1. unknown
+        response = self.client.get(
+            f"/p/prescription/pdf/jobs/{key}/", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 404)
+
+        # 2. queued
+        pdf_cache.mark_queued(key)
+        response = self.client.get(
+            f"/p/prescription/pdf/jobs/{key}/", headers=self.headers
+        )
+        self.assertEqual(response.json()["state"], "pending")
+
+        # 3. failed render
+        with mock.patch.object(
+            pdf_cache.pdf, "render_prescription", side_effect=ValueError("bad")
+        ):
+            with self.assertRaises(ValueError):
+                pdf_cache.store(key, {}, [])
+        leftovers = [
+            name
+            for _, _, names in os.walk(self.cache_dir)
+            for name in names
+            if name.endswith(".tmp")
+        ]
+        self.assertEqual(leftovers, [])
+
+
+class NameSearchTests(TestCase):
+    def setUp(self):
+        # TrigramSimilarity and the trigram lookups are Postgres (pg_trgm) only
+        if connection.vendor != "postgresql":
+            self.skipTest("Name search needs Postgres")
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError:
+            self.skipTest("pg_trgm isn't available")
+        for index, name in enumerate(("John Doe", "Johnny Dawson", "Jane Smith")):
+            patient = User.objects.create(
+                name=name, phonenumber=7880589921 + index, role="patient"
+            )
+            models.Details.objects.create(
+                id=patient, date_of_birth=datetime.date(1990, 2, 14), address="x"
+            )
+
+    def test_ranking_and_typos(self):
+        """
+        1. Closest name first, whatever the case and spacing, unrelated names
+        left out
+        2. Part of a name matches
+        3. A misspelt name still finds the patient
+        4. Nothing close: error
+        """
+        # 1. ranking
+        patients, error = services.fetch_patients_with_name("  JOHN   doe ")
+        self.assertIsNone(error)
+        self.assertEqual(patients[0]["name"], "John Doe")
+        self.assertNotIn("Jane Smith", [patient["name"] for patient in patients])
+
+        # 2. substring
+        patients, _ = services.fetch_patients_with_name("smith")
+        self.assertEqual([patient["name"] for patient in patients], ["Jane Smith"])
+
+        # 3. typo
+        patients, _ = services.fetch_patients_with_name("jhon doe")
+        self.assertEqual(patients[0]["name"], "John Doe")
+
+        # 4. no match
+        patients, error = services.fetch_patients_with_name("zzzz")
+        self.assertIsNone(patients)
+        self.assertEqual(error, "No patients found with name: zzzz")
@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path("", views.patients),
     path("details/", views.details),
     path("medical_details/", views.medical_details),
     path("medical_details/<int:phonenumber>/<str:name>/", views.medical_details),
@@ -16,9 +17,21 @@ urlpatterns = [
     path("prescription/<uuid:complaint_id>/<int:sitting>/", views.prescription),
     path("prescription/delete/<uuid:patient_prescription_id>/", views.prescription),
     path("prescription/pdf/<uuid:complaint_id>/<int:sitting>/", views.pdf_prescription),
+    path(
+        "prescription/pdf/<uuid:complaint_id>/<int:sitting>/job/",
+        views.pdf_prescription_job,
+    ),
+    path("prescription/pdf/day/<str:date>/", views.pdf_prescriptions_by_date),
+    path("prescription/pdf/jobs/<str:job>/", views.pdf_prescription_job_status),
+    path(
+        "prescription/pdf/jobs/<str:job>/download/",
+        views.pdf_prescription_job_download,
+    ),
     path("bill/", views.bills),
     path("bill/<uuid:complaint_id>/", views.bills),
     path("history/<uuid:patient_id>/", views.patient_history),
+    path("chart/<uuid:patient_id>/", views.patient_chart),
+    path("autocomplete/phonenumber/<str:prefix>/", views.autocomplete_phonenumber),
     path("<int:phonenumber>/", views.patients),
     path("<str:name>/", views.patients),
     path("<int:phonenumber>/<str:name>/", views.patients),
@@ -1,5 +1,49 @@
-from datetime import datetime
+import base64
+import json
+import uuid
+from datetime import datetime, time, timedelta
+from django.utils import timezone
 
 
 def get_age(birth_date):
     return datetime.now().year - birth_date.year
+
+
+def day_range(date):
+    """
+    [start, end) of a local calendar day as aware datetimes, for range
+    filters on timestamp columns
+    """
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    return start, start + timedelta(days=1)
+
+
+def encode_cursor(*values):
+    """
+    Opaque keyset cursor holding the sort key of the last row on a page
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, *types):
+    """
+    Returns the values in the cursor, one of each of `types` (str, int or
+    uuid.UUID), or None if it was tampered with
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != len(types):
+        return None
+    decoded = []
+    for value, kind in zip(values, types):
+        if kind is uuid.UUID:
+            try:
+                value = uuid.UUID(value)
+            except (TypeError, ValueError, AttributeError):
+                return None
+        elif type(value) is not kind:
+            return None
+        decoded.append(value)
+    return decoded
@@ -1,21 +1,30 @@
 import datetime
+import json
+import re
+import tempfile
+import uuid
 
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import IntegrityError
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
 from rest_framework import permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
-import authentication.jsonwebtokens as jsonwebtokens
 import authentication.validation as validation
+from authentication.authorization import authorize, role_required
 from authentication import models as auth
+from authentication import services as auth_services
 
-from . import models, serializers, services, utils
+from . import models, pdf, pdf_cache, serializers, services, tasks, utils
 from .serializers import ComplaintSerializer, DetailsSerializer
 
 
 @api_view(["GET"])
 @permission_classes((permissions.AllowAny,))
+@role_required("admin", "dentist")
 def patients(request, phonenumber=None, name=None):
     """
     --------HERE NAME IN THE PATH SHOULD BE IN LOWERCASE-SNAKECASE--------
@@ -23,17 +32,11 @@ def patients(request, phonenumber=None, name=None):
     1. Name and Phonenumber
     2. Name
     3. Phonenumber
+    4. Neither: all patients, ordered by name
+        - ?page_size=<int> patients per page (default 50, max 500)
+        - ?cursor=<next from previous page> for the next page
+        - ?stream=ndjson streams every patient, one JSON object per line
     """
-    # Make sure user is admin or doctor
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["admin", "dentist"])
-    )
-    if error:
-        return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
-        )
-
     if request.method == "GET":
         # Convert data to proper format
         if phonenumber:
@@ -59,28 +62,83 @@ def patients(request, phonenumber=None, name=None):
         elif name:
             patients, no_match_error = services.fetch_patients_with_name(name)
         else:
-            return Response(
-                {"error": "Provide atleast name or phonenumber to search"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+            return list_patients(request)
         if no_match_error:
             return Response({"error": no_match_error}, status=status.HTTP_200_OK)
         return Response({"patients": patients}, status=status.HTTP_200_OK)
 
-    # JWT authentication
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["dentist", "admin"])
+
+def list_patients(request):
+    """
+    All patients, a page at a time (or streamed as NDJSON)
+    """
+    if request.query_params.get("stream") == "ndjson":
+        return StreamingHttpResponse(
+            services.stream_all_patients(), content_type="application/x-ndjson"
+        )
+
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        cursor = utils.decode_cursor(cursor, str, uuid.UUID)
+        if not cursor:
+            return Response(
+                {"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+            )
+    try:
+        page_size = min(int(request.query_params.get("page_size", 50)), 500)
+    except ValueError:
+        page_size = 50
+
+    patients, next_cursor = services.fetch_patients_page(max(page_size, 1), cursor)
+    return Response(
+        {"patients": patients, "next": next_cursor}, status=status.HTTP_200_OK
     )
-    if error:
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+@role_required("admin", "dentist")
+def autocomplete_phonenumber(request, prefix=None):
+    """
+    Patients whose phonenumber starts with the 3-9 digits typed so far
+    - ?limit=<int> patients per page (default 10, max 50)
+    - ?cursor=<next from previous page> for the next page
+    1. Invalid prefix: 400 BAD REQUEST
+    2. Invalid cursor: 400 BAD REQUEST
+    3. Success: 200 OK
+    """
+    if request.method == "GET":
+        # Only 0-9, isdigit() would let "²" or other scripts' digits through
+        if not re.fullmatch(r"[0-9]{3,9}", prefix):
+            return Response(
+                {"error": "Type between 3 and 9 digits of the phonenumber"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if prefix[0] not in "6789":
+            return Response(
+                {"error": "Phonenumber should start with 6, 7, 8, 9"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            cursor = utils.decode_cursor(cursor, int, uuid.UUID)
+            if not cursor:
+                return Response(
+                    {"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST
+                )
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            limit = 10
+
+        patients, next_cursor = services.autocomplete_patients_with_phone(
+            prefix, max(limit, 1), cursor
+        )
         return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
+            {"patients": patients, "next": next_cursor}, status=status.HTTP_200_OK
         )
 
-    # Fetch all patients
-    all_patients = models.Details.objects.all().values_list()
-    return Response({"patients": all_patients}, status=status.HTTP_200_OK)
-
 
 @api_view(["GET", "POST"])
 @permission_classes((permissions.AllowAny,))
@@ -102,9 +160,7 @@ def details(request):
         Returns patient details. Requires Authorization header with admin role.
     """
     if request.method == "POST":
-        token, error = jsonwebtokens.is_authorized(
-            request.headers["Authorization"].split(" ")[1], set(["admin"])
-        )
+        token, error = authorize(request, set(["admin"]))
         if error:
             return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -148,39 +204,31 @@ def details(request):
         )
 
     elif request.method == "GET":
-        try:
-            token = request.headers["Authorization"].split(" ")[1]
-        except (KeyError, IndexError):
-            return Response({"error": "Authorization token missing"}, status=401)
-
-        payload, error = jsonwebtokens.is_authorized(token, set(["patient"]))
+        payload, error = authorize(request, set(["patient"]))
         if error:
             return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
 
-        if "phonenumber" not in payload:
-            return Response({"error": "Phone number not found in token"}, status=400)
-
+        user, error = auth_services.fetch_token_user(payload)
+        if error:
+            return Response({"error": error}, status=404)
         try:
-            user = auth.User.objects.get(phonenumber=payload["phonenumber"])
-            details = models.Details.objects.get(id=user)
-            serialized = DetailsSerializer(details)
-            return Response(
-                {
-                    "phonenumber": user.phonenumber,
-                    "name": user.name,
-                    "role": user.role,
-                    "details": serialized.data,
-                },
-                status=200,
-            )
-        except auth.User.DoesNotExist:
-            return Response({"error": "User not found"}, status=404)
+            serialized = DetailsSerializer(user.details)
         except models.Details.DoesNotExist:
             return Response({"error": "User details not found"}, status=404)
+        return Response(
+            {
+                "phonenumber": user.phonenumber,
+                "name": user.name,
+                "role": user.role,
+                "details": serialized.data,
+            },
+            status=200,
+        )
 
 
 @api_view(["GET", "POST"])
 @permission_classes((permissions.AllowAny,))
+@role_required("admin", "dentist")
 def complaints(request):
     """
     GET REQUEST:
@@ -224,36 +272,9 @@ def complaints(request):
 
 
     """
-    # Make sure user is admin or dentist
-    token, error = jsonwebtokens.is_authorized(
-        request.headers["Authorization"].split(" ")[1], set(["admin", "dentist"])
-    )
-    if error:
-        return Response(
-            {"error": error},
-            status=status.HTTP_401_UNAUTHORIZED,
-        )
-
     if request.method == "GET":
         # Fetch active patients
-        all_complaints = models.Complaint.objects.select_related(
-            "user", "user__details"
-        ).filter(date=datetime.datetime.now().date())
-
-        complaints = []
-        for complaint in all_complaints:
-            complaints.append(
-                {
-                    "id": complaint.id,
-                    "patient_id": complaint.user.id,
-                    "name": complaint.user.name,
-                    "age": utils.get_age(complaint.user.details.date_of_birth),
-                    "phonenumber": complaint.user.phonenumber,
-                    "time": complaint.time,
-                    "complaint": complaint.complaint,
-                }
-            )
-
+        complaints = services.fetch_complaints_by_date(datetime.datetime.now().date())
         return Response({"complaints": complaints}, status=status.HTTP_200_OK)
 
     if request.method == "POST":
@@ -324,10 +345,7 @@ def diagnosis(request, complaint_id=None, id=None):
     4. DELETE: deleting diagnosis for a tooth
     """
     if request.method == "GET":
-        token, error = jsonwebtokens.is_authorized(
-            request.headers.get("Authorization").split(" ")[1],
-            set(["dentist"]),
-        )
+        token, error = authorize(request, set(["dentist"]))
         if error:
             return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
     if request.method == "GET":
@@ -410,10 +428,7 @@ def followups(request, complaint_id=None, date=None):
     }
     """
     if request.method == "GET":
-        token, error = jsonwebtokens.is_authorized(
-            request.headers.get("Authorization").split(" ")[1],
-            set(["dentist", "admin"]),
-        )
+        token, error = authorize(request, set(["dentist", "admin"]))
         if error:
             return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -437,10 +452,7 @@ def followups(request, complaint_id=None, date=None):
         return Response({"followups": today_followups}, status=status.HTTP_200_OK)
 
     # FOR POST AND PUT you need to be dentist
-    token, error = jsonwebtokens.is_authorized(
-        request.headers.get("Authorization").split(" ")[1],
-        set(["dentist"]),
-    )
+    token, error = authorize(request, set(["dentist"]))
     if error:
         return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -512,12 +524,8 @@ def medical_details(request, name=None, phonenumber=None):
     """
     if request.method == "GET":
         # Case when doctor is viewing patient's medical_details
-        data = {}  # Empty init for scope adjustment
         if phonenumber and name:
-            token, error = jsonwebtokens.is_authorized(
-                request.headers.get("Authorization").split(" ")[1],
-                set(["dentist"]),
-            )
+            token, error = authorize(request, set(["dentist"]))
             if error:
                 return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -528,31 +536,34 @@ def medical_details(request, name=None, phonenumber=None):
             if error:
                 return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Case when patient is viewing their own medical_details
-        else:
-            # Here we are only interested in getting token, not authorization
-            token, error = jsonwebtokens.is_authorized(
-                request.headers.get("Authorization").split(" ")[1],
-            )
-            data, error = services.serialize_identity(
-                {"name": token.get("name"), "phonenumber": token.get("phonenumber")}
+            medical_details, error = services.fetch_medical_details(
+                data["name"],
+                data["phonenumber"],
             )
             if error:
-                return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
+            return Response(
+                {"medical_details": medical_details}, status=status.HTTP_200_OK
+            )
 
-        medical_details, error = services.fetch_medical_details(
-            data["name"],
-            data["phonenumber"],
-        )
+        # Case when patient is viewing their own medical_details
+        # Here we are only interested in getting token, not authorization
+        token, error = authorize(request)
+        if error:
+            return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
+        user, error = auth_services.fetch_token_user(token)
         if error:
             return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            medical_details = services.format_medical_details(user.details)
+        except models.Details.DoesNotExist:
+            return Response(
+                {"error": "User not found"}, status=status.HTTP_404_NOT_FOUND
+            )
         return Response({"medical_details": medical_details}, status=status.HTTP_200_OK)
 
     if request.method == "POST":
-        token, error = jsonwebtokens.is_authorized(
-            request.headers.get("Authorization").split(" ")[1],
-            set(["dentist"]),
-        )
+        token, error = authorize(request, set(["dentist"]))
         if error:
             return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -572,16 +583,12 @@ def medical_details(request, name=None, phonenumber=None):
 
 @api_view(["GET", "POST"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist", "admin")
 def patient_history(request, patient_id=None):
     """
     Get list of all complaints and followups for a particular patient
+    - ?summary=true also includes each complaint's diagnoses and bill
     """
-    token, error = jsonwebtokens.is_authorized(
-        request.headers.get("Authorization").split(" ")[1],
-        set(["dentist", "admin"]),
-    )
-    if error:
-        return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
     if request.method == "GET":
         if not patient_id:
             return Response(
@@ -589,15 +596,55 @@ def patient_history(request, patient_id=None):
                 status=status.HTTP_404_NOT_FOUND,
             )
         patient_history, error = services.fetch_complaint_and_followup_history(
-            patient_id
+            patient_id,
+            include_summaries=request.query_params.get("summary") == "true",
         )
         if error:
             return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
         return Response({"history": patient_history}, status=status.HTTP_200_OK)
 
 
+# Sections of the chart each role may see, mirrors the single-purpose endpoints
+CHART_SECTIONS = {
+    "dentist": {"details", "medical_details", "history", "bills", "prescriptions"},
+    "admin": {"details", "history"},
+}
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+@role_required(*CHART_SECTIONS)
+def patient_chart(request, patient_id=None):
+    """
+    Whole chart of a patient in one request
+    - ?fields=details,medical_details,history,bills,prescriptions to only
+      fetch some sections (default: every section the role may see)
+    1. Section not allowed/unknown: 400 BAD REQUEST
+    2. Patient not found: 404 NOT FOUND
+    3. Success: 200 OK
+    """
+    if request.method == "GET":
+        allowed_sections = CHART_SECTIONS[request.auth.get("role")]
+        # "details, history," is details and history, "," the same as no fields
+        fields = request.query_params.get("fields", "").split(",")
+        sections = {field.strip() for field in fields if field.strip()}
+        if not sections:
+            sections = allowed_sections
+        elif not sections <= allowed_sections:
+            return Response(
+                {"error": f"Can't fetch {", ".join(sections - allowed_sections)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        chart, error = services.fetch_patient_chart(patient_id, sections)
+        if error:
+            return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"chart": chart}, status=status.HTTP_200_OK)
+
+
 @api_view(["GET", "POST", "PUT"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist")
 def bills(request, complaint_id=None):
     """
     1. GET: fetch bills for a complaint using complaint_id
@@ -617,14 +664,6 @@ def bills(request, complaint_id=None):
         "discount": 1000,
     }
     """
-
-    token, error = jsonwebtokens.is_authorized(
-        request.headers.get("Authorization").split(" ")[1],
-        set(["dentist"]),
-    )
-    if error:
-        return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
-
     if request.method == "GET":
         if not complaint_id:
             return Response(
@@ -672,6 +711,7 @@ def bills(request, complaint_id=None):
 
 @api_view(["GET", "POST", "PUT", "DELETE"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist")
 def prescription(
     request, patient_prescription_id=None, complaint_id=None, sitting=None
 ):
@@ -696,13 +736,6 @@ def prescription(
     }
     4. DELETE using user_prescription_id
     """
-    token, error = jsonwebtokens.is_authorized(
-        request.headers.get("Authorization").split(" ")[1],
-        set(["dentist"]),
-    )
-    if error:
-        return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
-
     if request.method == "GET":
         if not complaint_id or sitting is None:
             return Response(
@@ -759,43 +792,154 @@ def prescription(
         return Response({"success": f"Deleted prescription {name}!"})
 
 
+# Background PDF jobs are named by the digest of what they render
+PDF_JOB_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def cached_pdf_response(key, file):
+    response = FileResponse(
+        file, content_type="application/pdf", filename="prescription.pdf"
+    )
+    response["ETag"] = f'"{key}"'
+    return response
+
+
 @api_view(["GET"])
 @permission_classes((permissions.AllowAny,))
+@role_required("dentist")
 def pdf_prescription(request, complaint_id=None, sitting=None):
     """
     Generates a pdf prescription for a sitting
+    - cached on disk by content, sent with an ETag (304 when unchanged)
     """
-
-    token, error = jsonwebtokens.is_authorized(
-        request.headers.get("Authorization").split(" ")[1],
-        set(["dentist"]),
-    )
-    if error:
-        return Response({"error": error}, status=status.HTTP_401_UNAUTHORIZED)
-
     if request.method == "GET":
         if not complaint_id or sitting is None:
-            print("404 control here?")
             return Response(
                 {"error": "Couldn't print prescription"},
                 status=status.HTTP_404_NOT_FOUND,
             )
-        # get prescription data
-        prescriptions, error = services.fetch_patients_prescriptions(
-            complaint_id, sitting
-        )
+        inputs, error = services.fetch_prescription_pdf_inputs(complaint_id, sitting)
         if error:
             return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
 
-        # get next followup
-        followup_and_personal_data = (
-            services.fetch_followup_and_personal_data_for_prescription_pdf(
-                complaint_id, sitting
-            )
+        # Same inputs, same PDF: revalidate or serve the rendered file as is
+        key = pdf_cache.digest(**inputs)
+        etag = f'"{key}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return HttpResponseNotModified(headers={"ETag": etag})
+
+        return cached_pdf_response(key, pdf_cache.open_prescription(key, **inputs))
+
+
+@api_view(["POST"])
+@permission_classes((permissions.AllowAny,))
+@role_required("dentist")
+def pdf_prescription_job(request, complaint_id=None, sitting=None):
+    """
+    Render a sitting's prescription in the background (celery "pdf" queue)
+    1. Invalid complaint or followup: 404 NOT FOUND
+    2. Already rendered: 200 OK
+    3. Queued: 202 ACCEPTED, poll `status` then fetch `download`
+    """
+    if request.method == "POST":
+        inputs, error = services.fetch_prescription_pdf_inputs(complaint_id, sitting)
+        if error:
+            return Response({"error": error}, status=status.HTTP_404_NOT_FOUND)
+
+        # Plain JSON for the broker, dates and times print the same either way
+        inputs = json.loads(json.dumps(inputs, cls=DjangoJSONEncoder))
+        key = pdf_cache.digest(**inputs)
+        job = {
+            "job": key,
+            "status": f"/p/prescription/pdf/jobs/{key}/",
+            "download": f"/p/prescription/pdf/jobs/{key}/download/",
+        }
+        job_status, _ = pdf_cache.job_status(key)
+        if job_status == "ready":
+            return Response({**job, "state": job_status}, status=status.HTTP_200_OK)
+
+        # Don't queue the same render twice while it's waiting for a worker
+        if job_status == "failed" or cache.add(f"pdf-job:{key}", True, 60):
+            pdf_cache.clear_failure(key)
+            pdf_cache.mark_queued(key)
+            tasks.render_prescription_pdf.delay(key, **inputs)
+        return Response({**job, "state": "pending"}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+@role_required("dentist")
+def pdf_prescription_job_status(request, job=None):
+    """
+    1. Unknown job id (never queued, or expired): 404 NOT FOUND
+    2. Success: 200 OK, "state" is "pending", "ready" or "failed"
+    """
+    if request.method == "GET":
+        if not PDF_JOB_PATTERN.fullmatch(job):
+            return Response({"error": "Invalid job"}, status=status.HTTP_404_NOT_FOUND)
+        job_status, error = pdf_cache.job_status(job)
+        if job_status is None:
+            return Response({"error": "Unknown job"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"job": job, "state": job_status, "error": error},
+            status=status.HTTP_200_OK,
         )
 
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = 'inline; filename="prescription.pdf"'
 
-        services.create_pdf(response, followup_and_personal_data, prescriptions)
-        return response
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+@role_required("dentist")
+def pdf_prescription_job_download(request, job=None):
+    """
+    1. Unknown job id or not rendered yet: 404 NOT FOUND
+    2. Matching ETag: 304 NOT MODIFIED
+    3. Success: the PDF
+    """
+    if request.method == "GET":
+        file = pdf_cache.lookup(job) if PDF_JOB_PATTERN.fullmatch(job) else None
+        if file is None:
+            return Response(
+                {"error": "Prescription isn't ready"}, status=status.HTTP_404_NOT_FOUND
+            )
+        if f'"{job}"' in parse_etags(request.headers.get("If-None-Match", "")):
+            file.close()
+            return HttpResponseNotModified(headers={"ETag": f'"{job}"'})
+        return cached_pdf_response(job, file)
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+@role_required("dentist")
+def pdf_prescriptions_by_date(request, date=None):
+    """
+    Every prescription of a day (complaints registered and followups scheduled
+    on it) in one PDF, for printing at the end of the day
+    1. Invalid date: 400 BAD REQUEST
+    2. No sittings that day: 404 NOT FOUND
+    3. Success: the PDF
+    """
+    if request.method == "GET":
+        try:
+            day = datetime.date.fromisoformat(date)
+        except ValueError:
+            return Response(
+                {"error": "Date should be YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        sittings = services.fetch_sittings_by_date(day)
+        if not sittings:
+            return Response(
+                {"error": "No sittings on this date"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        # Rendered in parts across processes, merged to disk and streamed from
+        # there rather than held in memory
+        output = tempfile.TemporaryFile()
+        pdf.render_day(output, services.iter_prescription_pdf_inputs(sittings))
+        output.seek(0)
+        return FileResponse(
+            output,
+            content_type="application/pdf",
+            filename=f"prescriptions-{day}.pdf",
+        )
+